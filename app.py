@@ -1,10 +1,6 @@
 import os
-from functools import wraps
-from flask import Flask, jsonify, request, render_template, g, Response, send_from_directory
-import jwt
+from flask import Flask, jsonify, request, render_template, g, Response, send_from_directory, stream_with_context
 from dotenv import load_dotenv
-from bson import ObjectId
-import datetime
 
 # Load environment variables
 load_dotenv()
@@ -13,14 +9,18 @@ load_dotenv()
 from database import db_instance
 from services import (
     user_service, account_service, transaction_service,
-    auth_service, biller_service, chatbot_service, report_service
+    auth_service, biller_service, chatbot_service, report_service,
+    insights_service, counter_service, metrics, hot_accounts, import_service,
+    conversation_store, dashboard_service
 )
+from services.decorators import token_required, admin_required, revoke_token, auth_cache_stats, invalidate
 from services.seed_data import seed_initial_data # Import the new seeding function
 from services.reports_blueprint import reports_bp # Import reports blueprint
 
 # Initialize Flask App
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a-very-secure-and-long-secret-key-that-you-should-change')
+# One signing key for the whole app, loaded by auth_service
+app.config['SECRET_KEY'] = auth_service.SECRET_KEY
 # Load the Gemini API key from environment variables
 app.config['GEMINI_API_KEY'] = os.environ.get('GEMINI_API_KEY')
 
@@ -31,36 +31,6 @@ if not app.config['GEMINI_API_KEY']:
 # Register blueprints
 app.register_blueprint(reports_bp, url_prefix='/api/admin/reports')
 
-# --- Decorators for authentication (Included for completeness, logic assumed correct) ---
-def token_required(f):
-    """Decorator to require a valid JWT token."""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('x-access-token')
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        try:
-            # We use the key defined in app.config
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"]) 
-            g.current_user_id = data['user_id']
-            g.is_admin = data.get('is_admin', False)
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except Exception:
-            return jsonify({'message': 'Token is invalid!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-def admin_required(f):
-    """Decorator to require admin access."""
-    @wraps(f)
-    @token_required
-    def decorated(*args, **kwargs):
-        if not g.is_admin:
-            return jsonify({'message': 'Admin access required!'}), 403
-        return f(*args, **kwargs)
-    return decorated
-
 # --- Static File Serving and Root Route ---
 @app.route('/')
 def index():
@@ -95,6 +65,27 @@ def verify_login():
     response, status_code = auth_service.verify_login_code(data.get('user_id'), data.get('code'))
     return jsonify(response), status_code
 
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    """Exchange a refresh token for a new short-lived access token."""
+    data = request.get_json() or {}
+    response, status_code = auth_service.refresh_access_token(data.get('refresh_token'))
+    return jsonify(response), status_code
+
+@app.route('/api/logout', methods=['POST'])
+@token_required
+def logout():
+    """
+    Log the caller out: revoke their access token here and end the session
+    it belongs to, so its refresh token can no longer mint new access
+    tokens. The user's other sessions stay signed in. Also ends their
+    chatbot conversation.
+    """
+    revoke_token(request.headers.get('x-access-token'))
+    auth_service.end_session(g.current_user_id, g.session_id, is_admin=g.is_admin)
+    conversation_store.clear(g.current_user_id)
+    return jsonify({'message': 'Logged out'}), 200
+
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
     """Endpoint for admin login."""
@@ -106,7 +97,20 @@ def admin_login():
 @token_required
 def get_user_account():
     """Get the logged-in user's account details."""
-    response, status_code = account_service.get_account_by_user_id(g.current_user_id)
+    response, status_code = account_service.get_account_by_user_id(g.current_user_id, account=g.account)
+    return jsonify(response), status_code
+
+@app.route('/api/dashboard', methods=['GET'])
+@token_required
+def get_dashboard():
+    """
+    Get the logged-in user's account and recent transactions in one call
+    (?recent=N), plus ?include=profile,insights when wanted.
+    """
+    include = [name for name in request.args.get('include', '').split(',') if name]
+    response, status_code = dashboard_service.get_dashboard(
+        g.current_user_id, account=g.account, recent=request.args.get('recent'), include=include
+    )
     return jsonify(response), status_code
 
 @app.route('/api/profile', methods=['GET'])
@@ -119,8 +123,13 @@ def get_profile():
 @app.route('/api/transactions', methods=['GET'])
 @token_required
 def get_user_transactions():
-    """Get transactions for the logged-in user."""
-    response, status_code = transaction_service.get_transactions_by_user_id(g.current_user_id)
+    """Get one page of transactions for the logged-in user (keyset paginated)."""
+    response, status_code = transaction_service.get_transactions_by_user_id(
+        g.current_user_id,
+        limit=request.args.get('limit'),
+        cursor=request.args.get('cursor'),
+        account=g.account
+    )
     return jsonify(response), status_code
 
 @app.route('/api/transactions', methods=['POST'])
@@ -132,7 +141,20 @@ def create_transfer():
         from_user_id=g.current_user_id,
         to_account_number=data.get('to_account_number'),
         amount=data.get('amount'),
-        description=data.get('description')
+        description=data.get('description'),
+        account=g.account
+    )
+    return jsonify(response), status_code
+
+@app.route('/api/transactions/batch', methods=['POST'])
+@token_required
+def create_transfer_batch():
+    """Apply a list of transfers ({"transfers": [...]}) in one transaction, with per-item status."""
+    data = request.get_json() or {}
+    response, status_code = transaction_service.create_transfer_batch(
+        from_user_id=g.current_user_id,
+        transfers=data.get('transfers'),
+        account=g.account
     )
     return jsonify(response), status_code
 
@@ -151,7 +173,8 @@ def pay_bill():
     response, status_code = transaction_service.pay_bill(
         user_id=g.current_user_id,
         biller_id=data.get('biller_id'),
-        amount=data.get('amount')
+        amount=data.get('amount'),
+        account=g.account
     )
     return jsonify(response), status_code
 
@@ -162,7 +185,8 @@ def deposit_funds():
     data = request.get_json()
     response, status_code = account_service.deposit(
         user_id=g.current_user_id,
-        amount=data.get('amount')
+        amount=data.get('amount'),
+        account=g.account
     )
     return jsonify(response), status_code
 
@@ -173,15 +197,21 @@ def withdraw_funds():
     data = request.get_json()
     response, status_code = account_service.withdraw(
         user_id=g.current_user_id,
-        amount=data.get('amount')
+        amount=data.get('amount'),
+        account=g.account
     )
     return jsonify(response), status_code
 
 @app.route('/api/insights', methods=['GET'])
 @token_required
 def get_insights():
-    """Get user spending insights."""
-    response, status_code = transaction_service.get_spending_insights(g.current_user_id)
+    """Get user spending insights (optionally ?months=N or ?month=YYYY-MM)."""
+    response, status_code = transaction_service.get_spending_insights(
+        g.current_user_id,
+        months=request.args.get('months'),
+        month=request.args.get('month'),
+        account=g.account
+    )
     return jsonify(response), status_code
 
 @app.route('/api/chatbot', methods=['POST'])
@@ -190,9 +220,31 @@ def get_chatbot_response():
     """Get a response from the AI chatbot."""
     data = request.get_json()
     user_message = data.get('message')
-    api_key = app.config['GEMINI_API_KEY']
-    reply = chatbot_service.get_gemini_response(g.current_user_id, user_message, api_key)
-    return jsonify({'reply': reply}), 200
+    response = chatbot_service.get_chatbot_reply(g.current_user_id, user_message, account=g.account)
+    return jsonify(response), 200
+
+@app.route('/api/chatbot/history', methods=['DELETE'])
+@token_required
+def clear_chatbot_history():
+    """Start a new chatbot conversation, forgetting the current one."""
+    conversation_store.clear(g.current_user_id)
+    return jsonify({'message': 'Conversation cleared'}), 200
+
+@app.route('/api/chatbot/stream', methods=['POST'])
+@token_required
+def stream_chatbot_response():
+    """Stream the AI chatbot's reply as Server-Sent Events while it is generated."""
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({'message': 'Message is required'}), 400
+    stream = chatbot_service.stream_chatbot_reply(g.current_user_id, user_message, account=g.account)
+    return Response(
+        stream_with_context(stream),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # Admin Routes
 @app.route('/api/admin/stats', methods=['GET'])
@@ -225,6 +277,70 @@ def delete_user(user_id):
     response, status_code = user_service.delete_user(user_id)
     return jsonify(response), status_code
 
+@app.route('/api/admin/accounts/<account_number>/hot-mode', methods=['PUT'])
+@admin_required
+def set_account_hot_mode(account_number):
+    """Admin endpoint to shard incoming credits for a busy account ({"shards": N}, 0 disables)."""
+    data = request.get_json() or {}
+    response, status_code = hot_accounts.set_hot_mode(account_number, data.get('shards'))
+    return jsonify(response), status_code
+
+@app.route('/api/admin/imports/deposits', methods=['POST'])
+@admin_required
+def import_deposits():
+    """
+    Admin endpoint to bulk-load deposits from a CSV (account_number, amount, description).
+    Send it as a multipart 'file' field or as a raw text/csv body; pass
+    ?import_id=... with the same file to resume a failed import.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename = upload.stream, upload.filename
+    elif request.mimetype == 'text/csv':
+        stream, filename = request.stream, request.args.get('filename')
+    else:
+        return jsonify({'message': 'Upload a CSV file'}), 400
+    response, status_code = import_service.import_deposits(
+        stream, filename=filename, import_id=request.args.get('import_id')
+    )
+    return jsonify(response), status_code
+
+@app.route('/api/admin/imports/<import_id>', methods=['GET'])
+@admin_required
+def get_import_status(import_id):
+    """Admin endpoint reporting the progress of a deposit import."""
+    response, status_code = import_service.get_import(import_id)
+    return jsonify(response), status_code
+
+@app.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def get_admin_metrics():
+    """Admin endpoint exposing in-process metrics (e.g. ?prefix=transactions.)."""
+    snapshot = metrics.snapshot(prefix=request.args.get('prefix'))
+    snapshot['auth_cache'] = auth_cache_stats()
+    snapshot['chatbot_routing'] = chatbot_service.routing_stats()
+    return jsonify(snapshot), 200
+
+@app.route('/api/admin/auth-cache', methods=['DELETE'])
+@admin_required
+def invalidate_auth_cache():
+    """Admin endpoint to drop cached token verifications (all, or one ?user_id=...)."""
+    dropped = invalidate(request.args.get('user_id'))
+    return jsonify({'message': 'Auth cache invalidated', 'dropped': dropped}), 200
+
+@app.route('/api/admin/chatbot/cache', methods=['GET'])
+@admin_required
+def get_chatbot_cache_stats():
+    """Admin endpoint reporting the chatbot reply cache's size and hit rate."""
+    return jsonify({'cache': chatbot_service.cache_stats(), 'routing': chatbot_service.routing_stats()}), 200
+
+@app.route('/api/admin/chatbot/cache', methods=['DELETE'])
+@admin_required
+def invalidate_chatbot_cache():
+    """Admin endpoint to drop cached chatbot replies (all, or one ?question=...)."""
+    dropped = chatbot_service.invalidate_cache(request.args.get('question'))
+    return jsonify({'message': 'Chatbot cache invalidated', 'dropped': dropped}), 200
+
 # --- NEW ADMIN BILLER ROUTES ---
 @app.route('/api/admin/billers', methods=['GET'])
 @admin_required
@@ -267,27 +383,91 @@ def delete_biller_admin(biller_id):
 @app.route('/api/admin/transactions', methods=['GET'])
 @admin_required
 def get_all_transactions_admin():
-    """Admin endpoint to get a list of all transactions."""
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    response, status_code = transaction_service.get_all_transactions(start_date=start_date, end_date=end_date)
-    return jsonify(response), status_code
+    """
+    Admin endpoint to list transactions with server-side filters.
+    Supplying limit/cursor returns one keyset page; otherwise the full result
+    is streamed as JSON (or NDJSON with format=ndjson) straight off the cursor.
+    """
+    filters = {
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date'),
+        'account_number': request.args.get('account'),
+        'tx_type': request.args.get('type')
+    }
+
+    if 'limit' in request.args or 'cursor' in request.args:
+        response, status_code = transaction_service.get_transactions_page(
+            limit=request.args.get('limit'),
+            cursor=request.args.get('cursor'),
+            **filters
+        )
+        return jsonify(response), status_code
+
+    output_format = request.args.get('format', 'json')
+    stream, status_code = transaction_service.stream_transactions(output_format=output_format, **filters)
+    if status_code != 200:
+        return jsonify(stream), status_code
+
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(stream), mimetype=mimetype)
 
 @app.route('/api/admin/reports/transactions.csv', methods=['GET'])
 @admin_required
 def download_transactions_report_csv():
     """
-    Handles the API request to download a CSV report of all transactions.
+    Handles the API request to download a CSV report of all transactions,
+    with optional date filtering. Rows are streamed as they are read.
     """
-    csv_data = report_service.generate_transaction_report_csv()
-    
+    stream, status_code = report_service.stream_transaction_report_csv(
+        start_date=request.args.get('start_date'),
+        end_date=request.args.get('end_date')
+    )
+    if status_code != 200:
+        return jsonify(stream), status_code
+
     return Response(
-        csv_data,
+        stream_with_context(stream),
         mimetype="text/csv",
         headers={"Content-disposition": "attachment; filename=transactions_report.csv"}
     )
 
 
+# --- CLI Commands ---
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Reports missing/unused indexes and the plan each service query gets."""
+    report = db_instance.index_report()
+    print("Missing indexes:", ", ".join(report['missing']) or "none")
+    print("Unused indexes (no accesses since server start):", ", ".join(report['unused']) or "none")
+    print("Query plans:")
+    for entry in report['plans']:
+        print(f"  [{entry['collection']}] {entry['query']}: {entry['plan']}")
+
+@app.cli.command('backfill-participants')
+def backfill_participants_command():
+    """Adds the participants field to transactions written before it existed."""
+    updated = transaction_service.backfill_participants()
+    print(f"Backfill complete. {updated} transactions updated.")
+
+@app.cli.command('rebuild-insights')
+def rebuild_insights_command():
+    """Recomputes the spending insights rollups from raw transactions."""
+    rebuilt = insights_service.rebuild_rollups()
+    print(f"Rebuild complete. {rebuilt} rollup documents written.")
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recounts the admin dashboard counters from the source collections."""
+    totals = counter_service.reconcile()
+    print(f"Counters reconciled: {totals}")
+
+@app.cli.command('fold-balances')
+def fold_balances_command():
+    """Moves hot-account shard balances back into their accounts."""
+    folded = hot_accounts.fold_all()
+    print(f"Fold complete. {folded} accounts folded.")
+
+
 # --- Application Runner ---
 if __name__ == '__main__':
     with app.app_context():
@@ -295,5 +475,9 @@ if __name__ == '__main__':
         user_service.create_admin_user_if_not_exists()
         biller_service.initialize_billers()
         seed_initial_data() # Call the new function to seed data
+    # Periodically correct any drift in the admin dashboard counters
+    counter_service.start_reconciler()
+    # Periodically fold hot-account credit shards back into their accounts
+    hot_accounts.start_folder()
     # The debug flag is useful for development as it enables a debugger and auto-reloader
     app.run(host='0.0.0.0', port=5000, debug=True)
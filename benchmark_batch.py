@@ -0,0 +1,92 @@
+"""
+Batch transfer benchmark.
+
+Sends N transfers from one sender as N create_transfer calls, then as one
+create_transfer_batch call, and compares wall time and database round trips.
+Runs against a throwaway database on the MongoDB replica set configured in
+MONGO_URI.
+
+    python benchmark_batch.py --transfers 500 --recipients 50
+"""
+import time
+import argparse
+from bson import ObjectId
+from pymongo import monitoring
+
+BENCH_DB = 'smart_ebanking_bench'
+
+class _CommandCounter(monitoring.CommandListener):
+    """Counts commands sent to the server (one per round trip)."""
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Global listeners only apply to clients created afterwards, so register
+# before database.py connects.
+_commands = _CommandCounter()
+monitoring.register(_commands)
+
+from database import db_instance
+from services import transaction_service
+
+def _setup(recipients):
+    """Creates a fresh bench database with a funded sender and its recipients."""
+    db_instance.client.drop_database(BENCH_DB)
+    db_instance.db = db_instance.client[BENCH_DB]
+    db_instance._initialize_collections()
+    db_instance._ensure_indexes()
+
+    accounts = db_instance.get_collection('accounts')
+    sender_id = ObjectId()
+    accounts.insert_one({'user_id': sender_id, 'account_number': 'BENCH-SENDER', 'balance': 1_000_000.0})
+    accounts.insert_many([
+        {'user_id': ObjectId(), 'account_number': f"BENCH-{i:04d}", 'balance': 0.0}
+        for i in range(recipients)
+    ])
+    _commands.count = 0
+    return str(sender_id)
+
+def _report(label, elapsed, transfers):
+    print(f"{label:<18}{elapsed * 1000:>10.1f} ms{_commands.count:>8} commands"
+          f"{transfers / elapsed:>12.1f} transfers/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transfers', type=int, default=transaction_service.MAX_BATCH_TRANSFERS)
+    parser.add_argument('--recipients', type=int, default=50)
+    args = parser.parse_args()
+
+    if db_instance.client is None:
+        raise SystemExit('MongoDB is not reachable; set MONGO_URI to a replica set.')
+
+    transfers = [
+        {'to_account_number': f"BENCH-{i % args.recipients:04d}", 'amount': 1.0, 'description': 'payroll'}
+        for i in range(args.transfers)
+    ]
+    try:
+        sender = _setup(args.recipients)
+        started = time.perf_counter()
+        for transfer in transfers:
+            transaction_service.create_transfer(
+                sender, transfer['to_account_number'], transfer['amount'], transfer['description']
+            )
+        _report('individual calls', time.perf_counter() - started, args.transfers)
+
+        sender = _setup(args.recipients)
+        started = time.perf_counter()
+        response, _ = transaction_service.create_transfer_batch(sender, transfers)
+        _report('one batch', time.perf_counter() - started, args.transfers)
+        print(f"batch result: {response['succeeded']} succeeded, {response['failed']} failed")
+    finally:
+        db_instance.client.drop_database(BENCH_DB)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Contention benchmark for money transfers.
+
+Many senders transfer to one hot recipient account at the same time, first
+with retries disabled (every write conflict surfaces as a failed transfer),
+then with the default retry policy, and finally with the recipient in hot
+mode so its credits spread over balance shards. Runs against a throwaway
+database on the MongoDB replica set configured in MONGO_URI.
+
+    python benchmark_contention.py --threads 16 --transfers 50 --hot-shards 8
+"""
+import time
+import argparse
+import threading
+from bson import ObjectId
+from database import db_instance
+from services import metrics, transaction_runner, transaction_service, hot_accounts
+
+BENCH_DB = 'smart_ebanking_bench'
+HOT_ACCOUNT = 'BENCH-HOT'
+
+def _setup(senders):
+    """Creates a fresh bench database with funded senders and one hot recipient."""
+    db_instance.client.drop_database(BENCH_DB)
+    db_instance.db = db_instance.client[BENCH_DB]
+    db_instance._initialize_collections()
+    db_instance._ensure_indexes()
+
+    accounts = db_instance.get_collection('accounts')
+    user_ids = [ObjectId() for _ in range(senders)]
+    accounts.insert_many([
+        {'user_id': user_id, 'account_number': f"BENCH-{i:04d}", 'balance': 1_000_000.0}
+        for i, user_id in enumerate(user_ids)
+    ])
+    accounts.insert_one({'user_id': ObjectId(), 'account_number': HOT_ACCOUNT, 'balance': 0.0})
+    return user_ids
+
+def _run(label, threads, transfers, max_attempts, hot_shards=0):
+    user_ids = _setup(threads)
+    if hot_shards:
+        hot_accounts.set_hot_mode(HOT_ACCOUNT, hot_shards)
+    transaction_runner.TXN_MAX_ATTEMPTS = max_attempts
+    metrics.reset('transactions.transfer')
+    failures = [0] * threads
+    start_barrier = threading.Barrier(threads)
+
+    def worker(index):
+        start_barrier.wait()
+        for _ in range(transfers):
+            _, status_code = transaction_service.create_transfer(
+                str(user_ids[index]), HOT_ACCOUNT, 1.0, 'benchmark'
+            )
+            if status_code != 201:
+                failures[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * transfers
+    succeeded = total - sum(failures)
+    counters = metrics.snapshot('transactions.transfer')['counters']
+    hot_accounts.fold_all()
+    hot_balance = db_instance.get_collection('accounts').find_one({'account_number': HOT_ACCOUNT})['balance']
+    print(f"\n== {label} (max_attempts={max_attempts}, hot_shards={hot_shards}) ==")
+    print(f"transfers:    {succeeded}/{total} succeeded in {elapsed:.2f}s")
+    print(f"throughput:   {succeeded / elapsed:.1f} committed transfers/s")
+    print(f"hot balance:  {hot_balance:.2f} (expected {float(succeeded):.2f})")
+    for name in ('attempts', 'conflicts', 'retries', 'commits', 'commit_retries', 'failures'):
+        print(f"{name + ':':<14}{counters.get(f'transactions.transfer.{name}', 0)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--transfers', type=int, default=50, help='transfers per thread')
+    parser.add_argument('--hot-shards', type=int, default=8, help='credit shards for the hot-mode run (0 skips it)')
+    args = parser.parse_args()
+
+    if db_instance.client is None:
+        raise SystemExit('MongoDB is not reachable; set MONGO_URI to a replica set.')
+
+    default_attempts = transaction_runner.TXN_MAX_ATTEMPTS
+    try:
+        _run('no retries', args.threads, args.transfers, max_attempts=1)
+        _run('retry with backoff', args.threads, args.transfers, max_attempts=default_attempts)
+        if args.hot_shards:
+            _run('hot account shards', args.threads, args.transfers,
+                 max_attempts=default_attempts, hot_shards=args.hot_shards)
+    finally:
+        db_instance.client.drop_database(BENCH_DB)
+
+if __name__ == '__main__':
+    main()
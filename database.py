@@ -1,10 +1,93 @@
 import os
-from pymongo import MongoClient
+from datetime import datetime
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# --- Index Specification ---
+# Every index the services rely on, per collection. Applied idempotently on
+# connect; `flask --app app check-indexes` reports drift against this list.
+INDEX_SPECS = {
+    'users': [
+        {'keys': [('username', ASCENDING)], 'name': 'username_unique', 'unique': True},
+        {'keys': [('email', ASCENDING)], 'name': 'email_unique', 'unique': True},
+        {'keys': [('status', ASCENDING)], 'name': 'status'},
+    ],
+    'accounts': [
+        # One account per user; every user endpoint looks the account up by user_id
+        {'keys': [('user_id', ASCENDING)], 'name': 'user_id_unique', 'unique': True},
+        {'keys': [('account_number', ASCENDING)], 'name': 'account_number_unique', 'unique': True},
+        # Hot accounts reloaded by every process; only the few in hot mode are indexed
+        {'keys': [('hot_shards', ASCENDING)], 'name': 'hot_shards_partial',
+         'partialFilterExpression': {'hot_shards': {'$gt': 0}}},
+    ],
+    'transactions': [
+        # Per-account history: one multikey range scan, newest first with the keyset tiebreaker
+        {'keys': [('participants', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], 'name': 'participants_timestamp'},
+        # Outgoing spend per account (insights)
+        {'keys': [('from_account', ASCENDING), ('timestamp', DESCENDING)], 'name': 'from_account_timestamp'},
+        # Admin listings, reports and the "transactions today" count
+        {'keys': [('timestamp', DESCENDING), ('_id', DESCENDING)], 'name': 'timestamp'},
+    ],
+    'billers': [
+        {'keys': [('name', ASCENDING), ('category', ASCENDING)], 'name': 'name_category'},
+    ],
+    'spending_rollups': [
+        # One counter per account, period ('YYYY-MM' or 'all') and category
+        {'keys': [('account_number', ASCENDING), ('period', ASCENDING), ('category', ASCENDING)],
+         'name': 'account_period_category_unique', 'unique': True},
+    ],
+    'balance_shards': [
+        # Credit shards of hot accounts, addressed by (account_number, shard)
+        {'keys': [('account_number', ASCENDING), ('shard', ASCENDING)], 'name': 'account_shard_unique', 'unique': True},
+    ],
+    'twofa_challenges': [
+        # Pending 2FA codes are removed by MongoDB once they expire
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_ttl', 'expireAfterSeconds': 0},
+    ],
+    'chatbot_conversations': [
+        # Idle conversations are forgotten once they expire
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_ttl', 'expireAfterSeconds': 0},
+    ],
+    'token_revocations': [
+        # A cutoff only matters while tokens issued before it can still be valid
+        # (kept well past the default 7-day refresh token lifetime)
+        {'keys': [('revoked_before', ASCENDING)], 'name': 'revoked_before_ttl', 'expireAfterSeconds': 30 * 24 * 3600},
+    ],
+    'session_revocations': [
+        # A logged-out session is forgotten once its refresh token would have expired
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_ttl', 'expireAfterSeconds': 0},
+        # The in-memory sync loads only sessions whose access tokens may still be live
+        {'keys': [('access_until', ASCENDING)], 'name': 'access_until'},
+    ],
+    'counters': [
+        # Daily transaction-count shards expire on their own; the dashboard totals have no 'day'
+        {'keys': [('day', ASCENDING)], 'name': 'day_ttl', 'expireAfterSeconds': 8 * 24 * 3600},
+    ],
+}
+
+# Representative service queries whose plans the index check explains.
+# The values are placeholders; only the query shape matters to the planner.
+_SAMPLE_ACCOUNT = 'ACC000000000'
+QUERY_PROBES = [
+    ('account by user_id', 'accounts', {'user_id': ObjectId('000000000000000000000000')}, None),
+    ('account by account_number', 'accounts', {'account_number': _SAMPLE_ACCOUNT}, None),
+    ('hot accounts', 'accounts', {'hot_shards': {'$gt': 0}}, None),
+    ('user by username', 'users', {'username': 'sampleuser'}, None),
+    ('user by email', 'users', {'email': 'sample@bank.com'}, None),
+    ('pending users', 'users', {'status': 'pending'}, None),
+    ('account history', 'transactions',
+     {'participants': _SAMPLE_ACCOUNT},
+     [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('spending insights', 'spending_rollups', {'account_number': _SAMPLE_ACCOUNT, 'period': {'$in': ['all']}}, None),
+    ('transactions today', 'transactions', {'timestamp': {'$gte': datetime(2000, 1, 1)}}, None),
+    ('admin listing', 'transactions', {}, [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+]
+
 class Database:
     """Manages the connection to the MongoDB database and ensures collections exist."""
     def __init__(self):
@@ -28,6 +111,7 @@ class Database:
             
             # Explicitly create collections if they don't exist.
             self._initialize_collections()
+            self._ensure_indexes()
 
         except Exception as e:
             print(f"ERROR: Could not connect to MongoDB. Details: {e}")
@@ -50,11 +134,83 @@ class Database:
                 except Exception as e:
                     print(f"Error creating collection '{collection_name}': {e}")
 
+    def _ensure_indexes(self):
+        """Creates any index in INDEX_SPECS that is missing. Safe to run repeatedly."""
+        if self.db is None:
+            return
+
+        for collection_name, specs in INDEX_SPECS.items():
+            models = [
+                IndexModel(spec['keys'], **{k: v for k, v in spec.items() if k != 'keys'})
+                for spec in specs
+            ]
+            try:
+                self.db[collection_name].create_indexes(models)
+            except OperationFailure as e:
+                # Usually existing duplicates blocking a unique index, or an index
+                # with the same name but different options.
+                print(f"Error creating indexes on '{collection_name}': {e}")
+
+    def index_report(self):
+        """
+        Compares live indexes against INDEX_SPECS and explains QUERY_PROBES.
+
+        Returns:
+            dict: {'missing': [...], 'unused': [...], 'plans': [...]}
+        """
+        report = {'missing': [], 'unused': [], 'plans': []}
+        if self.db is None:
+            return report
+
+        for collection_name, specs in INDEX_SPECS.items():
+            collection = self.db[collection_name]
+            existing = collection.index_information()
+            for spec in specs:
+                if spec['name'] not in existing:
+                    report['missing'].append(f"{collection_name}.{spec['name']}")
+
+            # $indexStats counts accesses since the server (or index) started
+            try:
+                for stats in collection.aggregate([{'$indexStats': {}}]):
+                    if stats['name'] != '_id_' and stats['accesses']['ops'] == 0:
+                        report['unused'].append(f"{collection_name}.{stats['name']}")
+            except OperationFailure as e:
+                print(f"Could not read index usage for '{collection_name}': {e}")
+
+        for label, collection_name, query, sort in QUERY_PROBES:
+            cursor = self.db[collection_name].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            winning_plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+            # Servers using the slot-based engine nest the classic plan one level down
+            winning_plan = winning_plan.get('queryPlan', winning_plan)
+            report['plans'].append({
+                'query': label,
+                'collection': collection_name,
+                'plan': _describe_plan(winning_plan)
+            })
+        return report
+
     def get_collection(self, collection_name):
         """Safely retrieves a collection from the database."""
         if self.db is not None:
             return self.db[collection_name]
         return None
 
+def _describe_plan(stage):
+    """Flattens a winning plan into e.g. 'FETCH <- IXSCAN(user_id_unique)'."""
+    parts = []
+    while stage:
+        name = stage.get('stage', '?')
+        if stage.get('indexName'):
+            name += f"({stage['indexName']})"
+        parts.append(name)
+        # $or plans fan out into several input stages
+        if stage.get('inputStages'):
+            parts.append('[' + ', '.join(_describe_plan(s) for s in stage['inputStages']) + ']')
+            break
+        stage = stage.get('inputStage')
+    return ' <- '.join(parts)
+
 # Create a single, globally accessible instance of the database connection.
 db_instance = Database()
@@ -0,0 +1,43 @@
+from collections import namedtuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# The caller's account as carried in their access token, so user endpoints
+# can address the account directly instead of looking it up by user_id.
+AccountContext = namedtuple('AccountContext', ['account_id', 'account_number'])
+
+def from_claims(claims):
+    """
+    Builds the account context from access-token claims.
+
+    Returns:
+        AccountContext or None: None for tokens without an account (admins,
+        or users whose account did not exist yet when the token was issued).
+    """
+    account_id = claims.get('account_id')
+    account_number = claims.get('account_number')
+    if not account_id or not account_number:
+        return None
+    try:
+        return AccountContext(ObjectId(account_id), account_number)
+    except (InvalidId, TypeError):
+        return None
+
+def account_filter(user_id, account=None):
+    """Query that selects the caller's account, by _id when the context is known."""
+    if account is not None:
+        return {'_id': account.account_id}
+    return {'user_id': ObjectId(user_id)}
+
+def resolve_account_number(accounts_collection, user_id, account=None):
+    """
+    The caller's account number, from the context when available and
+    otherwise from one lookup by user_id.
+
+    Returns:
+        str or None: None if the user has no account.
+    """
+    if account is not None:
+        return account.account_number
+    found = accounts_collection.find_one({'user_id': ObjectId(user_id)}, {'account_number': 1})
+    return found['account_number'] if found else None
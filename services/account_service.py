@@ -1,7 +1,15 @@
 import random
+from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from database import db_instance
-from services.transaction_service import record_transaction
+from services.transaction_service import record_transaction, debit_account, credit_account, TransactionAborted
+from services.transaction_runner import run_transaction
+from services import counter_service, hot_accounts
+from services.account_context import account_filter
+
+# Fresh random account numbers tried before giving up on a collision streak
+ACCOUNT_NUMBER_ATTEMPTS = 5
 
 def _get_accounts_collection():
     """Helper to get the accounts collection."""
@@ -20,28 +28,41 @@ def create_account(user_id):
     if accounts_collection is None:
         return {'message': 'Database connection error'}, 500
         
-    account_number = f"ACC{random.randint(100000000, 999999999)}"
-    accounts_collection.insert_one({
-        'user_id': ObjectId(user_id),
-        'account_number': account_number,
-        'balance': 0.00,  # CHANGED: Starting balance is now 0.00
-        'type': 'checking'
-    })
-    return {'message': 'Account created'}, 201
+    for _ in range(ACCOUNT_NUMBER_ATTEMPTS):
+        account_number = f"ACC{random.randint(100000000, 999999999)}"
+        try:
+            accounts_collection.insert_one({
+                'user_id': ObjectId(user_id),
+                'account_number': account_number,
+                'balance': 0.00,  # CHANGED: Starting balance is now 0.00
+                'type': 'checking'
+            })
+        except DuplicateKeyError:
+            # Either the user already has an account, or the random number collided
+            if accounts_collection.find_one({'user_id': ObjectId(user_id)}, {'_id': 1}):
+                return {'message': 'Account already exists'}, 409
+            continue
+        counter_service.increment(totalAccounts=1)
+        return {'message': 'Account created'}, 201
+    return {'message': 'Could not allocate an account number'}, 500
 
-def get_account_by_user_id(user_id):
-    """Retrieves an account by the user's ID."""
+def get_account_by_user_id(user_id, account=None):
+    """Retrieves an account by the user's ID (or directly by the caller's account context)."""
     accounts_collection = _get_accounts_collection()
     if accounts_collection is None:
         return {'message': 'Database connection error'}, 500
 
-    account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
+    account = accounts_collection.find_one(account_filter(user_id, account))
     if account:
+        account['balance'] = hot_accounts.effective_balance(account)
         return {'account': _serialize_account(account)}, 200
     return {'message': 'Account not found'}, 404
 
-def deposit(user_id, amount):
-    """Deposits funds into a user's account."""
+def deposit(user_id, amount, account=None):
+    """
+    Deposits funds into a user's account.
+    The balance update and the ledger insert commit together in one transaction.
+    """
     accounts_collection = _get_accounts_collection()
     if accounts_collection is None:
         return {'message': 'Database connection error'}, 500
@@ -53,29 +74,36 @@ def deposit(user_id, amount):
     except (ValueError, TypeError):
         return {'message': 'Invalid amount'}, 400
 
-    account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
-    if not account:
-        return {'message': 'User account not found'}, 404
-
-    # These operations are now separate and do not require a session
-    accounts_collection.update_one(
-        {'user_id': ObjectId(user_id)},
-        {'$inc': {'balance': amount}}
-    )
+    def apply_deposit(session):
+        credited = credit_account(
+            accounts_collection, account_filter(user_id, account), amount, session,
+            not_found_message='User account not found'
+        )
+        record_transaction(
+            account_number=credited['account_number'],
+            amount=amount,
+            type='Deposit',
+            description='Online Deposit',
+            session=session
+        )
 
-    # Record transaction separately
-    record_transaction(
-        account_number=account['account_number'],
-        amount=amount,
-        type='Deposit',
-        description='Online Deposit',
-        session=None  # We pass None as there is no session
-    )
+    try:
+        run_transaction('deposit', apply_deposit)
+    except TransactionAborted as e:
+        return e.response, e.status_code
+    except Exception as e:
+        print(f"ERROR: Deposit failed. Details: {e}")
+        return {'message': 'Deposit failed. Please try again.'}, 500
 
+    counter_service.record_transactions(datetime.utcnow())
     return {'message': 'Deposit successful'}, 200
 
-def withdraw(user_id, amount):
-    """Withdraws funds from a user's account."""
+def withdraw(user_id, amount, account=None):
+    """
+    Withdraws funds from a user's account.
+    The balance check is part of the update itself (balance >= amount), and the
+    ledger insert commits in the same transaction.
+    """
     accounts_collection = _get_accounts_collection()
     if accounts_collection is None:
         return {'message': 'Database connection error'}, 500
@@ -87,26 +115,23 @@ def withdraw(user_id, amount):
     except (ValueError, TypeError):
         return {'message': 'Invalid amount'}, 400
     
-    account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
-    if not account:
-        return {'message': 'User account not found'}, 404
-    
-    if account['balance'] < amount:
-        return {'message': 'Insufficient funds'}, 400
-    
-    # These operations are now separate and do not require a session
-    accounts_collection.update_one(
-        {'user_id': ObjectId(user_id)},
-        {'$inc': {'balance': -amount}}
-    )
-    
-    # Record transaction separately
-    record_transaction(
-        account_number=account['account_number'],
-        amount=amount,
-        type='Withdrawal',
-        description='Online Withdrawal',
-        session=None  # We pass None as there is no session
-    )
+    def apply_withdrawal(session):
+        debited = debit_account(accounts_collection, account_filter(user_id, account), amount, session)
+        record_transaction(
+            account_number=debited['account_number'],
+            amount=amount,
+            type='Withdrawal',
+            description='Online Withdrawal',
+            session=session
+        )
+
+    try:
+        run_transaction('withdrawal', apply_withdrawal)
+    except TransactionAborted as e:
+        return e.response, e.status_code
+    except Exception as e:
+        print(f"ERROR: Withdrawal failed. Details: {e}")
+        return {'message': 'Withdrawal failed. Please try again.'}, 500
 
+    counter_service.record_transactions(datetime.utcnow())
     return {'message': 'Withdrawal successful'}, 200
@@ -2,45 +2,158 @@ import jwt
 import datetime
 import random
 import os
-from werkzeug.security import check_password_hash, generate_password_hash
+import uuid
 from bson import ObjectId
 from database import db_instance
-from . import email_service
+from . import email_service, password_hasher, twofa_store, token_revocation
+from .password_hasher import HashingUnavailable
 
 # Get SECRET_KEY from environment variables with a fallback
 SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secure-and-long-secret-key-that-you-should-change')
+# Access tokens are short-lived and carry the caller's account; a refresh
+# token is exchanged for a new one at /api/token/refresh.
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', 15))
+REFRESH_TOKEN_HOURS = int(os.environ.get('REFRESH_TOKEN_HOURS', 24 * 7))
+ADMIN_REFRESH_TOKEN_HOURS = int(os.environ.get('ADMIN_REFRESH_TOKEN_HOURS', 8))
+
+class TokenRevoked(jwt.InvalidTokenError):
+    """Raised for a token issued before its user's revocation cutoff."""
 
 def _get_users_collection():
     """Helper to safely get the users collection."""
     return db_instance.get_collection('users')
 
-def generate_2fa_code(user_id):
-    """Generates and stores a 6-digit 2FA code for a user."""
+def _rehash_if_needed(user, password):
+    """
+    Re-hashes a just-verified password when its stored hash is weaker than
+    the configured method. Best effort: if the pool is busy it is retried on a later login.
+    """
+    if not password_hasher.needs_rehash(user.get('password')):
+        return
+    try:
+        new_hash = password_hasher.hash_password(password)
+    except HashingUnavailable:
+        return
+    # Only replace the hash we verified, in case the password changed meanwhile
+    _get_users_collection().update_one(
+        {'_id': user['_id'], 'password': user['password']},
+        {'$set': {'password': new_hash}}
+    )
+
+def _encode_token(claims, lifetime):
+    now = datetime.datetime.utcnow()
+    return jwt.encode(dict(claims, iat=now, exp=now + lifetime), SECRET_KEY, "HS256")
+
+def _access_token(user, account=None, session_id=None):
+    """
+    A short-lived access token. For users with an account it also carries
+    account_id and account_number, so endpoints can skip the account lookup.
+    """
+    claims = {'user_id': str(user['_id']), 'is_admin': bool(user.get('is_admin')), 'type': 'access'}
+    if session_id:
+        claims['sid'] = session_id
+    if account:
+        claims['account_id'] = str(account['_id'])
+        claims['account_number'] = account['account_number']
+    return _encode_token(claims, datetime.timedelta(minutes=ACCESS_TOKEN_MINUTES))
+
+def _issue_tokens(user, account=None):
+    """
+    Access and refresh tokens for a freshly authenticated user. Both carry a
+    new session id ('sid'), so logging out can revoke just this session.
+    """
+    is_admin = bool(user.get('is_admin'))
+    refresh_hours = ADMIN_REFRESH_TOKEN_HOURS if is_admin else REFRESH_TOKEN_HOURS
+    session_id = uuid.uuid4().hex
+    return {
+        'token': _access_token(user, account, session_id),
+        'refresh_token': _encode_token(
+            {'user_id': str(user['_id']), 'is_admin': is_admin, 'type': 'refresh', 'sid': session_id},
+            datetime.timedelta(hours=refresh_hours)
+        ),
+        'expires_in': ACCESS_TOKEN_MINUTES * 60
+    }
+
+def decode_access_token(token):
+    """
+    Verifies an access token and returns its claims.
+    Raises jwt.ExpiredSignatureError, TokenRevoked or another
+    jwt.InvalidTokenError.
+    """
+    claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    if claims.get('type', 'access') != 'access':
+        raise jwt.InvalidTokenError('Not an access token')
+    if token_revocation.is_revoked(claims):
+        raise TokenRevoked('Token has been revoked')
+    return claims
+
+def refresh_access_token(refresh_token):
+    """
+    Exchanges a refresh token for a new access token. The user's status and
+    revocation cutoff are read fresh from the database, so a suspended user
+    cannot renew their session.
+    """
     users_collection = _get_users_collection()
-    if users_collection is None:
-        return None
-    code = str(random.randint(100000, 999999))
-    expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
-    users_collection.update_one(
-        {'_id': user_id},
-        {'$set': {'2fa_code': code, '2fa_code_expires': expiry}}
+    accounts_collection = db_instance.get_collection('accounts')
+    if users_collection is None or accounts_collection is None:
+        return {'message': 'Database connection error'}, 500
+    if not refresh_token:
+        return {'message': 'Refresh token is missing!'}, 401
+
+    try:
+        claims = jwt.decode(refresh_token, SECRET_KEY, algorithms=["HS256"])
+        if claims.get('type') != 'refresh':
+            raise jwt.InvalidTokenError('Not a refresh token')
+        user_id = ObjectId(claims['user_id'])
+    except jwt.ExpiredSignatureError:
+        return {'message': 'Session has expired. Please log in again.'}, 401
+    except Exception:
+        return {'message': 'Refresh token is invalid!'}, 401
+
+    if token_revocation.is_revoked(claims, fresh=True):
+        return {'message': 'Session has been revoked. Please log in again.'}, 401
+    user = users_collection.find_one({'_id': user_id}, {'is_admin': 1, 'status': 1})
+    if not user:
+        return {'message': 'Refresh token is invalid!'}, 401
+    if user.get('status') == 'suspended':
+        return {'message': 'Your account has been suspended'}, 403
+    if not user.get('is_admin') and user.get('status') != 'active':
+        return {'message': 'Your account is pending admin approval'}, 403
+
+    account = None
+    if not user.get('is_admin'):
+        account = accounts_collection.find_one({'user_id': user_id}, {'account_number': 1})
+    return {'token': _access_token(user, account, claims.get('sid')), 'expires_in': ACCESS_TOKEN_MINUTES * 60}, 200
+
+def end_session(user_id, session_id, is_admin=False):
+    """
+    Revokes the login session the caller's tokens belong to, leaving the
+    user's other sessions signed in. Tokens issued before sessions existed
+    carry no session id; for those every session of the user is revoked.
+    """
+    if not session_id:
+        token_revocation.revoke_user(user_id)
+        return
+    now = datetime.datetime.utcnow()
+    refresh_hours = ADMIN_REFRESH_TOKEN_HOURS if is_admin else REFRESH_TOKEN_HOURS
+    token_revocation.revoke_session(
+        session_id, user_id,
+        expires_at=now + datetime.timedelta(hours=refresh_hours),
+        access_until=now + datetime.timedelta(minutes=ACCESS_TOKEN_MINUTES)
     )
+
+def generate_2fa_code(user_id):
+    """Generates and stores a 6-digit 2FA code for a user in the challenge store."""
+    code = str(random.randint(100000, 999999))
+    if not twofa_store.save_code(user_id, code):
+        return None
     return code
 
 def verify_2fa_code(user_id, code):
-    """Verifies a user's 2FA code."""
-    users_collection = _get_users_collection()
-    if users_collection is None:
+    """Verifies a user's 2FA code, consuming it on success."""
+    if not code:
         return False
-    user = users_collection.find_one({'_id': user_id, '2fa_code': code})
-    if user and user.get('2fa_code_expires', datetime.datetime.min) > datetime.datetime.utcnow():
-        # Clear the code after successful verification
-        users_collection.update_one(
-            {'_id': user['_id']},
-            {'$unset': {'2fa_code': "", '2fa_code_expires': ""}}
-        )
-        return True
-    return False
+    return twofa_store.consume_code(user_id, str(code))
 
 def login(username, password):
     """Handles user login, including 2FA code generation and sending."""
@@ -51,8 +164,9 @@ def login(username, password):
 
         user = users_collection.find_one({'username': username, 'is_admin': False})
 
-        if not user or not check_password_hash(user.get('password', ''), password):
+        if not user or not password_hasher.verify_password(user.get('password', ''), password):
             return {'message': 'Invalid username or password'}, 401
+        _rehash_if_needed(user, password)
         
         if user.get('status') == 'suspended':
             return {'message': 'Your account has been suspended'}, 403
@@ -68,27 +182,30 @@ def login(username, password):
             return {'message': 'Failed to send 2FA code. Please check server logs.'}, 500
         
         return {'message': '2FA code sent to your email', 'user_id': str(user['_id'])}, 200
+    except HashingUnavailable:
+        return {'message': 'Server is busy. Please try again shortly.'}, 503
     except Exception as e:
         print(f"ERROR in login service: {e}")
         return {'message': 'An internal server error occurred.'}, 500
 
 def verify_login_code(user_id, code):
-    """Verifies a 2FA code and issues a JWT token."""
+    """
+    Verifies a 2FA code and issues an access token (carrying the user's
+    account) and a refresh token.
+    """
     users_collection = _get_users_collection()
-    if users_collection is None:
+    accounts_collection = db_instance.get_collection('accounts')
+    if users_collection is None or accounts_collection is None:
         return {'message': 'Database connection error'}, 500
     
     if verify_2fa_code(ObjectId(user_id), code):
         user = users_collection.find_one({'_id': ObjectId(user_id)})
-        token = jwt.encode({
-            'user_id': str(user['_id']),
-            'is_admin': user['is_admin'],
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, SECRET_KEY, "HS256")
+        account = accounts_collection.find_one({'user_id': user['_id']}, {'account_number': 1})
+        tokens = _issue_tokens(user, account)
         
         users_collection.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.datetime.utcnow()}})
 
-        return {'message': 'Login successful!', 'token': token, 'username': user['username']}, 200
+        return dict(tokens, message='Login successful!', username=user['username']), 200
     
     return {'message': 'Invalid or expired 2FA code.'}, 401
 
@@ -101,18 +218,17 @@ def admin_login(username, password):
 
         user = users_collection.find_one({'username': username, 'is_admin': True})
 
-        if not user or not check_password_hash(user.get('password', ''), password):
+        if not user or not password_hasher.verify_password(user.get('password', ''), password):
             return {'message': 'Invalid admin credentials'}, 401
+        _rehash_if_needed(user, password)
         
-        token = jwt.encode({
-            'user_id': str(user['_id']), 
-            'is_admin': True, 
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=8)
-        }, SECRET_KEY, "HS256")
+        tokens = _issue_tokens(user)
         
         users_collection.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.datetime.utcnow()}})
         
-        return {'token': token, 'username': user['username']}, 200
+        return dict(tokens, username=user['username']), 200
+    except HashingUnavailable:
+        return {'message': 'Server is busy. Please try again shortly.'}, 503
     except Exception as e:
         print(f"ERROR in admin_login service: {e}")
         return {'message': 'An internal server error occurred.'}, 500
@@ -0,0 +1,160 @@
+import re
+from datetime import datetime
+from database import db_instance
+from services import hot_accounts, transaction_service
+from services.account_context import account_filter, resolve_account_number
+
+# Answers the common account questions straight from the database so they
+# never reach the model. Anything that does not clearly match one of these
+# intents (including "how do I ..." style questions) is left to the LLM.
+DEFAULT_RECENT_COUNT = 5
+MAX_RECENT_COUNT = 10
+
+# Questions about how things work, rather than about the user's own numbers
+_OPEN_ENDED = re.compile(r"\b(how (do|can|to|does|should)|why|what is an?|what's an?|explain|difference|should i)\b")
+_BALANCE = re.compile(
+    r"\b(my|current|account|available|remaining) balance\b|\bbalance\b\W*$"
+    r"|\bhow much (money )?(do i have|is (there )?in my account|have i got)\b"
+)
+_RECENT = re.compile(
+    r"\b(recent|last|latest|previous|show|list|see)\b.*\b(transactions?|transfers?|payments?|activity|history)\b"
+    r"|\btransaction history\b"
+)
+_SPEND = re.compile(r"\b(how much|what) (did|have) i (spend|spent)\b|\bmy (spending|expenses)\b|\bspent on\b")
+_SPEND_TARGET = re.compile(r"\bon ([a-z][a-z ]*?)(?: (?:this|last|previous) month)?\W*$")
+_COUNT = re.compile(r"\b(last|latest|recent|previous)\s+(\d{1,2})\b")
+
+_NUMBER_WORDS = {'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10}
+
+def _normalize(message):
+    return ' '.join((message or '').lower().split())
+
+def _stem(word):
+    """Crude singular form, so 'utility' matches the 'Utilities' category."""
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+def _money(amount):
+    return f"₹{amount:,.2f}"
+
+def _recent_count(text):
+    match = _COUNT.search(text)
+    if match:
+        count = int(match.group(2))
+    else:
+        count = next((n for word, n in _NUMBER_WORDS.items() if re.search(rf"\b{word}\b", text)), DEFAULT_RECENT_COUNT)
+    return max(1, min(count, MAX_RECENT_COUNT))
+
+def _month_window(text):
+    """(month, label) for 'this month' / 'last month'; (None, None) means all time."""
+    now = datetime.utcnow()
+    if 'this month' in text:
+        return f"{now.year:04d}-{now.month:02d}", 'this month'
+    if 'last month' in text or 'previous month' in text:
+        year, month = (now.year - 1, 12) if now.month == 1 else (now.year, now.month - 1)
+        return f"{year:04d}-{month:02d}", 'last month'
+    return None, None
+
+def classify(message):
+    """
+    Picks the local intent for a chat message.
+
+    Returns:
+        str or None: 'balance', 'recent_transactions' or 'spending', or None
+        when the message should go to the model.
+    """
+    text = _normalize(message)
+    if not text or _OPEN_ENDED.search(text):
+        return None
+    if _SPEND.search(text):
+        return 'spending'
+    if _RECENT.search(text):
+        return 'recent_transactions'
+    if _BALANCE.search(text):
+        return 'balance'
+    return None
+
+def _answer_balance(user_id, text, account):
+    accounts_collection = db_instance.get_collection('accounts')
+    if accounts_collection is None:
+        return None
+    found = accounts_collection.find_one(account_filter(user_id, account))
+    if not found:
+        return None
+    return f"Your current balance is {_money(hot_accounts.effective_balance(found))}."
+
+def _describe_transaction(tx, account_number):
+    when = tx.get('timestamp', '')[:10]
+    amount = _money(tx.get('amount', 0))
+    if tx.get('type') == 'Deposit':
+        line = f"Deposit of {amount}"
+    elif tx.get('type') == 'Withdrawal':
+        line = f"Withdrawal of {amount}"
+    elif tx.get('to_account') == account_number:
+        line = f"Received {amount} from {tx.get('from_account')}"
+    else:
+        line = f"{tx.get('type', 'Payment')} of {amount} to {tx.get('to_account')}"
+    return f"- {when}: {line}"
+
+def _answer_recent(user_id, text, account):
+    count = _recent_count(text)
+    response, status = transaction_service.get_transactions_by_user_id(user_id, limit=count, account=account)
+    if status != 200:
+        return None
+    transactions = response['transactions']
+    if not transactions:
+        return "You don't have any transactions yet."
+    account_number = resolve_account_number(db_instance.get_collection('accounts'), user_id, account)
+    lines = [_describe_transaction(tx, account_number) for tx in transactions]
+    heading = "Here is your last transaction:" if len(lines) == 1 else f"Here are your last {len(lines)} transactions:"
+    return heading + '\n' + '\n'.join(lines)
+
+def _answer_spending(user_id, text, account):
+    month, label = _month_window(text)
+    response, status = transaction_service.get_spending_insights(user_id, month=month, account=account)
+    if status != 200:
+        return None
+    totals = dict(zip(response['labels'], response['data']))
+    period = label or 'so far'
+
+    words = {_stem(word) for word in re.findall(r"[a-z]+", text)}
+    asked = [
+        category for category in totals
+        if all(_stem(part) in words for part in re.findall(r"[a-z]+", category.lower()))
+    ]
+    if asked:
+        category = asked[0]
+        return f"You spent {_money(totals[category])} on {category} {period}."
+    target = _SPEND_TARGET.search(text)
+    if target:
+        return f"You have no recorded spending on {target.group(1)} {period}."
+    if not totals:
+        return f"You have no recorded spending {period}."
+    summary = ', '.join(f"{category} {_money(total)}" for category, total in list(totals.items())[:3])
+    return f"You spent {_money(sum(totals.values()))} {period}. Top categories: {summary}."
+
+_HANDLERS = {
+    'balance': _answer_balance,
+    'recent_transactions': _answer_recent,
+    'spending': _answer_spending,
+}
+
+def answer(user_id, message, account=None):
+    """
+    Answers the message locally if it matches a known intent.
+
+    Returns:
+        tuple: (intent, reply), or (None, None) when the model should answer.
+    """
+    intent = classify(message)
+    if intent is None:
+        return None, None
+    try:
+        reply = _HANDLERS[intent](user_id, _normalize(message), account)
+    except Exception as e:
+        print(f"ERROR: Local chatbot intent '{intent}' failed. Details: {e}")
+        return None, None
+    return (intent, reply) if reply else (None, None)
@@ -1,49 +1,381 @@
 import os
+import re
+import json
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import google.generativeai as genai
-from bson import ObjectId
 from database import db_instance
-import traceback
+from services import chatbot_intents, conversation_store, hot_accounts, metrics
+from services.account_context import account_filter
+from services.ttl_cache import TTLCache
+
+# --- Configuration ---
+# 'gemini' talks to the Gemini API; 'fake' is a local stand-in for tests and
+# offline development that answers after CHATBOT_FAKE_LATENCY seconds.
+CHATBOT_BACKEND = os.environ.get('CHATBOT_BACKEND', 'gemini').lower()
+CHATBOT_MODEL = os.environ.get('CHATBOT_MODEL', 'gemini-2.5-flash')
+# Upstream calls in flight at once, across all requests in this process
+CHATBOT_MAX_CONCURRENCY = int(os.environ.get('CHATBOT_MAX_CONCURRENCY', 8))
+# Seconds a request waits for a free upstream slot before answering "busy"
+CHATBOT_QUEUE_TIMEOUT = float(os.environ.get('CHATBOT_QUEUE_TIMEOUT', 2))
+# Hard limit on one upstream call
+CHATBOT_TIMEOUT = float(os.environ.get('CHATBOT_TIMEOUT', 15))
+# Consecutive failures that open the circuit, and how long it stays open
+CHATBOT_FAILURE_THRESHOLD = int(os.environ.get('CHATBOT_FAILURE_THRESHOLD', 5))
+CHATBOT_CIRCUIT_RESET_SECONDS = float(os.environ.get('CHATBOT_CIRCUIT_RESET_SECONDS', 30))
+CHATBOT_FAKE_LATENCY = float(os.environ.get('CHATBOT_FAKE_LATENCY', 0.05))
+# Longest wait for the next chunk of a streamed reply (the first one included)
+CHATBOT_STREAM_IDLE_TIMEOUT = float(os.environ.get('CHATBOT_STREAM_IDLE_TIMEOUT', CHATBOT_TIMEOUT))
+# Replies to generic questions ("how do I pay a bill") are shared between
+# users, keyed by the normalized question. Those questions are sent to the
+# model without the user's balance, so a cached reply holds nothing personal.
+CHATBOT_CACHE_SIZE = int(os.environ.get('CHATBOT_CACHE_SIZE', 1000))
+CHATBOT_CACHE_SECONDS = float(os.environ.get('CHATBOT_CACHE_SECONDS', 3600))
+
+OFFLINE_MESSAGE = "The AI chatbot is currently offline. Please ensure your **GEMINI_API_KEY** is set correctly in your environment or `.env` file."
+UNAVAILABLE_MESSAGE = "The AI chatbot is temporarily unavailable. Please try again in a minute."
+BUSY_MESSAGE = "The AI chatbot is handling a lot of questions right now. Please try again in a moment."
+ERROR_MESSAGE = "I'm sorry, I'm having trouble connecting to my brain right now. Please try again in a moment."
+
+# Only questions in these general "how does it work" forms are cacheable
+_GENERIC = re.compile(r"^(?:how (?:do|can|should) (?:i|you|one)|how to|what (?:is|are|does)|where (?:can|do) (?:i|you))\b")
+# After the opening form, any first-person clause ("... if i paid") is about the asker
+_FIRST_PERSON = re.compile(r"\b(i|i'm|im|i've|ive|i'd|i'll)\b")
+# Words and marks that tie a question to the asker's own account or money
+_PERSONAL = re.compile(r"\b(my|mine|me|myself|we|our|us|balance|afford|owe|owed|owing)\b|\d|@")
+# Follow-ups whose meaning depends on the conversation so far
+_FOLLOW_UP = re.compile(r"^(and|but|also|then|what about|how about)\b|\b(it|that|this|those|these|them|there)\b")
+_FILLER = re.compile(r"^(?:(?:hi|hello|hey|please|kindly|ok|okay|so)\b\s*)+|\b(?:can|could|would) you (?:please )?(?:tell me|explain)\b|\btell me\b|\bplease\b")
+
+_response_cache = TTLCache(CHATBOT_CACHE_SIZE)
+
+class ChatbotUnavailable(Exception):
+    """Raised instead of calling upstream; carries the reply to show the user."""
+    def __init__(self, reply):
+        super().__init__(reply)
+        self.reply = reply
+
+class GeminiBackend:
+    """The Gemini model, configured once and shared by every request."""
+    def __init__(self, api_key, model_name=CHATBOT_MODEL):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text
+
+    def stream(self, prompt, timeout):
+        """Yields the reply text chunk by chunk as the model produces it."""
+        response = self.model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+class FakeBackend:
+    """Deterministic local model: echoes the question after a fixed delay."""
+    def __init__(self, latency=CHATBOT_FAKE_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._reply(prompt)
+
+    def stream(self, prompt, timeout):
+        """Yields the same reply word by word, spreading the latency across the words."""
+        self.calls += 1
+        words = self._reply(prompt).split(' ')
+        for i, word in enumerate(words):
+            time.sleep(self.latency / len(words))
+            yield word if i == 0 else ' ' + word
 
-def get_gemini_response(user_id, user_message):
+    def _reply(self, prompt):
+        question = prompt.rsplit("User's question:", 1)[-1].strip().strip('"')
+        return f"(fake model) You asked: {question}"
+
+class CircuitBreaker:
     """
-    Generates a contextual response using the Gemini API, 
-    retrieving the API key from the GEMINI_API_KEY environment variable.
+    Opens after `threshold` consecutive failures; while open, calls are
+    refused until `reset_seconds` pass, then one trial call is let through.
     """
-    
-    # --- Retrieve API key directly from environment variable ---
-    api_key = os.getenv('GEMINI_API_KEY')
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
 
-    # Check if API key is provided
-    if not api_key:
-        return "The AI chatbot is currently offline. Please ensure your **GEMINI_API_KEY** is set correctly in your environment or `.env` file."
-    
-    try:
-        # Configure the client with the retrieved API key
-        genai.configure(api_key=api_key)
-        # Use the modern, fast model for chat
-        model = genai.GenerativeModel('gemini-2.5-flash')
-
-        # --- Database Context Retrieval (Unchanged) ---
-        accounts_collection = db_instance.get_collection('accounts')
-        balance_info = "unavailable"
-        if accounts_collection is not None:
-            # Note: MongoDB requires ObjectId for _id and user_id fields
-            # Check if user_id can be converted to ObjectId before querying
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def cancel_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self._lock:
+            return 'closed' if self._opened_at is None else 'open'
+
+class ChatbotClient:
+    """
+    Long-lived upstream client: bounds concurrent calls, enforces a hard
+    per-call timeout and fails fast through a circuit breaker.
+    """
+    def __init__(self, backend, max_concurrency=CHATBOT_MAX_CONCURRENCY, timeout=CHATBOT_TIMEOUT):
+        self.backend = backend
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='chatbot')
+        self.breaker = CircuitBreaker(CHATBOT_FAILURE_THRESHOLD, CHATBOT_CIRCUIT_RESET_SECONDS)
+
+    def generate(self, prompt):
+        """
+        Returns the model's reply. Raises ChatbotUnavailable with a
+        user-facing message when the call is refused, times out or fails.
+        """
+        if not self.breaker.allow():
+            metrics.increment('chatbot.circuit_open')
+            raise ChatbotUnavailable(UNAVAILABLE_MESSAGE)
+        if not self._slots.acquire(timeout=CHATBOT_QUEUE_TIMEOUT):
+            metrics.increment('chatbot.busy')
+            # Not the upstream's fault, so give back a half-open trial unused
+            self.breaker.cancel_trial()
+            raise ChatbotUnavailable(BUSY_MESSAGE)
+
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(self.backend.generate, prompt, self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the upstream call really ends, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            reply = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            metrics.increment('chatbot.timeouts')
+            self.breaker.record_failure()
+            raise ChatbotUnavailable(ERROR_MESSAGE)
+        except Exception:
+            metrics.increment('chatbot.failures')
+            self.breaker.record_failure()
+            print("ERROR: An error occurred while communicating with the Gemini API.")
+            traceback.print_exc()
+            raise ChatbotUnavailable(ERROR_MESSAGE)
+        finally:
+            metrics.observe('chatbot.upstream', time.perf_counter() - started)
+        self.breaker.record_success()
+        return reply
+
+    def stream(self, prompt):
+        """
+        Yields the model's reply in chunks as they arrive, under the same
+        concurrency limit and circuit breaker as generate(). Raises
+        ChatbotUnavailable when the call is refused, stalls for longer than
+        CHATBOT_STREAM_IDLE_TIMEOUT or fails, possibly after some chunks.
+        Closing the generator early stops reading from the model.
+        """
+        if not self.breaker.allow():
+            metrics.increment('chatbot.circuit_open')
+            raise ChatbotUnavailable(UNAVAILABLE_MESSAGE)
+        if not self._slots.acquire(timeout=CHATBOT_QUEUE_TIMEOUT):
+            metrics.increment('chatbot.busy')
+            self.breaker.cancel_trial()
+            raise ChatbotUnavailable(BUSY_MESSAGE)
+
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
             try:
-                account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
-                if account:
-                    balance_info = f"₹{account.get('balance', 0):.2f}"
-            except Exception as db_e:
-                # Handle cases where user_id might not be a valid ObjectId format
-                print(f"ERROR: Invalid user_id format for MongoDB: {db_e}")
+                for chunk in self.backend.stream(prompt, self.timeout):
+                    if cancelled.is_set():
+                        return
+                    chunks.put(chunk)
+                chunks.put(done)
+            except Exception as e:
+                chunks.put(e)
+
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(produce)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        first = True
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=CHATBOT_STREAM_IDLE_TIMEOUT)
+                except queue.Empty:
+                    metrics.increment('chatbot.timeouts')
+                    self.breaker.record_failure()
+                    raise ChatbotUnavailable(ERROR_MESSAGE)
+                if chunk is done:
+                    break
+                if isinstance(chunk, Exception):
+                    metrics.increment('chatbot.failures')
+                    self.breaker.record_failure()
+                    print("ERROR: An error occurred while streaming from the Gemini API.")
+                    traceback.print_exception(type(chunk), chunk, chunk.__traceback__)
+                    raise ChatbotUnavailable(ERROR_MESSAGE)
+                if first:
+                    metrics.observe('chatbot.first_chunk', time.perf_counter() - started)
+                    first = False
+                yield chunk
+        except GeneratorExit:
+            # The caller went away; that says nothing about the upstream
+            self.breaker.cancel_trial()
+            raise
+        finally:
+            cancelled.set()
+            metrics.observe('chatbot.upstream', time.perf_counter() - started)
+        self.breaker.record_success()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    The process-wide chatbot client, created on first use.
+
+    Returns:
+        ChatbotClient or None: None if the Gemini backend has no API key.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if CHATBOT_BACKEND == 'fake':
+                _client = ChatbotClient(FakeBackend())
+            else:
+                api_key = os.getenv('GEMINI_API_KEY')
+                if not api_key:
+                    return None
+                _client = ChatbotClient(GeminiBackend(api_key))
+        return _client
+
+def _balance_info(user_id, account=None):
+    accounts_collection = db_instance.get_collection('accounts')
+    if accounts_collection is None:
+        return "unavailable"
+    try:
+        found = accounts_collection.find_one(account_filter(user_id, account))
+    except Exception as db_e:
+        # Handle cases where user_id might not be a valid ObjectId format
+        print(f"ERROR: Invalid user_id format for MongoDB: {db_e}")
+        return "unavailable"
+    if not found:
+        return "unavailable"
+    return f"₹{hot_accounts.effective_balance(found):.2f}"
+
+def cache_key(user_message):
+    """
+    The normalized form of a generic question, used as its cache key.
+    Only clearly general forms qualify ("how do i pay a bill", "what are
+    the fees for transfers"); "can i afford ...", "how much do i owe" and
+    "what did i buy" are personal.
+
+    Returns:
+        str or None: None if the message may refer to the asker's own
+        account, amounts or details, or to earlier messages; those are
+        never cached.
+    """
+    text = ' '.join(re.sub(r"[^\w'@]+", ' ', (user_message or '').lower()).split())
+    text = ' '.join(_FILLER.sub(' ', text).split())
+    if not text or _PERSONAL.search(text) or _FOLLOW_UP.search(text):
+        return None
+    generic = _GENERIC.match(text)
+    if generic is None or _FIRST_PERSON.search(text[generic.end():]):
+        return None
+    return text.replace("'", '')
+
+def cache_stats():
+    """Size and hit rate of the shared reply cache."""
+    return _response_cache.stats()
+
+def invalidate_cache(question=None):
+    """
+    Drops one cached question (matched in normalized form) or, without one,
+    the whole cache.
 
+    Returns:
+        int: The number of entries dropped.
+    """
+    if question is None:
+        dropped = _response_cache.stats()['size']
+        _response_cache.clear()
+        return dropped
+    key = cache_key(question)
+    return 0 if key is None or _response_cache.pop(key) is None else 1
+
+def _cached_reply(user_message):
+    """(key, reply) for the message; reply is None on a miss or when uncacheable."""
+    key = cache_key(user_message)
+    if key is None or CHATBOT_CACHE_SIZE <= 0:
+        return None, None
+    return key, _response_cache.get(key)
+
+def _store_reply(key, reply):
+    if key is not None and reply:
+        _response_cache.set(key, reply, ttl=CHATBOT_CACHE_SECONDS)
 
-        prompt = f"""
+def _format_history(history):
+    """Prompt section for (summary lines, recent turns); empty for a new conversation."""
+    summary, turns = history or ([], [])
+    sections = []
+    if summary:
+        sections.append("Summary of the earlier conversation:\n" + '\n'.join(f"        - {line}" for line in summary))
+    if turns:
+        sections.append("Most recent messages:\n" + '\n'.join(
+            f"        User: {turn['user']}\n        SmartBot: {turn['bot']}" for turn in turns
+        ))
+    return '\n\n        '.join(sections)
+
+def build_prompt(user_message, balance_info, history=None):
+    """
+    The model prompt. Pass balance_info=None to leave account details out,
+    and history as returned by conversation_store.get_history to include it.
+    """
+    if balance_info is None:
+        context = "You do not have this user's account details; answer in general terms."
+    else:
+        context = f"Current User Context:\n        - Account Balance: {balance_info}"
+    conversation = _format_history(history)
+    if conversation:
+        context += "\n\n        " + conversation
+    return f"""
         You are "SmartBot", a friendly and professional AI banking assistant for SmartBank.
         Your user is currently logged into their account.
-        
-        Current User Context:
-        - Account Balance: {balance_info}
+
+        {context}
 
         Your primary goal is to be helpful and secure. Never ask for passwords or personal identification numbers (PINs).
         Always guide users to the correct section of the app to perform actions (e.g., "You can do this in the 'Transactions' section.").
@@ -52,11 +384,137 @@ def get_gemini_response(user_id, user_message):
         User's question: "{user_message}"
         """
 
-        response = model.generate_content(prompt)
-        return response.text
+def _model_prompt(user_id, user_message, key, account=None):
+    """
+    Generic (cacheable) questions are asked on their own, so the cached reply
+    depends on nothing but the question; others get the balance and history.
+    """
+    if key is not None:
+        return build_prompt(user_message, None)
+    return build_prompt(user_message, _balance_info(user_id, account), conversation_store.get_history(user_id))
+
+def get_gemini_response(user_id, user_message, account=None):
+    """
+    Generates a contextual response through the shared chatbot client and
+    adds the exchange to the user's conversation.
+    Returns a user-facing message instead of raising when the model is
+    offline, busy, slow or failing. Replies to generic questions are cached.
+    """
+    client = get_client()
+    if client is None:
+        return OFFLINE_MESSAGE
+
+    key = cache_key(user_message)
+    prompt = _model_prompt(user_id, user_message, key, account)
+    try:
+        reply = client.generate(prompt)
+    except ChatbotUnavailable as e:
+        return e.reply
+    _store_reply(key, reply)
+    conversation_store.record_turn(user_id, user_message, reply)
+    return reply
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chatbot_reply(user_id, user_message, account=None):
+    """
+    Streams the answer to a chat message as Server-Sent Events: one 'start'
+    event carrying the source (local, cache or model), 'delta' events with
+    text to append, and a final 'done'. A model failure after some text
+    ends with an 'error' event holding the message to show instead.
+    Answered messages are added to the user's conversation.
+
+    Returns:
+        generator of str: The SSE-formatted events.
+    """
+    started = time.perf_counter()
+    intent, reply = chatbot_intents.answer(user_id, user_message, account)
+    if reply is not None:
+        metrics.increment('chatbot.route.local')
+        metrics.increment(f'chatbot.intent.{intent}')
+        metrics.observe('chatbot.local', time.perf_counter() - started)
+
+        def local_events():
+            yield _sse('start', {'source': 'local', 'intent': intent})
+            yield _sse('delta', {'text': reply})
+            conversation_store.record_turn(user_id, user_message, reply)
+            yield _sse('done', {})
+        return local_events()
+
+    key, cached = _cached_reply(user_message)
+    if cached is not None:
+        metrics.increment('chatbot.route.cache')
+
+        def cached_events():
+            yield _sse('start', {'source': 'cache'})
+            yield _sse('delta', {'text': cached})
+            conversation_store.record_turn(user_id, user_message, cached)
+            yield _sse('done', {})
+        return cached_events()
+
+    metrics.increment('chatbot.route.model')
+    # Built before streaming starts, while the request's database context is at hand
+    prompt = _model_prompt(user_id, user_message, key, account)
+
+    def model_events():
+        yield _sse('start', {'source': 'model'})
+        client = get_client()
+        if client is None:
+            yield _sse('delta', {'text': OFFLINE_MESSAGE})
+            yield _sse('done', {})
+            return
+        parts = []
+        try:
+            for chunk in client.stream(prompt):
+                parts.append(chunk)
+                yield _sse('delta', {'text': chunk})
+        except ChatbotUnavailable as e:
+            # Before any text the message simply becomes the reply
+            yield _sse('error' if parts else 'delta', {'text': e.reply})
+        else:
+            _store_reply(key, ''.join(parts))
+            conversation_store.record_turn(user_id, user_message, ''.join(parts))
+        yield _sse('done', {})
+    return model_events()
+
+def get_chatbot_reply(user_id, user_message, account=None):
+    """
+    Answers a chat message, locally when it is a plain account question
+    (balance, recent transactions, spending) and through the model otherwise,
+    and adds the exchange to the user's conversation.
+
+    Returns:
+        dict: {'reply': str, 'source': 'local', 'cache' or 'model'}, plus
+        'intent' for local answers.
+    """
+    started = time.perf_counter()
+    intent, reply = chatbot_intents.answer(user_id, user_message, account)
+    if reply is not None:
+        metrics.increment('chatbot.route.local')
+        metrics.increment(f'chatbot.intent.{intent}')
+        metrics.observe('chatbot.local', time.perf_counter() - started)
+        conversation_store.record_turn(user_id, user_message, reply)
+        return {'reply': reply, 'source': 'local', 'intent': intent}
+    _, cached = _cached_reply(user_message)
+    if cached is not None:
+        metrics.increment('chatbot.route.cache')
+        conversation_store.record_turn(user_id, user_message, cached)
+        return {'reply': cached, 'source': 'cache'}
+    metrics.increment('chatbot.route.model')
+    return {'reply': get_gemini_response(user_id, user_message, account), 'source': 'model'}
 
-    except Exception as e:
-        print("ERROR: An error occurred while communicating with the Gemini API.")
-        # It's good practice to print the detailed traceback to the server console for debugging
-        traceback.print_exc() 
-        return "I'm sorry, I'm having trouble connecting to my brain right now. Please try again in a moment."
+def routing_stats():
+    """How many chat messages each path answered, and the share kept off the model."""
+    counters = metrics.snapshot(prefix='chatbot.route.')['counters']
+    local = counters.get('chatbot.route.local', 0)
+    cache = counters.get('chatbot.route.cache', 0)
+    model = counters.get('chatbot.route.model', 0)
+    total = local + cache + model
+    return {
+        'local': local,
+        'cache': cache,
+        'model': model,
+        'local_hit_rate': round(local / total, 3) if total else None,
+        'cache_hit_rate': round(cache / total, 3) if total else None,
+    }
@@ -0,0 +1,182 @@
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from database import db_instance
+from services.ttl_cache import TTLCache
+
+# --- Configuration ---
+# Each user's chatbot conversation keeps the last CHATBOT_HISTORY_TURNS
+# exchanges verbatim; older ones are folded into a compact rolling summary
+# capped at CHATBOT_SUMMARY_CHARS, so the history added to a prompt has a
+# fixed upper size however long the session runs.
+# 'mongo' keeps conversations in a TTL-indexed collection shared by all app
+# processes; 'memory' keeps up to CONVERSATION_MAX_USERS in this process.
+CONVERSATION_STORE = os.environ.get('CONVERSATION_STORE', 'mongo').lower()
+CHATBOT_HISTORY_TURNS = int(os.environ.get('CHATBOT_HISTORY_TURNS', 6))
+CHATBOT_SUMMARY_CHARS = int(os.environ.get('CHATBOT_SUMMARY_CHARS', 1200))
+# Longest message kept verbatim; longer ones are cut
+CHATBOT_TURN_CHARS = int(os.environ.get('CHATBOT_TURN_CHARS', 600))
+# Conversations idle for this long are forgotten
+CONVERSATION_TTL_SECONDS = int(os.environ.get('CONVERSATION_TTL_SECONDS', 3600))
+CONVERSATION_MAX_USERS = int(os.environ.get('CONVERSATION_MAX_USERS', 10000))
+CONVERSATIONS_COLLECTION = 'chatbot_conversations'
+# Attempts at an update that keeps losing the race to concurrent messages
+CONVERSATION_UPDATE_ATTEMPTS = 5
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def _empty_state():
+    return {'topics': [], 'summary': [], 'turns': []}
+
+class MongoConversationStore:
+    """
+    One document per user, keyed by user_id, removed by MongoDB when idle.
+    Updates are compare-and-swap on a version field, so concurrent messages
+    from the same user never overwrite each other's turns.
+    """
+    def _collection(self):
+        return db_instance.get_collection(CONVERSATIONS_COLLECTION)
+
+    def load(self, user_id):
+        collection = self._collection()
+        if collection is None:
+            return None
+        return collection.find_one(
+            {'_id': user_id, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'topics': 1, 'summary': 1, 'turns': 1}
+        )
+
+    def update(self, user_id, change, ttl_seconds):
+        collection = self._collection()
+        if collection is None:
+            return None
+        for _ in range(CONVERSATION_UPDATE_ATTEMPTS):
+            doc = collection.find_one({'_id': user_id})
+            live = doc is not None and doc.get('expires_at', datetime.min) > datetime.utcnow()
+            state = change({k: list(doc.get(k, [])) for k in _empty_state()} if live else _empty_state())
+            version = doc.get('version') if doc else None
+            fields = dict(
+                state,
+                version=(version or 0) + 1,
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds)
+            )
+            if doc is None:
+                try:
+                    collection.insert_one(dict(fields, _id=user_id))
+                    return True
+                except DuplicateKeyError:
+                    continue
+            # A missing version matches None, for documents written before versioning
+            if collection.update_one({'_id': user_id, 'version': version}, {'$set': fields}).matched_count:
+                return True
+        return False
+
+    def delete(self, user_id):
+        collection = self._collection()
+        if collection is not None:
+            collection.delete_one({'_id': user_id})
+
+class MemoryConversationStore:
+    """Process-local conversations; the least recently active are evicted first."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conversations = TTLCache(CONVERSATION_MAX_USERS)
+
+    def load(self, user_id):
+        return self._conversations.get(user_id)
+
+    def update(self, user_id, change, ttl_seconds):
+        with self._lock:
+            state = self._conversations.get(user_id) or _empty_state()
+            self._conversations.set(user_id, change({k: list(v) for k, v in state.items()}), ttl=ttl_seconds)
+        return True
+
+    def delete(self, user_id):
+        self._conversations.pop(user_id)
+
+_STORES = {
+    'mongo': MongoConversationStore,
+    'memory': MemoryConversationStore,
+}
+if CONVERSATION_STORE not in _STORES:
+    print(f"WARNING: Unknown CONVERSATION_STORE '{CONVERSATION_STORE}'. Falling back to 'mongo'.")
+_store = _STORES.get(CONVERSATION_STORE, MongoConversationStore)()
+
+def _clip(text, limit):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+def _gist(text, limit):
+    """The first sentence of text, cut to limit characters."""
+    text = ' '.join((text or '').split())
+    return _clip(_SENTENCE_END.split(text, 1)[0], limit)
+
+def _topics_line(topics):
+    return f"Earlier topics: {'; '.join(topics)}" if topics else None
+
+def _summary_size(state):
+    topics = _topics_line(state['topics'])
+    return sum(len(entry['gist']) + 1 for entry in state['summary']) + (len(topics) + 1 if topics else 0)
+
+def _fold(state, turn):
+    """
+    Moves one exchange out of the verbatim window into the summary, as a
+    one-line gist of both sides. While the summary is over its cap, the
+    oldest gists are compacted further to just the topic of the question;
+    only when nothing but topics is left are the oldest topics dropped.
+    """
+    state['summary'].append({
+        'topic': _gist(turn['user'], 60),
+        'gist': f"User asked: {_gist(turn['user'], 120)} SmartBot: {_gist(turn['bot'], 160)}",
+    })
+    while state['topics'] or state['summary']:
+        if _summary_size(state) <= CHATBOT_SUMMARY_CHARS:
+            break
+        if state['summary']:
+            state['topics'].append(state['summary'].pop(0)['topic'])
+        else:
+            state['topics'].pop(0)
+
+def get_history(user_id):
+    """
+    The user's conversation so far.
+
+    Returns:
+        tuple: (summary lines, recent turns as {'user', 'bot'} dicts), both
+        empty for a new or expired conversation.
+    """
+    try:
+        state = _store.load(str(user_id))
+    except Exception as e:
+        print(f"ERROR: Could not load chatbot conversation. Details: {e}")
+        state = None
+    if not state:
+        return [], []
+    topics = _topics_line(state.get('topics', []))
+    summary = ([topics] if topics else []) + [entry['gist'] for entry in state.get('summary', [])]
+    return summary, list(state.get('turns', []))
+
+def record_turn(user_id, user_message, reply):
+    """Appends an exchange, folding the oldest turns into the summary."""
+    turn = {'user': _clip(user_message, CHATBOT_TURN_CHARS), 'bot': _clip(reply, CHATBOT_TURN_CHARS)}
+
+    def append(state):
+        state['turns'].append(turn)
+        while len(state['turns']) > CHATBOT_HISTORY_TURNS:
+            _fold(state, state['turns'].pop(0))
+        return state
+
+    try:
+        if _store.update(str(user_id), append, CONVERSATION_TTL_SECONDS) is False:
+            print("WARNING: Chatbot conversation update kept conflicting; the turn was not saved.")
+    except Exception as e:
+        print(f"ERROR: Could not save chatbot conversation. Details: {e}")
+
+def clear(user_id):
+    """Forgets the user's conversation."""
+    try:
+        _store.delete(str(user_id))
+    except Exception as e:
+        print(f"ERROR: Could not clear chatbot conversation. Details: {e}")
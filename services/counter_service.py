@@ -0,0 +1,144 @@
+import os
+import random
+import threading
+import traceback
+from datetime import datetime
+from pymongo import UpdateOne
+from database import db_instance
+
+# --- Configuration ---
+COUNTERS_COLLECTION = 'counters'
+DASHBOARD_COUNTER_ID = 'dashboard'
+# Daily transaction counts are spread over several documents so concurrent
+# writers don't all update the same one.
+TRANSACTION_COUNTER_SHARDS = int(os.environ.get('TRANSACTION_COUNTER_SHARDS', 8))
+COUNTER_RECONCILE_SECONDS = int(os.environ.get('COUNTER_RECONCILE_SECONDS', 300))
+
+_reconciler_started = False
+_reconciler_lock = threading.Lock()
+
+def _get_counters_collection():
+    """Helper to get the counters collection."""
+    return db_instance.get_collection(COUNTERS_COLLECTION)
+
+def _start_of_day(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _day_shard_id(day, shard):
+    return f"tx:{day.strftime('%Y-%m-%d')}:{shard}"
+
+def increment(**deltas):
+    """
+    Adjusts the dashboard counters, e.g. increment(totalUsers=1, securityAlerts=1).
+    Counters are best-effort: a failure is logged and later fixed by reconcile().
+    """
+    counters_collection = _get_counters_collection()
+    if counters_collection is None:
+        return
+    try:
+        counters_collection.update_one({'_id': DASHBOARD_COUNTER_ID}, {'$inc': deltas}, upsert=True)
+    except Exception as e:
+        print(f"ERROR: Could not update dashboard counters. Details: {e}")
+
+def record_transactions(timestamp, count=1):
+    """
+    Counts ledger entries toward their day's total. Call it after the money
+    movement has committed so the shared counter never aborts a transfer.
+    """
+    counters_collection = _get_counters_collection()
+    if counters_collection is None:
+        return
+    day = _start_of_day(timestamp)
+    try:
+        counters_collection.update_one(
+            {'_id': _day_shard_id(day, random.randrange(TRANSACTION_COUNTER_SHARDS))},
+            {'$inc': {'count': count}, '$setOnInsert': {'day': day}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"ERROR: Could not update transaction counter. Details: {e}")
+
+def read_dashboard_counters():
+    """
+    Reads the dashboard totals and today's transaction count in one query.
+
+    Returns:
+        dict or None: The counters, or None if they have never been reconciled.
+    """
+    counters_collection = _get_counters_collection()
+    if counters_collection is None:
+        return None
+
+    today = _start_of_day(datetime.utcnow())
+    ids = [DASHBOARD_COUNTER_ID] + [_day_shard_id(today, i) for i in range(TRANSACTION_COUNTER_SHARDS)]
+    dashboard = None
+    transactions_today = 0
+    for doc in counters_collection.find({'_id': {'$in': ids}}):
+        if doc['_id'] == DASHBOARD_COUNTER_ID:
+            dashboard = doc
+        else:
+            transactions_today += doc.get('count', 0)
+
+    # Increments alone can't be trusted until a full count has seeded the totals
+    if dashboard is None or 'reconciled_at' not in dashboard:
+        return None
+    return {
+        'totalUsers': dashboard.get('totalUsers', 0),
+        'totalAccounts': dashboard.get('totalAccounts', 0),
+        'transactionsToday': transactions_today,
+        'securityAlerts': dashboard.get('securityAlerts', 0)
+    }
+
+def reconcile():
+    """
+    Recounts every dashboard counter from the source collections and
+    overwrites the stored values, correcting any drift.
+    """
+    counters_collection = _get_counters_collection()
+    users_collection = db_instance.get_collection('users')
+    accounts_collection = db_instance.get_collection('accounts')
+    transactions_collection = db_instance.get_collection('transactions')
+    if counters_collection is None or users_collection is None or accounts_collection is None or transactions_collection is None:
+        return None
+
+    today = _start_of_day(datetime.utcnow())
+    totals = {
+        'totalUsers': users_collection.count_documents({'is_admin': False}),
+        'totalAccounts': accounts_collection.count_documents({}),
+        'securityAlerts': users_collection.count_documents({'status': 'pending'}),
+        'reconciled_at': datetime.utcnow()
+    }
+    transactions_today = transactions_collection.count_documents({'timestamp': {'$gte': today}})
+
+    counters_collection.update_one({'_id': DASHBOARD_COUNTER_ID}, {'$set': totals}, upsert=True)
+    # Collapse today's shards into shard 0 holding the recounted total
+    counters_collection.bulk_write([
+        UpdateOne(
+            {'_id': _day_shard_id(today, i)},
+            {'$set': {'count': transactions_today if i == 0 else 0, 'day': today}},
+            upsert=True
+        )
+        for i in range(TRANSACTION_COUNTER_SHARDS)
+    ], ordered=False)
+
+    totals.pop('reconciled_at')
+    totals['transactionsToday'] = transactions_today
+    return totals
+
+def _reconcile_loop(interval):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        try:
+            reconcile()
+        except Exception as e:
+            print(f"ERROR: Counter reconciliation failed. Details: {e}")
+            traceback.print_exc()
+
+def start_reconciler(interval=COUNTER_RECONCILE_SECONDS):
+    """Starts the background thread that periodically reconciles the counters."""
+    global _reconciler_started
+    with _reconciler_lock:
+        if _reconciler_started or interval <= 0:
+            return
+        _reconciler_started = True
+    threading.Thread(target=_reconcile_loop, args=(interval,), name='counter-reconciler', daemon=True).start()
@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from database import db_instance
+from services import account_service, metrics, transaction_service, user_service
+from services.account_context import AccountContext
+
+# --- Configuration ---
+# The dashboard's independent reads run side by side on this many threads
+DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 4))
+DASHBOARD_RECENT_TRANSACTIONS = int(os.environ.get('DASHBOARD_RECENT_TRANSACTIONS', 5))
+MAX_DASHBOARD_RECENT_TRANSACTIONS = 20
+# Sections the dashboard view does not show, returned only on request
+OPTIONAL_SECTIONS = {'profile', 'insights'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """Lazily creates the shared thread pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+        return _executor
+
+def _resolve_account(user_id, account=None):
+    """
+    The caller's account context, from the token when available and
+    otherwise from a single lookup, so the parallel reads never repeat it.
+    """
+    if account is not None:
+        return account
+    accounts_collection = db_instance.get_collection('accounts')
+    if accounts_collection is None:
+        return None
+    found = accounts_collection.find_one({'user_id': ObjectId(user_id)}, {'account_number': 1})
+    return AccountContext(found['_id'], found['account_number']) if found else None
+
+def _section(future):
+    """(response, status) of one read, turning an exception into a 500 error."""
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"ERROR: Dashboard section failed to load. Details: {e}")
+        return {'message': 'Failed to load'}, 500
+
+def get_dashboard(user_id, account=None, recent=None, include=()):
+    """
+    What the user dashboard shows, in one response: the account and its
+    most recent transactions, plus the profile and spending by category
+    when asked for through include.
+
+    Args:
+        user_id (str): The logged-in user.
+        account (AccountContext): Optional account context from the token.
+        recent (int): How many recent transactions to include (at most 20).
+        include (iterable): Optional extra sections, 'profile' and/or 'insights'.
+
+    Returns:
+        tuple: (dict, status). Sections other than the account that fail to
+        load are returned as None, with their error message under 'errors'.
+    """
+    try:
+        recent = int(recent) if recent is not None else DASHBOARD_RECENT_TRANSACTIONS
+    except (ValueError, TypeError):
+        return {'message': 'Invalid recent value'}, 400
+    recent = max(1, min(recent, MAX_DASHBOARD_RECENT_TRANSACTIONS))
+    include = set(include or ())
+    if not include <= OPTIONAL_SECTIONS:
+        return {'message': f"Unknown section. Use {', '.join(sorted(OPTIONAL_SECTIONS))}."}, 400
+
+    with metrics.timer('dashboard.load'):
+        account = _resolve_account(user_id, account)
+        if account is None:
+            return {'message': 'Account not found'}, 404
+
+        executor = _get_executor()
+        futures = {
+            'account': executor.submit(account_service.get_account_by_user_id, user_id, account),
+            'recent_transactions': executor.submit(
+                transaction_service.get_transactions_by_user_id, user_id, recent, None, account
+            ),
+        }
+        if 'profile' in include:
+            futures['profile'] = executor.submit(user_service.get_user_profile, user_id)
+        if 'insights' in include:
+            futures['insights'] = executor.submit(
+                transaction_service.get_spending_insights, user_id, None, None, account
+            )
+        results = {name: _section(future) for name, future in futures.items()}
+
+    response, status_code = results.pop('account')
+    if status_code != 200:
+        return response, status_code
+
+    dashboard = {'account': response['account'], 'errors': {}}
+    for name, (response, status_code) in results.items():
+        if status_code != 200:
+            dashboard[name] = None
+            dashboard['errors'][name] = response.get('message', 'Failed to load')
+        elif name == 'profile':
+            dashboard[name] = response['profile']
+        elif name == 'recent_transactions':
+            dashboard[name] = response['transactions']
+        else:
+            dashboard[name] = response
+    return dashboard, 200
@@ -1,14 +1,82 @@
+import os
+import time
+import hashlib
 import jwt
 from functools import wraps
 from flask import jsonify, request, g
-import os
-from dotenv import load_dotenv
+from services import auth_service, account_context, metrics, token_revocation
+from services.ttl_cache import TTLCache
+
+# --- Configuration ---
+# Verified access-token claims are cached per process, keyed by a digest of
+# the token and expiring with the token, so repeat requests skip the
+# signature check. Revocation cutoffs are still checked on every request.
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+
+_verified_claims = TTLCache(AUTH_CACHE_SIZE)
+# Tokens revoked in this process (e.g. on logout), until they would expire
+# anyway; each entry holds the token's user_id
+_revoked_tokens = TTLCache(AUTH_CACHE_SIZE)
+
+def _digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+def _verify(token):
+    """
+    Returns the claims of a valid access token, from the cache when possible.
+    Raises the same errors as auth_service.decode_access_token.
+    """
+    key = _digest(token)
+    if _revoked_tokens.get(key):
+        raise auth_service.TokenRevoked('Token has been revoked')
+    claims = _verified_claims.get(key)
+    if claims is None:
+        metrics.increment('auth.cache.misses')
+        claims = auth_service.decode_access_token(token)
+        _verified_claims.set(key, claims, expires_at=claims['exp'])
+        return claims
+    metrics.increment('auth.cache.hits')
+    if token_revocation.is_revoked(claims):
+        _verified_claims.pop(key)
+        raise auth_service.TokenRevoked('Token has been revoked')
+    return claims
+
+def revoke_token(token):
+    """Rejects a single access token in this process from now until it expires."""
+    key = _digest(token)
+    _verified_claims.pop(key)
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return
+    if claims.get('exp'):
+        _revoked_tokens.set(key, str(claims.get('user_id')), expires_at=claims['exp'])
+
+def invalidate(user_id=None):
+    """
+    Drops this process's cached verifications and revoked-token entries in
+    bulk, for one user or for everyone (e.g. after rotating SECRET_KEY), so
+    their next requests are fully re-verified. Logouts also revoke their
+    session (see token_revocation), so tokens dropped from the revoked set
+    stay rejected.
 
-# Load environment variables
-load_dotenv()
+    Returns:
+        dict: How many 'verified' and 'revoked' entries were dropped.
+    """
+    if user_id is None:
+        dropped = {'verified': _verified_claims.stats()['size'], 'revoked': _revoked_tokens.stats()['size']}
+        _verified_claims.clear()
+        _revoked_tokens.clear()
+        return dropped
+    user_id = str(user_id)
+    return {
+        'verified': _verified_claims.discard_where(lambda claims: claims.get('user_id') == user_id),
+        'revoked': _revoked_tokens.discard_where(lambda owner: owner == user_id),
+    }
 
-# Get SECRET_KEY from environment variables with a fallback
-SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secure-and-long-secret-key-that-you-should-change')
+def auth_cache_stats():
+    """Sizes and hit rates of the verified-token cache."""
+    return {'verified': _verified_claims.stats(), 'revoked': _revoked_tokens.stats()}
 
 def token_required(f):
     """Decorator to require a valid JWT token."""
@@ -17,14 +85,24 @@ def token_required(f):
         token = request.headers.get('x-access-token')
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
+        started = time.perf_counter()
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            data = _verify(token)
             g.current_user_id = data['user_id']
             g.is_admin = data.get('is_admin', False)
+            g.session_id = data.get('sid')
+            g.account = account_context.from_claims(data)
         except jwt.ExpiredSignatureError:
+            metrics.increment('auth.rejected')
             return jsonify({'message': 'Token has expired!'}), 401
+        except auth_service.TokenRevoked:
+            metrics.increment('auth.rejected')
+            return jsonify({'message': 'Token has been revoked!'}), 401
         except Exception:
+            metrics.increment('auth.rejected')
             return jsonify({'message': 'Token is invalid!'}), 401
+        finally:
+            metrics.observe('auth.verify', time.perf_counter() - started)
         return f(*args, **kwargs)
     return decorated
 
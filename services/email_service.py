@@ -1,16 +1,20 @@
-import os
-import smtplib
 from email.message import EmailMessage
+from services import mail_dispatcher, twofa_store
+
+def _describe_lifetime(seconds):
+    """'10 minutes', '1 minute' or '45 seconds'."""
+    if seconds >= 60 and seconds % 60 == 0:
+        minutes = seconds // 60
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    return f"{seconds} second{'s' if seconds != 1 else ''}"
 
 def send_2fa_code(to_email, code):
-    """Sends a 2FA code to the specified email address."""
-    
-    email_host = os.environ.get('EMAIL_HOST')
-    email_port = int(os.environ.get('EMAIL_PORT', 465))
-    email_user = os.environ.get('EMAIL_USER')
-    email_pass = os.environ.get('EMAIL_PASS')
-
-    if not all([email_host, email_port, email_user, email_pass]):
+    """
+    Queues a 2FA code email for the specified address. Delivery happens on the
+    mail dispatcher's background connection, so this returns without waiting
+    on SMTP.
+    """
+    if not mail_dispatcher.is_configured():
         print("\n" + "="*50)
         print("WARNING: Email service is not configured in .env file.")
         print(f"FALLBACK 2FA Code for {to_email}: {code}")
@@ -24,7 +28,7 @@ def send_2fa_code(to_email, code):
 
     Your two-factor authentication code is: {code}
 
-    This code will expire in 10 minutes.
+    This code will expire in {_describe_lifetime(twofa_store.TWOFA_CODE_TTL_SECONDS)}.
 
     If you did not request this code, please secure your account immediately.
 
@@ -35,18 +39,10 @@ def send_2fa_code(to_email, code):
     msg = EmailMessage()
     msg.set_content(body)
     msg['Subject'] = subject
-    msg['From'] = email_user
+    msg['From'] = mail_dispatcher.sender()
     msg['To'] = to_email
 
-    try:
-        with smtplib.SMTP_SSL(email_host, email_port) as server:
-            server.login(email_user, email_pass)
-            server.send_message(msg)
-            print(f"2FA code successfully sent to {to_email}")
-            return True
-    except smtplib.SMTPAuthenticationError:
-        print("ERROR: SMTP Authentication failed. Check your EMAIL_USER and EMAIL_PASS credentials in the .env file. If using Gmail, ensure you have an 'App Password'.")
-        return False
-    except Exception as e:
-        print(f"ERROR: Failed to send 2FA email. Details: {e}")
+    if not mail_dispatcher.enqueue(msg):
+        print(f"ERROR: Could not queue 2FA email for {to_email}.")
         return False
+    return True
@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import threading
+import traceback
+from pymongo import UpdateOne
+from database import db_instance
+from services.transaction_runner import run_transaction
+
+# --- Configuration ---
+# A hot account (one that receives many concurrent credits, e.g. a merchant)
+# takes its incoming credits on N sub-balance documents in balance_shards
+# instead of on its accounts document. Its balance is the account's own
+# balance plus the sum of its shards; a periodic fold moves the shard totals
+# back into the account.
+SHARDS_COLLECTION = 'balance_shards'
+MAX_HOT_SHARDS = int(os.environ.get('MAX_HOT_SHARDS', 64))
+# How often each process reloads the set of hot accounts
+HOT_ACCOUNT_REFRESH_SECONDS = float(os.environ.get('HOT_ACCOUNT_REFRESH_SECONDS', 30))
+# How long a hot account's shard total is served from memory for balance reads
+HOT_BALANCE_CACHE_SECONDS = float(os.environ.get('HOT_BALANCE_CACHE_SECONDS', 2))
+BALANCE_FOLD_SECONDS = int(os.environ.get('BALANCE_FOLD_SECONDS', 60))
+
+_hot_lock = threading.Lock()
+_hot_accounts = {}  # account_number -> shard count
+_hot_loaded_at = None
+_balance_cache = {}  # account_number -> (expires_at, shard total)
+_folder_started = False
+
+def _get_shards_collection():
+    """Helper to get the balance shards collection."""
+    return db_instance.get_collection(SHARDS_COLLECTION)
+
+def _load_hot_accounts():
+    accounts_collection = db_instance.get_collection('accounts')
+    if accounts_collection is None:
+        return None
+    try:
+        return {
+            account['account_number']: account['hot_shards']
+            for account in accounts_collection.find(
+                {'hot_shards': {'$gt': 0}}, {'account_number': 1, 'hot_shards': 1}
+            )
+        }
+    except Exception as e:
+        print(f"ERROR: Could not load hot accounts. Details: {e}")
+        return None
+
+def hot_shard_count(account_number):
+    """
+    Number of credit shards for an account, or 0 if it is not in hot mode.
+    Served from a map each process reloads every HOT_ACCOUNT_REFRESH_SECONDS,
+    so the check costs no database round trip on the credit path.
+    """
+    global _hot_accounts, _hot_loaded_at
+    if not account_number:
+        return 0
+    now = time.monotonic()
+    with _hot_lock:
+        stale = _hot_loaded_at is None or now - _hot_loaded_at > HOT_ACCOUNT_REFRESH_SECONDS
+    if stale:
+        loaded = _load_hot_accounts()
+        with _hot_lock:
+            if loaded is not None:
+                _hot_accounts = loaded
+            # On a failed load keep the old map and wait a full interval before retrying
+            _hot_loaded_at = now
+    with _hot_lock:
+        return _hot_accounts.get(account_number, 0)
+
+def credit_shard(account_number, shards, amount, session):
+    """
+    Adds amount to one randomly chosen shard of a hot account, so concurrent
+    credits land on different documents.
+
+    Returns:
+        bool: False if the shard document is missing; the caller then credits
+        the account itself.
+    """
+    shards_collection = _get_shards_collection()
+    if shards_collection is None:
+        return False
+    result = shards_collection.update_one(
+        {'account_number': account_number, 'shard': random.randrange(shards)},
+        {'$inc': {'balance': amount}},
+        session=session
+    )
+    return result.matched_count == 1
+
+def shard_total(account_number, session=None):
+    """Sum of an account's shard balances, read inside session if given."""
+    shards_collection = _get_shards_collection()
+    if shards_collection is None:
+        return 0.0
+    return sum(
+        shard.get('balance', 0)
+        for shard in shards_collection.find({'account_number': account_number}, {'balance': 1}, session=session)
+    )
+
+def _cached_shard_total(account_number):
+    now = time.monotonic()
+    with _hot_lock:
+        cached = _balance_cache.get(account_number)
+        if cached and cached[0] > now:
+            return cached[1]
+    total = shard_total(account_number)
+    with _hot_lock:
+        _balance_cache[account_number] = (now + HOT_BALANCE_CACHE_SECONDS, total)
+    return total
+
+def effective_balance(account):
+    """
+    The balance to report for an account document. Accounts that have ever
+    been in hot mode (they carry a hot_shards field) add their shard total,
+    cached for HOT_BALANCE_CACHE_SECONDS.
+    """
+    balance = account.get('balance', 0)
+    if 'hot_shards' in account:
+        balance += _cached_shard_total(account['account_number'])
+    return balance
+
+def fold_account(account_number):
+    """
+    Moves an account's shard balances into the account document in one
+    transaction. Concurrent credits to a shard conflict with the fold and the
+    runner retries it.
+
+    Returns:
+        float: The amount folded.
+    """
+    shards_collection = _get_shards_collection()
+    accounts_collection = db_instance.get_collection('accounts')
+    if shards_collection is None or accounts_collection is None:
+        return 0.0
+
+    def apply_fold(session):
+        shards = list(shards_collection.find(
+            {'account_number': account_number, 'balance': {'$ne': 0}}, {'balance': 1}, session=session
+        ))
+        if not shards:
+            return 0.0
+        total = sum(shard['balance'] for shard in shards)
+        shards_collection.bulk_write(
+            [UpdateOne({'_id': shard['_id']}, {'$inc': {'balance': -shard['balance']}}) for shard in shards],
+            ordered=False, session=session
+        )
+        accounts_collection.update_one({'account_number': account_number}, {'$inc': {'balance': total}}, session=session)
+        return total
+
+    folded = run_transaction('balance_fold', apply_fold)
+    with _hot_lock:
+        _balance_cache.pop(account_number, None)
+    return folded
+
+def fold_all():
+    """
+    Folds every account with a non-zero shard balance.
+
+    Returns:
+        int: The number of accounts folded.
+    """
+    shards_collection = _get_shards_collection()
+    if shards_collection is None:
+        return 0
+    folded = 0
+    for account_number in shards_collection.distinct('account_number', {'balance': {'$ne': 0}}):
+        try:
+            fold_account(account_number)
+            folded += 1
+        except Exception as e:
+            print(f"ERROR: Could not fold balance shards for {account_number}. Details: {e}")
+    return folded
+
+def set_hot_mode(account_number, shards):
+    """
+    Enables hot mode with the given number of credit shards, or disables it
+    when shards is 0. Other processes pick the change up within
+    HOT_ACCOUNT_REFRESH_SECONDS.
+    """
+    accounts_collection = db_instance.get_collection('accounts')
+    shards_collection = _get_shards_collection()
+    if accounts_collection is None or shards_collection is None:
+        return {'message': 'Database connection error'}, 500
+
+    try:
+        shards = int(shards)
+    except (ValueError, TypeError):
+        return {'message': 'Invalid shard count'}, 400
+    if not 0 <= shards <= MAX_HOT_SHARDS:
+        return {'message': f'shards must be between 0 and {MAX_HOT_SHARDS}'}, 400
+
+    if accounts_collection.find_one({'account_number': account_number}, {'_id': 1}) is None:
+        return {'message': 'Account not found'}, 404
+
+    if shards:
+        # Create the shard documents up front so credits never need an upsert
+        shards_collection.bulk_write([
+            UpdateOne(
+                {'account_number': account_number, 'shard': i},
+                {'$setOnInsert': {'balance': 0.0}},
+                upsert=True
+            )
+            for i in range(shards)
+        ], ordered=False)
+    # hot_shards stays on the account when disabled (0) so balance reads keep
+    # counting any credits still in flight to its shards.
+    accounts_collection.update_one({'account_number': account_number}, {'$set': {'hot_shards': shards}})
+
+    with _hot_lock:
+        if shards:
+            _hot_accounts[account_number] = shards
+        else:
+            _hot_accounts.pop(account_number, None)
+    if not shards:
+        fold_account(account_number)
+    return {'message': 'Hot mode updated', 'account_number': account_number, 'shards': shards}, 200
+
+def _fold_loop(interval):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        try:
+            fold_all()
+        except Exception as e:
+            print(f"ERROR: Balance shard fold failed. Details: {e}")
+            traceback.print_exc()
+
+def start_folder(interval=BALANCE_FOLD_SECONDS):
+    """Starts the background thread that periodically folds shard balances."""
+    global _folder_started
+    with _hot_lock:
+        if _folder_started or interval <= 0:
+            return
+        _folder_started = True
+    threading.Thread(target=_fold_loop, args=(interval,), name='balance-folder', daemon=True).start()
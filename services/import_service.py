@@ -0,0 +1,253 @@
+import io
+import csv
+import os
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReturnDocument
+from database import db_instance
+from services import counter_service, hot_accounts, metrics
+from services.transaction_service import TransactionAborted, participants_for
+from services.transaction_runner import run_transaction
+
+# --- Configuration ---
+IMPORTS_COLLECTION = 'imports'
+# Rows parsed, validated and committed together; bounds memory per import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+# Rejected rows kept on the import record (the count covers all of them)
+MAX_REJECTED_SAMPLES = 100
+# A running import with no checkpoint for this long is treated as abandoned
+# (its process died) and may be resumed
+IMPORT_STALE_SECONDS = int(os.environ.get('IMPORT_STALE_SECONDS', 600))
+CSV_COLUMNS = ('account_number', 'amount', 'description')
+
+def _get_imports_collection():
+    """Helper to get the imports collection."""
+    return db_instance.get_collection(IMPORTS_COLLECTION)
+
+def _serialize_import(record):
+    """Public view of an import record, including throughput."""
+    elapsed = record.get('elapsed_seconds', 0)
+    return {
+        'import_id': record['_id'],
+        'status': record['status'],
+        'filename': record.get('filename'),
+        'rows_processed': record.get('rows_processed', 0),
+        'applied': record.get('applied', 0),
+        'rejected_count': record.get('rejected_count', 0),
+        'rejected': record.get('rejected', []),
+        'total_amount': record.get('total_amount', 0),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(record.get('rows_processed', 0) / elapsed, 1) if elapsed else None,
+        'error': record.get('error'),
+        'started_at': record['started_at'].isoformat(),
+        'finished_at': record['finished_at'].isoformat() if record.get('finished_at') else None,
+    }
+
+def _parse_row(row):
+    """
+    Validates one CSV row.
+
+    Returns:
+        tuple: ((account_number, amount, description), None) or (None, reason).
+    """
+    account_number = (row.get('account_number') or '').strip()
+    if not account_number:
+        return None, 'Missing account_number'
+    try:
+        amount = float(row.get('amount'))
+    except (ValueError, TypeError):
+        return None, 'Invalid amount'
+    if not math.isfinite(amount) or amount <= 0:
+        return None, 'Amount must be positive'
+    description = (row.get('description') or '').strip() or 'Bulk Deposit'
+    return (account_number, round(amount, 2), description), None
+
+def _apply_chunk(import_id, chunk, rows_processed):
+    """
+    Validates a chunk of (row_number, row) pairs against one account prefetch
+    and commits its deposits together with the import checkpoint, so a
+    resumed import never applies a row twice.
+
+    Returns:
+        int: The number of deposits applied.
+    """
+    imports_collection = _get_imports_collection()
+    accounts_collection = db_instance.get_collection('accounts')
+    transactions_collection = db_instance.get_collection('transactions')
+
+    deposits, rejected = [], []
+    for row_number, row in chunk:
+        parsed, reason = _parse_row(row)
+        if reason:
+            rejected.append({'row': row_number, 'reason': reason})
+        else:
+            deposits.append((row_number,) + parsed)
+
+    numbers = list({account_number for _, account_number, _, _ in deposits})
+    known = {
+        account['account_number']
+        for account in accounts_collection.find({'account_number': {'$in': numbers}}, {'account_number': 1})
+    } if numbers else set()
+    for row_number, account_number, _, _ in deposits:
+        if account_number not in known:
+            rejected.append({'row': row_number, 'reason': 'Account not found'})
+    deposits = [d for d in deposits if d[1] in known]
+    rejected.sort(key=lambda r: r['row'])
+    now = datetime.utcnow()
+
+    def apply_deposits(session):
+        if deposits:
+            credits = {}
+            for _, account_number, amount, _ in deposits:
+                credits[account_number] = credits.get(account_number, 0) + amount
+            operations = []
+            for account_number, amount in credits.items():
+                shards = hot_accounts.hot_shard_count(account_number)
+                if not (shards and hot_accounts.credit_shard(account_number, shards, amount, session)):
+                    operations.append(UpdateOne({'account_number': account_number}, {'$inc': {'balance': amount}}))
+            if operations:
+                result = accounts_collection.bulk_write(operations, ordered=False, session=session)
+                if result.matched_count != len(operations):
+                    raise TransactionAborted({'message': 'An account disappeared during import'}, 409)
+            transactions_collection.insert_many([
+                {
+                    'from_account': 'N/A',
+                    'to_account': account_number,
+                    'participants': participants_for(account_number),
+                    'amount': amount,
+                    'type': 'Deposit',
+                    'description': description,
+                    'timestamp': now
+                }
+                for _, account_number, amount, description in deposits
+            ], session=session)
+
+        # The checkpoint commits with the chunk it describes
+        update = {
+            '$set': {'rows_processed': rows_processed, 'updated_at': now},
+            '$inc': {
+                'applied': len(deposits),
+                'rejected_count': len(rejected),
+                'total_amount': sum(amount for _, _, amount, _ in deposits)
+            }
+        }
+        if rejected:
+            update['$push'] = {'rejected': {'$each': rejected, '$slice': MAX_REJECTED_SAMPLES}}
+        imports_collection.update_one({'_id': import_id}, update, session=session)
+
+    run_transaction('import_chunk', apply_deposits)
+    if deposits:
+        counter_service.record_transactions(now, count=len(deposits))
+    metrics.increment('imports.rows', len(chunk))
+    metrics.increment('imports.deposits', len(deposits))
+    return len(deposits)
+
+def import_deposits(stream, filename=None, import_id=None):
+    """
+    Streams a CSV of account_number, amount, description rows into deposits.
+
+    The file is read row by row and applied in chunks of IMPORT_CHUNK_SIZE,
+    each in its own transaction with a checkpoint on the import record. If an
+    import fails, upload the same file again with its import_id: rows already
+    committed are skipped.
+
+    Args:
+        stream: A binary file-like object with the CSV (header row required).
+        filename (str): Optional name recorded on the import.
+        import_id (str): Optional id of an earlier import to resume.
+
+    Returns:
+        tuple: The import record with counts and throughput, and a status code.
+    """
+    imports_collection = _get_imports_collection()
+    if imports_collection is None or db_instance.get_collection('accounts') is None:
+        return {'message': 'Database connection error'}, 500
+
+    if import_id:
+        # Claiming the import is one atomic status change, so two uploads
+        # resuming the same import_id cannot both apply its chunks
+        stale = datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+        record = imports_collection.find_one_and_update(
+            {'_id': import_id, '$or': [
+                {'status': 'failed'},
+                {'status': 'running', 'updated_at': {'$lt': stale}},
+            ]},
+            {'$set': {'status': 'running', 'error': None, 'updated_at': datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if record is None:
+            record = imports_collection.find_one({'_id': import_id})
+            if record is None:
+                return {'message': 'Import not found'}, 404
+            if record['status'] == 'completed':
+                return {'message': 'Import already completed', 'import': _serialize_import(record)}, 409
+            return {'message': 'Import is already running', 'import': _serialize_import(record)}, 409
+    else:
+        record = {
+            '_id': uuid.uuid4().hex,
+            'status': 'running',
+            'filename': filename,
+            'rows_processed': 0,
+            'applied': 0,
+            'rejected_count': 0,
+            'rejected': [],
+            'total_amount': 0.0,
+            'elapsed_seconds': 0.0,
+            'error': None,
+            'started_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow(),
+            'finished_at': None,
+        }
+        imports_collection.insert_one(record)
+        import_id = record['_id']
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    started = time.perf_counter()
+    skip = record.get('rows_processed', 0)
+    rows_processed = 0
+    chunk = []
+    try:
+        missing = [c for c in CSV_COLUMNS[:2] if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+        for row in reader:
+            rows_processed += 1
+            if rows_processed <= skip:
+                continue
+            chunk.append((rows_processed, row))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                _apply_chunk(import_id, chunk, rows_processed)
+                chunk = []
+        if chunk:
+            _apply_chunk(import_id, chunk, rows_processed)
+        status, error, status_code = 'completed', None, 200
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        status, error, status_code = 'failed', f'Invalid CSV: {e}', 400
+    except Exception as e:
+        print(f"ERROR: Deposit import {import_id} failed. Details: {e}")
+        status, error, status_code = 'failed', 'Import failed. Upload the same file with this import_id to resume.', 500
+    finally:
+        text.detach()
+
+    record = imports_collection.find_one_and_update(
+        {'_id': import_id},
+        {
+            '$set': {'status': status, 'error': error, 'finished_at': datetime.utcnow() if status == 'completed' else None},
+            '$inc': {'elapsed_seconds': time.perf_counter() - started}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    return {'import': _serialize_import(record)}, status_code
+
+def get_import(import_id):
+    """Returns the progress of a deposit import."""
+    imports_collection = _get_imports_collection()
+    if imports_collection is None:
+        return {'message': 'Database connection error'}, 500
+    record = imports_collection.find_one({'_id': import_id})
+    if record is None:
+        return {'message': 'Import not found'}, 404
+    return {'import': _serialize_import(record)}, 200
@@ -0,0 +1,164 @@
+import re
+from datetime import datetime
+from pymongo import UpdateOne, IndexModel
+from database import db_instance, INDEX_SPECS
+
+# Rollup period used for the running all-time totals
+ALL_TIME = 'all'
+ROLLUPS_COLLECTION = 'spending_rollups'
+_MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+def _get_rollups_collection():
+    """Helper to get the spending rollups collection."""
+    return db_instance.get_collection(ROLLUPS_COLLECTION)
+
+def _month_key(timestamp):
+    """Rollup period for a timestamp, e.g. '2026-10'."""
+    return timestamp.strftime('%Y-%m')
+
+def _recent_months(count, now=None):
+    """The last `count` month keys, current month first."""
+    now = now or datetime.utcnow()
+    year, month = now.year, now.month
+    keys = []
+    for _ in range(count):
+        keys.append(f"{year:04d}-{month:02d}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return keys
+
+def _spend_operations(account_number, category, amount, timestamp, count=1):
+    """Upserts that add one spend to its monthly and all-time counters."""
+    return [
+        UpdateOne(
+            {'account_number': account_number, 'period': period, 'category': category},
+            {'$inc': {'total': amount, 'count': count}},
+            upsert=True
+        )
+        for period in (_month_key(timestamp), ALL_TIME)
+    ]
+
+def record_spend(account_number, category, amount, timestamp, session=None):
+    """
+    Adds an outgoing payment to the account's per-category rollups.
+    Call it with the same session as the ledger insert so both commit together.
+    """
+    record_spend_many([(account_number, category, amount, timestamp)], session=session)
+
+def record_spend_many(entries, session=None):
+    """
+    Applies several (account_number, category, amount, timestamp) spends in one
+    bulk write. Spends that share an account, category and month are merged
+    first, so a large batch touches each rollup document once.
+    """
+    rollups_collection = _get_rollups_collection()
+    if rollups_collection is None or not entries:
+        return
+    merged = {}
+    for account_number, category, amount, timestamp in entries:
+        key = (account_number, category, _month_key(timestamp))
+        total, count, _ = merged.get(key, (0, 0, timestamp))
+        merged[key] = (total + amount, count + 1, timestamp)
+    operations = []
+    for (account_number, category, _), (total, count, timestamp) in merged.items():
+        operations.extend(_spend_operations(account_number, category, total, timestamp, count=count))
+    rollups_collection.bulk_write(operations, ordered=False, session=session)
+
+def get_insights(account_number, months=None, month=None):
+    """
+    Reads spending per category from the rollups.
+
+    Args:
+        account_number (str): The account to report on.
+        months (int): Optional window of the last N months (including this one).
+        month (str): Optional single month, 'YYYY-MM'. Defaults to all time.
+    """
+    rollups_collection = _get_rollups_collection()
+    if rollups_collection is None:
+        return {'message': 'Database connection error'}, 500
+
+    if month:
+        if not _MONTH_PATTERN.match(month):
+            return {'message': 'Invalid month. Use YYYY-MM.'}, 400
+        periods = [month]
+    elif months:
+        try:
+            months = int(months)
+        except (ValueError, TypeError):
+            return {'message': 'Invalid months value'}, 400
+        if not 1 <= months <= 120:
+            return {'message': 'months must be between 1 and 120'}, 400
+        periods = _recent_months(months)
+    else:
+        periods = [ALL_TIME]
+
+    totals = {}
+    for rollup in rollups_collection.find(
+        {'account_number': account_number, 'period': {'$in': periods}},
+        {'category': 1, 'total': 1}
+    ):
+        totals[rollup['category']] = totals.get(rollup['category'], 0) + rollup['total']
+
+    # Format the results for Chart.js, largest category first
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'labels': [category for category, _ in ranked],
+        'data': [total for _, total in ranked],
+        'periods': periods
+    }, 200
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Recomputes every rollup from the raw transactions into a staging collection,
+    then swaps it in with a single rename. Spends committed while the rebuild
+    runs are not reflected, so run it when writes are quiet.
+
+    Returns:
+        int: The number of rollup documents in the rebuilt collection.
+    """
+    transactions_collection = db_instance.get_collection('transactions')
+    if transactions_collection is None:
+        return 0
+
+    staging_name = f"{ROLLUPS_COLLECTION}_rebuild"
+    staging = db_instance.db[staging_name]
+    staging.drop()
+    staging.create_indexes([
+        IndexModel(spec['keys'], **{k: v for k, v in spec.items() if k != 'keys'})
+        for spec in INDEX_SPECS[ROLLUPS_COLLECTION]
+    ])
+
+    # Money leaves an account on transfers, bill payments and withdrawals;
+    # deposits carry from_account 'N/A'.
+    pipeline = [
+        {'$match': {'from_account': {'$nin': [None, 'N/A']}}},
+        {'$group': {
+            '_id': {
+                'account_number': '$from_account',
+                'category': '$type',
+                'period': {'$dateToString': {'format': '%Y-%m', 'date': '$timestamp'}}
+            },
+            'total': {'$sum': '$amount'},
+            'count': {'$sum': 1}
+        }}
+    ]
+
+    operations = []
+    for group in transactions_collection.aggregate(pipeline, allowDiskUse=True):
+        key = group['_id']
+        for period in (key['period'], ALL_TIME):
+            operations.append(UpdateOne(
+                {'account_number': key['account_number'], 'period': period, 'category': key['category']},
+                {'$inc': {'total': group['total'], 'count': group['count']}},
+                upsert=True
+            ))
+        if len(operations) >= batch_size:
+            staging.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        staging.bulk_write(operations, ordered=False)
+
+    rebuilt = staging.count_documents({})
+    staging.rename(ROLLUPS_COLLECTION, dropTarget=True)
+    return rebuilt
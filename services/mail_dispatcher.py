@@ -0,0 +1,218 @@
+import os
+import time
+import queue
+import smtplib
+import threading
+from collections import namedtuple
+from services import metrics
+
+# --- Configuration ---
+# Read from the environment when the dispatcher starts (on the first
+# enqueue), not at import, so tests can point it at a local SMTP stand-in.
+#   EMAIL_HOST, EMAIL_PORT (465), EMAIL_USER, EMAIL_PASS
+#   EMAIL_SECURITY: 'ssl' (implicit TLS, e.g. Gmail on 465), 'starttls' (587)
+#       or 'none' (plain SMTP, e.g. a local aiosmtpd stand-in). Login is
+#       skipped when EMAIL_PASS is empty.
+#   MAIL_WORKERS (2): sender threads, each keeping its own SMTP connection
+#       open between messages
+#   MAIL_BATCH_SIZE (20): messages a worker takes off the queue and sends
+#       over one connection in a row
+#   MAIL_MAX_ATTEMPTS (3), MAIL_RETRY_DELAY (2 s, growing per attempt)
+#   MAIL_IDLE_TIMEOUT (30 s): an idle connection is closed rather than left
+#       for the server to drop
+#   SMTP_TIMEOUT (10 s)
+MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', 1000))
+
+MailSettings = namedtuple('MailSettings', [
+    'host', 'port', 'user', 'password', 'security', 'workers', 'batch_size',
+    'max_attempts', 'retry_delay', 'idle_timeout', 'smtp_timeout',
+])
+
+def _load_settings():
+    return MailSettings(
+        host=os.environ.get('EMAIL_HOST'),
+        port=int(os.environ.get('EMAIL_PORT', 465)),
+        user=os.environ.get('EMAIL_USER'),
+        password=os.environ.get('EMAIL_PASS'),
+        security=os.environ.get('EMAIL_SECURITY', 'ssl').lower(),
+        workers=int(os.environ.get('MAIL_WORKERS', 2)),
+        batch_size=int(os.environ.get('MAIL_BATCH_SIZE', 20)),
+        max_attempts=int(os.environ.get('MAIL_MAX_ATTEMPTS', 3)),
+        retry_delay=float(os.environ.get('MAIL_RETRY_DELAY', 2)),
+        idle_timeout=float(os.environ.get('MAIL_IDLE_TIMEOUT', 30)),
+        smtp_timeout=float(os.environ.get('SMTP_TIMEOUT', 10)),
+    )
+
+_queue = queue.Queue(maxsize=MAIL_QUEUE_SIZE)
+_state_lock = threading.Lock()
+_settings = None  # set once the workers start
+_pending_retries = 0
+
+def settings():
+    """The settings in use, or those the dispatcher would start with."""
+    return _settings or _load_settings()
+
+def is_configured():
+    """True if an SMTP server and sender address are set."""
+    current = settings()
+    return bool(current.host and current.user)
+
+def sender():
+    """The From address for outgoing mail."""
+    return settings().user
+
+def _connect():
+    """Opens and authenticates a new SMTP connection."""
+    config = _settings
+    if config.security == 'ssl':
+        server = smtplib.SMTP_SSL(config.host, config.port, timeout=config.smtp_timeout)
+    else:
+        server = smtplib.SMTP(config.host, config.port, timeout=config.smtp_timeout)
+        if config.security == 'starttls':
+            server.starttls()
+    if config.password:
+        server.login(config.user, config.password)
+    metrics.increment('mail.connects')
+    return server
+
+def _close(server):
+    """Closes a connection, ignoring errors from one that is already gone."""
+    if server is not None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+    return None
+
+def _schedule_retry(message, attempt):
+    """Re-queues a failed message after a growing delay, off the worker thread."""
+    global _pending_retries
+
+    def requeue():
+        global _pending_retries
+        # Put the message back before the retry stops counting as pending, so
+        # flush() never sees an empty queue while the retry is in between
+        if not _put(message, attempt):
+            metrics.increment('mail.failed')
+            print(f"ERROR: Mail queue is full; giving up on retrying email to {message['To']}.")
+        with _state_lock:
+            _pending_retries -= 1
+
+    with _state_lock:
+        _pending_retries += 1
+    metrics.increment('mail.retries')
+    timer = threading.Timer(_settings.retry_delay * attempt, requeue)
+    timer.daemon = True
+    timer.start()
+
+def _deliver(server, message, attempt):
+    """
+    Sends one message over the worker's connection, reconnecting once if the
+    server dropped it while idle.
+
+    Returns:
+        The connection to keep using (None after a failure).
+    """
+    for reconnected in (False, True):
+        try:
+            if server is None:
+                server = _connect()
+            with metrics.timer('mail.send'):
+                server.send_message(message)
+            metrics.increment('mail.sent')
+            return server
+        except smtplib.SMTPServerDisconnected:
+            server = _close(server)
+            if reconnected:
+                break
+        except smtplib.SMTPAuthenticationError:
+            print("ERROR: SMTP Authentication failed. Check your EMAIL_USER and EMAIL_PASS credentials in the .env file. If using Gmail, ensure you have an 'App Password'.")
+            server = _close(server)
+            break
+        except Exception as e:
+            print(f"ERROR: Failed to send email to {message['To']}. Details: {e}")
+            server = _close(server)
+            break
+
+    if attempt < _settings.max_attempts:
+        _schedule_retry(message, attempt + 1)
+    else:
+        metrics.increment('mail.failed')
+        print(f"ERROR: Giving up on email to {message['To']} after {attempt} attempts.")
+    return server
+
+def _worker_loop():
+    server = None
+    while True:
+        try:
+            batch = [_queue.get(timeout=_settings.idle_timeout)]
+        except queue.Empty:
+            server = _close(server)
+            continue
+        while len(batch) < _settings.batch_size:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        for message, attempt in batch:
+            try:
+                server = _deliver(server, message, attempt)
+            finally:
+                _queue.task_done()
+
+def start():
+    """
+    Reads the settings from the environment and starts the sender threads.
+    Called by the first enqueue; later calls do nothing.
+    """
+    global _settings
+    with _state_lock:
+        if _settings is not None:
+            return
+        _settings = _load_settings()
+    for i in range(max(1, _settings.workers)):
+        threading.Thread(target=_worker_loop, name=f"mail-dispatcher-{i}", daemon=True).start()
+
+def _put(message, attempt):
+    """Adds a message to the queue; False if the queue is full."""
+    try:
+        _queue.put_nowait((message, attempt))
+        return True
+    except queue.Full:
+        return False
+
+def enqueue(message):
+    """
+    Queues an EmailMessage for background delivery and returns immediately.
+
+    Returns:
+        bool: False if the queue is full.
+    """
+    start()
+    if not _put(message, 1):
+        metrics.increment('mail.dropped')
+        print(f"ERROR: Mail queue is full; dropping email to {message['To']}.")
+        return False
+    metrics.increment('mail.enqueued')
+    return True
+
+def flush(timeout=None):
+    """
+    Waits until every queued message (including scheduled retries) has been
+    sent or given up on. Mainly for tests and shutdown.
+
+    Returns:
+        bool: False if the timeout expired first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _state_lock:
+            idle = _queue.unfinished_tasks == 0 and _pending_retries == 0
+        if idle:
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
@@ -0,0 +1,62 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# In-process metrics registry: monotonically increasing counters and timing
+# summaries, exposed to admins through /api/admin/metrics.
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+def increment(name, amount=1):
+    """Adds amount to the named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def observe(name, seconds):
+    """Records one duration sample for the named timing."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['total'] += seconds
+        if seconds > timing['max']:
+            timing['max'] = seconds
+
+@contextmanager
+def timer(name):
+    """Times the enclosed block and records it under name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def snapshot(prefix=None):
+    """
+    Returns a JSON-serializable copy of the current metrics,
+    optionally limited to names starting with prefix.
+    """
+    with _lock:
+        counters = {
+            name: value for name, value in _counters.items()
+            if prefix is None or name.startswith(prefix)
+        }
+        timings = {
+            name: {
+                'count': t['count'],
+                'avg_ms': round(t['total'] / t['count'] * 1000, 3) if t['count'] else 0.0,
+                'max_ms': round(t['max'] * 1000, 3),
+            }
+            for name, t in _timings.items()
+            if prefix is None or name.startswith(prefix)
+        }
+    return {'counters': counters, 'timings': timings}
+
+def reset(prefix=None):
+    """Clears metrics, optionally only those starting with prefix."""
+    with _lock:
+        for store in (_counters, _timings):
+            for name in [n for n in store if prefix is None or n.startswith(prefix)]:
+                del store[name]
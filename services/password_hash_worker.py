@@ -0,0 +1,18 @@
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# The functions password_hasher runs in its worker processes. Workers
+# unpickle them by importing this module, so it must not import the
+# database, the app or anything else with side effects.
+
+def generate(password, method):
+    """Returns (hash, seconds spent hashing)."""
+    start = time.perf_counter()
+    hashed = generate_password_hash(password, method=method)
+    return hashed, time.perf_counter() - start
+
+def check(stored_hash, password):
+    """Returns (matches, seconds spent hashing)."""
+    start = time.perf_counter()
+    matches = check_password_hash(stored_hash, password)
+    return matches, time.perf_counter() - start
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+from services import metrics, password_hash_worker
+
+# --- Configuration ---
+# pbkdf2 work factor for new hashes, defaulting to werkzeug's. Raising it
+# rehashes each user's password the next time they log in; stored hashes
+# with a higher count are never rehashed downward.
+PASSWORD_HASH_ALGORITHM = 'pbkdf2:sha256'
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS))
+PASSWORD_HASH_METHOD = f"{PASSWORD_HASH_ALGORITHM}:{PASSWORD_HASH_ITERATIONS}"
+# Worker processes for hashing; 0 hashes on the calling thread (development)
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+# Hashes allowed to be queued or running at once; beyond this requests are shed
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', max(1, PASSWORD_HASH_WORKERS) * 4))
+# Seconds a request waits for its hash before giving up
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_executor = None
+_executor_lock = threading.Lock()
+
+class HashingUnavailable(Exception):
+    """Raised when the hashing pool is saturated; callers answer 503."""
+
+def _get_executor():
+    """Lazily creates the bounded worker pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 'spawn' starts each worker as a fresh interpreter, so it inherits none of
+            # the parent's sockets, threads or held locks. It does re-import the main
+            # module: under `python app.py` that runs app.py's top level (and opens a
+            # MongoDB client) once per worker. The hashing itself lives in
+            # password_hash_worker, which imports nothing beyond werkzeug.
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+def _run(operation, func, *args):
+    """
+    Runs one hash in the pool, shedding the request immediately if
+    PASSWORD_HASH_MAX_PENDING hashes are already queued or running.
+    Records the time spent hashing and the end-to-end wait under
+    'password_hash.<operation>.*'.
+    """
+    if not _slots.acquire(blocking=False):
+        metrics.increment(f"password_hash.{operation}.shed")
+        raise HashingUnavailable('Password hashing pool is full')
+
+    started = time.perf_counter()
+    if PASSWORD_HASH_WORKERS <= 0:
+        try:
+            result, seconds = func(*args)
+        finally:
+            _slots.release()
+    else:
+        try:
+            future = _get_executor().submit(func, *args)
+        except BrokenProcessPool:
+            _slots.release()
+            _reset_executor()
+            raise HashingUnavailable('Password hashing pool restarted')
+        # The slot frees when the work finishes, even if this request stops waiting
+        future.add_done_callback(lambda _: _slots.release())
+        try:
+            result, seconds = future.result(timeout=PASSWORD_HASH_TIMEOUT)
+        except FutureTimeoutError:
+            metrics.increment(f"password_hash.{operation}.timeouts")
+            raise HashingUnavailable('Password hashing timed out')
+        except BrokenProcessPool:
+            _reset_executor()
+            raise HashingUnavailable('Password hashing pool restarted')
+
+    metrics.observe(f"password_hash.{operation}.compute", seconds)
+    metrics.observe(f"password_hash.{operation}.total", time.perf_counter() - started)
+    return result
+
+def hash_password(password):
+    """Hashes a password with the configured work factor."""
+    return _run('generate', password_hash_worker.generate, password, PASSWORD_HASH_METHOD)
+
+def verify_password(stored_hash, password):
+    """Checks a password against a stored hash."""
+    if not stored_hash:
+        return False
+    return _run('verify', password_hash_worker.check, stored_hash, password)
+
+def _parse_method(stored_hash):
+    """
+    Splits a werkzeug hash prefix such as 'pbkdf2:sha256:1000000' into
+    ('pbkdf2:sha256', 1000000). The count is None when it is not recorded.
+    """
+    method = stored_hash.split('$', 1)[0]
+    algorithm, _, iterations = method.rpartition(':')
+    if algorithm and iterations.isdigit():
+        return algorithm, int(iterations)
+    return method, None
+
+def needs_rehash(stored_hash):
+    """
+    True if a stored hash uses a different method, or pbkdf2 with fewer
+    iterations than configured. A stronger stored hash is left alone.
+    """
+    if not stored_hash:
+        return False
+    algorithm, iterations = _parse_method(stored_hash)
+    if algorithm != PASSWORD_HASH_ALGORITHM:
+        return True
+    # Without a recorded count werkzeug applies its own default
+    stored = iterations if iterations is not None else DEFAULT_PBKDF2_ITERATIONS
+    return stored < PASSWORD_HASH_ITERATIONS
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from services import report_service, transaction_service
+
+# --- Configuration ---
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+# Jobs allowed to be queued or running at once before new submissions are refused
+REPORT_MAX_PENDING = int(os.environ.get('REPORT_MAX_PENDING', 8))
+# Seconds a finished artifact (or failed job) is kept before cleanup
+REPORT_ARTIFACT_TTL = int(os.environ.get('REPORT_ARTIFACT_TTL', 3600))
+REPORT_ARTIFACT_DIR = os.environ.get(
+    'REPORT_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'smartbank_reports')
+)
+
+# format -> (mimetype, file extension)
+REPORT_FORMATS = {
+    'pdf': ('application/pdf', 'pdf'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Job registry for this process. Jobs are tracked in memory, so submit, poll and
+# download must reach the same server process (true for `python app.py`).
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+def _get_executor():
+    """Lazily creates the bounded worker pool."""
+    global _executor
+    if _executor is None:
+        # 'spawn' gives each worker its own MongoDB client instead of a forked copy
+        _executor = ProcessPoolExecutor(
+            max_workers=REPORT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+def _render_report(report_format, start_date, end_date, path):
+    """
+    Runs in a worker process: renders one report to path using the
+    report_service renderers. The file only appears once it is complete.
+    """
+    partial_path = path + '.part'
+    # The partial file is how the server process sees that the job has started
+    open(partial_path, 'wb').close()
+    try:
+        if report_format == 'pdf':
+            with open(partial_path, 'wb') as output:
+                result, status_code = report_service.write_transaction_report_pdf(
+                    output, start_date=start_date, end_date=end_date
+                )
+        else:
+            result, status_code = report_service.stream_transaction_report_csv(start_date, end_date)
+            if status_code == 200:
+                with open(partial_path, 'w', newline='', encoding='utf-8') as output:
+                    for chunk in result:
+                        output.write(chunk)
+                result = {'message': 'Report generated'}
+
+        if status_code != 200:
+            return result, status_code
+        os.replace(partial_path, path)
+        return result, status_code
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def _spec_key(report_format, start_date, end_date):
+    """Cache key for a report spec: identical specs share one artifact."""
+    spec = json.dumps([report_format, start_date or '', end_date or ''])
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+def _refresh_status(job):
+    """Marks a queued job as running once its worker has started it. Call with _jobs_lock held."""
+    if job['status'] == 'queued' and os.path.exists(job['path'] + '.part'):
+        job['status'] = 'running'
+
+def _reusable(job, key):
+    """
+    Whether a submission for key can share this job. A finished report is
+    reused only if its range ended before today (UTC); one that reaches
+    today or has no end_date would miss transactions made after it ran.
+    In-flight jobs are always shared.
+    """
+    if job['key'] != key:
+        return False
+    if job['status'] in ('queued', 'running'):
+        return True
+    if job['status'] != 'done' or not job['end_date']:
+        return False
+    # The exclusive upper bound the report was built with
+    end = transaction_service.build_transaction_query(None, job['end_date'])['timestamp']['$lt']
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    start_of_today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return end <= start_of_today
+
+def _serialize_job(job):
+    """Public view of a job record."""
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'format': job['format'],
+        'start_date': job['start_date'],
+        'end_date': job['end_date'],
+        'created_at': job['created_at'].isoformat(),
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+        'error': job['error'],
+    }
+
+def _on_job_done(job_id, future):
+    """Records the outcome of a finished render."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job['finished_at'] = datetime.utcnow()
+        job['finished_mono'] = time.monotonic()
+        try:
+            result, status_code = future.result()
+        except Exception as e:
+            print(f"ERROR: Report job {job_id} failed. Details: {e}")
+            job['status'] = 'failed'
+            job['error'] = 'Report generation failed.'
+            return
+        if status_code == 200:
+            job['status'] = 'done'
+        else:
+            job['status'] = 'failed'
+            job['error'] = result.get('message', 'Report generation failed.')
+
+def _remove_artifact(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"ERROR: Could not remove report artifact {path}. Details: {e}")
+
+def purge_expired():
+    """Drops finished jobs past their TTL and deletes their artifacts from disk."""
+    now = time.monotonic()
+    expired = []
+    with _jobs_lock:
+        for job_id, job in list(_jobs.items()):
+            if job['finished_mono'] is not None and now - job['finished_mono'] > REPORT_ARTIFACT_TTL:
+                expired.append(job['path'])
+                del _jobs[job_id]
+    for path in expired:
+        _remove_artifact(path)
+
+    # Also sweep artifacts left behind by earlier server processes
+    if os.path.isdir(REPORT_ARTIFACT_DIR):
+        cutoff = time.time() - REPORT_ARTIFACT_TTL
+        with _jobs_lock:
+            live_paths = {job['path'] for job in _jobs.values()}
+        for name in os.listdir(REPORT_ARTIFACT_DIR):
+            path = os.path.join(REPORT_ARTIFACT_DIR, name)
+            try:
+                if path not in live_paths and os.path.getmtime(path) < cutoff:
+                    _remove_artifact(path)
+            except OSError:
+                continue
+
+def submit_report_job(report_format, start_date=None, end_date=None, refresh=False):
+    """
+    Queues a report render and returns its job record.
+    A finished, unexpired artifact (or an in-flight job) for the same spec is
+    reused unless refresh is set; a report whose range reaches today (or has
+    no end_date) is only shared while in flight.
+    """
+    if report_format not in REPORT_FORMATS:
+        return {'message': 'Invalid format. Use pdf or csv.'}, 400
+    try:
+        # Validate dates up front so bad input fails fast instead of in a worker
+        transaction_service.build_transaction_query(start_date, end_date)
+    except ValueError as e:
+        return {'message': f'Invalid date format provided: {e}'}, 400
+
+    purge_expired()
+    key = _spec_key(report_format, start_date, end_date)
+
+    with _jobs_lock:
+        if not refresh:
+            for job in _jobs.values():
+                if _reusable(job, key):
+                    _refresh_status(job)
+                    return {'job': _serialize_job(job), 'cached': True}, 200
+
+        pending = sum(1 for job in _jobs.values() if job['status'] in ('queued', 'running'))
+        if pending >= REPORT_MAX_PENDING:
+            return {'message': 'Too many reports are being generated. Please try again shortly.'}, 503
+
+        os.makedirs(REPORT_ARTIFACT_DIR, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        _, extension = REPORT_FORMATS[report_format]
+        job = {
+            'job_id': job_id,
+            'key': key,
+            'status': 'queued',
+            'format': report_format,
+            'start_date': start_date,
+            'end_date': end_date,
+            'path': os.path.join(REPORT_ARTIFACT_DIR, f"{job_id}.{extension}"),
+            'created_at': datetime.utcnow(),
+            'finished_at': None,
+            'finished_mono': None,
+            'error': None,
+        }
+        _jobs[job_id] = job
+
+    try:
+        future = _get_executor().submit(_render_report, report_format, start_date, end_date, job['path'])
+    except Exception as e:
+        print(f"ERROR: Could not queue report job. Details: {e}")
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        return {'message': 'Could not queue report job.'}, 500
+
+    future.add_done_callback(lambda f: _on_job_done(job_id, f))
+    return {'job': _serialize_job(job), 'cached': False}, 202
+
+def get_report_job(job_id):
+    """Returns the status of a report job."""
+    purge_expired()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {'message': 'Report job not found'}, 404
+        _refresh_status(job)
+        return {'job': _serialize_job(job)}, 200
+
+def get_report_artifact(job_id):
+    """
+    Locates the artifact of a finished job.
+
+    Returns:
+        tuple: ({'path', 'mimetype', 'filename'}, 200) or (error dict, status code).
+    """
+    purge_expired()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {'message': 'Report job not found'}, 404
+        if job['status'] == 'failed':
+            return {'message': job['error']}, 422
+        if job['status'] != 'done':
+            return {'message': 'Report is not ready yet'}, 409
+        mimetype, extension = REPORT_FORMATS[job['format']]
+        path = job['path']
+
+    if not os.path.exists(path):
+        return {'message': 'Report artifact has expired'}, 410
+    return {'path': path, 'mimetype': mimetype, 'filename': f"transactions_report.{extension}"}, 200
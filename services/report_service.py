@@ -1,5 +1,9 @@
 import io
+import os
+import time
+import threading
 from datetime import datetime, timedelta
+from itertools import chain, islice
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
@@ -11,201 +15,279 @@ import csv # Added for CSV functionality
 # Import the database instance to allow querying MongoDB
 from database import db_instance
 # Import transaction service to utilize its data fetching and CSV logic
-from services import transaction_service
+from services import transaction_service, counter_service
 
-def generate_transaction_report_pdf(transactions, start_date=None, end_date=None):
-    """
-    Generates a PDF report of all transactions using ReportLab (pure Python solution).
+# Seconds the admin dashboard stats are served from memory before re-reading the counters
+DASHBOARD_STATS_TTL = float(os.environ.get('DASHBOARD_STATS_TTL', 5))
+_stats_cache = {'value': None, 'expires': 0.0}
+_stats_cache_lock = threading.Lock()
 
-    Args:
-        transactions (list): A list of transaction dictionaries.
-        start_date (str): The start date for the report (optional).
-        end_date (str): The end date for the report (optional).
+# --- PDF Report Engine ---
+# Built once and shared by every render: the stylesheet, the table layout and a
+# single banding style (instead of one BACKGROUND command per row).
+_PDF_STYLES = getSampleStyleSheet()
+PDF_HEADER = ['ID (Short)', 'Date/Time', 'From Account', 'To Account', 'Type', 'Amount', 'Description']
+# Adjusted column widths for A4 (A4 width is ~510pts with 30pt margins)
+PDF_COL_WIDTHS = [60, 90, 80, 80, 50, 70, 100]
+# Rows per table chunk; a chunk fills roughly one A4 page at this font size
+PDF_ROWS_PER_TABLE = 36
+_PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#DC2626')), # Header background (Admin Red)
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#DDDDDD')),
+    ('LEFTPADDING', (0, 0), (-1, -1), 3),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F9F9F9')]),
+])
+# Fields read off the cursor for the PDF table
+PDF_PROJECTION = {
+    'timestamp': 1, 'from_account': 1, 'to_account': 1,
+    'amount': 1, 'type': 1, 'description': 1
+}
 
-    Returns:
-        bytes: The raw PDF data as bytes.
+class _FlowableStream(list):
     """
-    buffer = io.BytesIO()
-    # Use a smaller margin for better use of space on A4
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=50, bottomMargin=30, leftMargin=30, rightMargin=30)
-    styles = getSampleStyleSheet()
-    Story = []
+    A story list that pulls flowables from an iterator as ReportLab consumes it.
+
+    This relies on BaseDocTemplate.build() (ReportLab 3.x to 5.x) looping on
+    `while len(flowables):` and taking flowables[0] off the front each time,
+    so len() is the one place to top the list up. Only the flowable being
+    laid out (plus any split remainder) is held in memory. If a ReportLab
+    upgrade stops polling len(), the build ends early; exhausted stays False
+    and generate_transaction_report_pdf fails instead of writing a short PDF.
+    """
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+        self.exhausted = False
 
-    # --- 1. Title and Header Information ---
+    def __len__(self):
+        if not super().__len__() and not self.exhausted:
+            flowable = next(self._source, None)
+            if flowable is None:
+                self.exhausted = True
+            else:
+                self.append(flowable)
+        return super().__len__()
+
+def _pdf_row(tx):
+    """Formats one transaction as a PDF table row."""
+    tx_id_short = str(tx.get('_id', 'N/A'))[:8] + '...'
+    amount_str = f"₹{tx.get('amount', 0.0):.2f}"
+
+    timestamp_obj = tx.get('timestamp')
+    if isinstance(timestamp_obj, str):
+        # If it's a string (due to serialization), parse it first
+        try:
+            # Handle ISO format including optional 'Z' and ensure timezone info is handled
+            timestamp_obj = datetime.fromisoformat(timestamp_obj.replace('Z', '+00:00'))
+        except ValueError:
+            timestamp_obj = None
+
+    timestamp_str = timestamp_obj.strftime('%Y-%m-%d %H:%M') if timestamp_obj else 'N/A'
+
+    return [
+        tx_id_short,
+        timestamp_str,
+        tx.get('from_account', 'N/A'),
+        tx.get('to_account', 'N/A'),
+        tx.get('type', 'N/A'),
+        amount_str,
+        tx.get('description', '')
+    ]
+
+def _pdf_story(transactions, start_date, end_date):
+    """Yields the report flowables: a title block, then fixed-size table chunks."""
     report_date = datetime.utcnow().strftime('%Y-%m-%d')
-    
-    # Use different styles for better visual hierarchy
-    Story.append(Paragraph("<b>SmartBank Transaction Report</b>", styles['Heading1']))
-    Story.append(Paragraph(f"Generated on: {report_date}", styles['Normal']))
-    
+    yield Paragraph("<b>SmartBank Transaction Report</b>", _PDF_STYLES['Heading1'])
+    yield Paragraph(f"Generated on: {report_date}", _PDF_STYLES['Normal'])
+
     date_filter_text = ""
     if start_date or end_date:
         start = start_date if start_date else 'Start'
         end = end_date if end_date else 'End'
         date_filter_text = f"Filtered Range: {start} to {end}"
-    
-    Story.append(Paragraph(date_filter_text, styles['Normal']))
-    Story.append(Paragraph("<br/>", styles['Normal'])) # Spacer
-
-    # --- 2. Table Data ---
-    table_data = []
-    
-    # Header Row
-    table_data.append([
-        'ID (Short)', 'Date/Time', 'From Account', 'To Account', 'Type', 'Amount', 'Description'
-    ])
-
-    # Data Rows
-    for tx in transactions:
-        tx_id_short = str(tx.get('_id', 'N/A'))[:8] + '...'
-        amount_str = f"₹{tx.get('amount', 0.0):.2f}"
-        
-        timestamp_obj = tx.get('timestamp')
-        if isinstance(timestamp_obj, str):
-            # If it's a string (due to serialization), parse it first
-            try:
-                # Handle ISO format including optional 'Z' and ensure timezone info is handled
-                timestamp_obj = datetime.fromisoformat(timestamp_obj.replace('Z', '+00:00'))
-            except ValueError:
-                timestamp_obj = None
-
-        timestamp_str = timestamp_obj.strftime('%Y-%m-%d %H:%M') if timestamp_obj else 'N/A'
-
-        table_data.append([
-            tx_id_short,
-            timestamp_str,
-            tx.get('from_account', 'N/A'),
-            tx.get('to_account', 'N/A'),
-            tx.get('type', 'N/A'),
-            amount_str,
-            tx.get('description', '')
-        ])
+    yield Paragraph(date_filter_text, _PDF_STYLES['Normal'])
+    yield Paragraph("<br/>", _PDF_STYLES['Normal']) # Spacer
 
-    # --- 3. Table Style and Creation ---
-    # Adjusted column widths for A4 (A4 width is ~510pts with 30pt margins)
-    col_widths = [60, 90, 80, 80, 50, 70, 100]
-    table = Table(table_data, colWidths=col_widths)
-    
-    # Determine the color based on the transaction type for each row
-    table_style = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#DC2626')), # Header background (Admin Red)
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#DDDDDD')),
-        ('LEFTPADDING', (0, 0), (-1, -1), 3),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 3),
-    ]
+    rows = iter(transactions)
+    while True:
+        chunk = [_pdf_row(tx) for tx in islice(rows, PDF_ROWS_PER_TABLE)]
+        if not chunk:
+            break
+        # repeatRows keeps the header on any page a chunk spills onto
+        table = Table([PDF_HEADER] + chunk, colWidths=PDF_COL_WIDTHS, repeatRows=1)
+        table.setStyle(_PDF_TABLE_STYLE)
+        yield table
+
+def _draw_page_number(canv, doc):
+    """Page footer shared by every page of the report."""
+    canv.saveState()
+    canv.setFont('Helvetica', 8)
+    canv.drawRightString(A4[0] - 30, 15, f"Page {doc.page}")
+    canv.restoreState()
+
+def generate_transaction_report_pdf(transactions, start_date=None, end_date=None, output=None):
+    """
+    Generates a PDF report of transactions using ReportLab (pure Python solution).
 
-    for i in range(1, len(table_data)):
-        tx_type = table_data[i][4] # 'Type' column is at index 4
-        if tx_type in ['Deposit']:
-            table_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#E6FFED'))) # Light Green
-        elif tx_type in ['Withdrawal', 'Bill Payment']:
-            table_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#FFECE6'))) # Light Red/Orange
-        else:
-             table_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#F9F9F9'))) # Light Gray for transfers
+    Transactions are consumed lazily and laid out in fixed-size tables, so
+    memory stays bounded for very large reports when output is a file.
 
-    table.setStyle(TableStyle(table_style))
-    Story.append(table)
+    Args:
+        transactions (iterable): Transaction dictionaries, e.g. a cursor-backed iterator.
+        start_date (str): The start date for the report (optional).
+        end_date (str): The end date for the report (optional).
+        output (file-like): Optional binary file to write into.
+
+    Returns:
+        bytes: The raw PDF data when no output is given, otherwise None.
+    """
+    target = output if output is not None else io.BytesIO()
+    # Use a smaller margin for better use of space on A4
+    doc = SimpleDocTemplate(target, pagesize=A4, topMargin=50, bottomMargin=30, leftMargin=30, rightMargin=30)
 
-    # --- 4. Build Document ---
+    story = _FlowableStream(_pdf_story(transactions, start_date, end_date))
     try:
-        doc.build(Story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        doc.build(story, onFirstPage=_draw_page_number, onLaterPages=_draw_page_number)
+        if not story.exhausted:
+            raise RuntimeError('ReportLab stopped before the whole story was laid out')
     except Exception as e:
         print(f"ERROR: ReportLab document build failed. Details: {e}")
         traceback.print_exc()
         # Raise a RuntimeError which is caught by the blueprint
         raise RuntimeError(f"PDF generation failed during document assembly: {e}")
 
-# FIX: Add the missing CSV generation function. 
-# We call the logic from transaction_service.py which handles the actual data query.
-def generate_transaction_report_csv(start_date=None, end_date=None):
+    if output is None:
+        return target.getvalue()
+    return None
+
+def write_transaction_report_pdf(output, start_date=None, end_date=None):
     """
-    Generates a CSV report of all transactions by delegating to transaction_service.
-    
-    Args:
-        start_date (str): Optional start date for filtering (ISO format).
-        end_date (str): Optional end date for filtering (ISO format).
+    Renders the PDF report for a date range straight from a batched cursor into output.
 
     Returns:
-        str: The CSV data as a string.
+        tuple: (result dict, status code). Raises RuntimeError if rendering fails.
+    """
+    if db_instance.get_collection('transactions') is None:
+        return {'message': 'Database connection error'}, 500
+    try:
+        query = transaction_service.build_transaction_query(start_date, end_date)
+    except ValueError as e:
+        return {'message': f'Invalid date format provided: {e}'}, 400
+
+    transactions = transaction_service.iter_transactions(query, projection=PDF_PROJECTION)
+    first = next(transactions, None)
+    if first is None:
+        return {'message': 'No transactions found to generate a report.'}, 404
+
+    generate_transaction_report_pdf(chain([first], transactions), start_date=start_date, end_date=end_date, output=output)
+    return {'message': 'Report generated'}, 200
+
+# Column order shared by the header and every data row of the CSV export
+CSV_HEADER = ['ID', 'Date', 'From Account', 'To Account', 'Amount', 'Type', 'Description']
+
+# Only the fields the CSV needs are read off the cursor
+_CSV_PROJECTION = {
+    'timestamp': 1, 'from_account': 1, 'to_account': 1,
+    'amount': 1, 'type': 1, 'description': 1
+}
+
+def iter_transaction_report_csv(query, batch_size=1000):
+    """
+    Yields the CSV report in chunks of roughly batch_size rows.
+
+    Rows are read from a projected, batched cursor and written into a small
+    reusable buffer, so memory stays flat however many rows are exported.
     """
-    # Fetch data and generate CSV using transaction_service's utility
-    # Note: If transaction_service.py doesn't have this function, we must implement it fully here.
-    # Based on the typical project structure, the full implementation is included below 
-    # to make report_service self-contained for reporting functions.
-    
-    transactions_response, status_code = transaction_service.get_all_transactions(start_date, end_date)
-    
-    if status_code != 200 or not transactions_response['transactions']:
-        # Return CSV headers only if no transactions are found
-        return "ID,Date,From,To,Amount,Type,Description\n"
-
-    transactions = transactions_response['transactions']
-    
     output = io.StringIO()
     writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
 
-    # Write header
-    writer.writerow(['ID', 'Date', 'From Account', 'To Account', 'Amount', 'Type', 'Description'])
-
-    # Write data rows
-    for tx in transactions:
+    rows_in_chunk = 0
+    for tx in transaction_service.iter_transactions(query, projection=_CSV_PROJECTION, batch_size=batch_size):
         writer.writerow([
-            str(tx.get('_id')),
+            tx.get('_id'),
             tx.get('timestamp'),
             tx.get('from_account', 'N/A'),
             tx.get('to_account', 'N/A'),
-            tx.get('type', 'N/A'),
             f"₹{tx.get('amount', 0.0):.2f}",
+            tx.get('type', 'N/A'),
             tx.get('description', '')
         ])
+        rows_in_chunk += 1
+        if rows_in_chunk >= batch_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            rows_in_chunk = 0
 
-    return output.getvalue()
+    yield output.getvalue()
+
+def stream_transaction_report_csv(start_date=None, end_date=None):
+    """
+    Prepares a streaming CSV export of transactions in the given date range.
+
+    Args:
+        start_date (str): Optional start date for filtering (ISO or YYYY-MM-DD).
+        end_date (str): Optional end date for filtering (ISO or YYYY-MM-DD).
+
+    Returns:
+        tuple: (generator of CSV chunks, 200), or (error dict, status code).
+    """
+    if db_instance.get_collection('transactions') is None:
+        return {'message': 'Database connection error'}, 500
+    try:
+        query = transaction_service.build_transaction_query(start_date, end_date)
+    except ValueError as e:
+        return {'message': f'Invalid date format provided: {e}'}, 400
+    return iter_transaction_report_csv(query), 200
+
+def generate_transaction_report_csv(start_date=None, end_date=None):
+    """
+    Generates the full CSV report as a single string.
+    Prefer stream_transaction_report_csv for HTTP responses.
+
+    Returns:
+        str: The CSV data as a string (header only if nothing can be exported).
+    """
+    stream, status_code = stream_transaction_report_csv(start_date, end_date)
+    if status_code != 200:
+        return ','.join(CSV_HEADER) + '\r\n'
+    return ''.join(stream)
 
 
 def get_dashboard_stats():
     """
     Retrieves key metrics for the Admin Dashboard.
+    Served from the incrementally maintained counters behind a short in-process
+    TTL cache, so the cost does not depend on collection sizes.
     """
-    users_collection = db_instance.get_collection('users')
-    accounts_collection = db_instance.get_collection('accounts')
-    transactions_collection = db_instance.get_collection('transactions')
+    now = time.monotonic()
+    with _stats_cache_lock:
+        if _stats_cache['value'] is not None and now < _stats_cache['expires']:
+            return dict(_stats_cache['value']), 200
 
-    # FIX: Check explicitly for None, as pymongo collection objects do not support bool()
-    if users_collection is None or accounts_collection is None or transactions_collection is None:
+    if db_instance.get_collection('counters') is None:
         return {'message': 'Database connection error'}, 500
 
     try:
-        # 1. Total Users (Non-Admin)
-        total_users = users_collection.count_documents({'is_admin': False})
-
-        # 2. Total Accounts
-        total_accounts = accounts_collection.count_documents({})
-
-        # 3. Transactions Today (Start of day in UTC)
-        start_of_today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        transactions_today = transactions_collection.count_documents(
-            {'timestamp': {'$gte': start_of_today}}
-        )
-        
-        # 4. Security Alerts (Count of pending users for admin approval)
-        security_alerts = users_collection.count_documents({'status': 'pending'})
-
-        return {
-            'totalUsers': total_users,
-            'totalAccounts': total_accounts,
-            'transactionsToday': transactions_today,
-            'securityAlerts': security_alerts
-        }, 200
+        stats = counter_service.read_dashboard_counters()
+        if stats is None:
+            # First run: seed the counters from the source collections
+            stats = counter_service.reconcile()
+
+        with _stats_cache_lock:
+            _stats_cache['value'] = stats
+            _stats_cache['expires'] = time.monotonic() + DASHBOARD_STATS_TTL
+        return dict(stats), 200
 
     except Exception as e:
         print(f"ERROR fetching dashboard stats: {e}")
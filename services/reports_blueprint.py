@@ -1,7 +1,7 @@
-import io
-from flask import Blueprint, jsonify, g, Response, request
+import tempfile
+from flask import Blueprint, jsonify, request, send_file
 # FIX: Ensure report_service is imported to use its ReportLab implementation
-from services import transaction_service, pdf_service, report_service 
+from services import report_service, report_jobs
 from services.decorators import admin_required
 
 # Create a blueprint for report-related routes
@@ -13,43 +13,76 @@ def download_transactions_report_pdf():
     """
     Handles the API request to download a PDF report of all transactions,
     with optional date filtering.
-    (FIX: Updated to use report_service's ReportLab implementation instead of pdf_service's pdfkit,
-    which was causing wkhtmltopdf dependency errors.)
+    Rows are rendered straight from the database cursor into a temporary
+    file, which is then streamed back, so large ranges don't sit in memory.
     """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    # Ensure transactions_response is a tuple of (data, status_code)
-    transactions_response, status_code = transaction_service.get_all_transactions(
-        start_date=start_date, end_date=end_date
-    )
-    
-    # Check for errors from the transaction service (e.g., Auth/DB errors)
-    if status_code != 200:
-        return jsonify(transactions_response), status_code
-    
-    transactions = transactions_response['transactions']
-    
-    # Handle case where no transactions are found
-    if not transactions:
-        # Return a JSON error message instead of an empty file
-        return jsonify({'message': 'No transactions found to generate a report.'}), 404
-        
+    output = tempfile.TemporaryFile()
     try:
-        # FIX: Use the ReportLab implementation from report_service.py
-        pdf_data = report_service.generate_transaction_report_pdf(transactions, start_date=start_date, end_date=end_date)
-        
-        # Return the PDF data as a downloadable file
-        return Response(
-            pdf_data,
-            mimetype="application/pdf",
-            headers={"Content-disposition": "attachment; filename=transactions_report.pdf"}
+        result, status_code = report_service.write_transaction_report_pdf(
+            output, start_date=start_date, end_date=end_date
         )
     except RuntimeError as e:
+        output.close()
         # Catch ReportLab's specific error messages and return a 500
         print(f"ERROR during PDF report generation (ReportLab failure): {e}")
         return jsonify({'message': f'Report generation failed: {e}'}), 500
     except Exception as e:
+        output.close()
         # Catch any other generic errors
         print(f"ERROR during PDF report generation: {e}")
         return jsonify({'message': f'An unexpected error occurred during report generation.'}), 500
+
+    # Errors from the report service (e.g. bad dates, DB errors, no data)
+    if status_code != 200:
+        output.close()
+        return jsonify(result), status_code
+
+    output.seek(0)
+    # The temporary file is closed (and removed) once the response is sent
+    return send_file(
+        output,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name="transactions_report.pdf"
+    )
+
+# --- Asynchronous Report Jobs ---
+@reports_bp.route('/jobs', methods=['POST'])
+@admin_required
+def create_report_job():
+    """
+    Queues a report render on the worker pool.
+    Body: {"format": "pdf" | "csv", "start_date": ..., "end_date": ..., "refresh": false}
+    """
+    data = request.get_json(silent=True) or {}
+    response, status_code = report_jobs.submit_report_job(
+        report_format=data.get('format', 'pdf'),
+        start_date=data.get('start_date'),
+        end_date=data.get('end_date'),
+        refresh=bool(data.get('refresh', False))
+    )
+    return jsonify(response), status_code
+
+@reports_bp.route('/jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_report_job(job_id):
+    """Returns the status of a queued report job."""
+    response, status_code = report_jobs.get_report_job(job_id)
+    return jsonify(response), status_code
+
+@reports_bp.route('/jobs/<job_id>/download', methods=['GET'])
+@admin_required
+def download_report_job(job_id):
+    """Downloads the artifact of a finished report job."""
+    artifact, status_code = report_jobs.get_report_artifact(job_id)
+    if status_code != 200:
+        return jsonify(artifact), status_code
+    return send_file(
+        artifact['path'],
+        mimetype=artifact['mimetype'],
+        as_attachment=True,
+        download_name=artifact['filename']
+    )
@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from database import db_instance
+
+# --- Configuration ---
+# Revoking a user records a cutoff: every token issued to them at or before
+# it is rejected (password change, suspension, deletion). Revoking a session
+# rejects only the tokens carrying its session id (logout). Each process
+# keeps both in memory and reloads them every TOKEN_REVOCATION_SYNC_SECONDS,
+# so a revocation made in another process takes effect within that interval.
+REVOCATIONS_COLLECTION = 'token_revocations'
+SESSION_REVOCATIONS_COLLECTION = 'session_revocations'
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 10))
+
+_lock = threading.Lock()
+_cutoffs = {}  # user_id -> epoch seconds
+_sessions = {}  # session id -> epoch seconds its access tokens can still be live until
+_synced_at = None
+
+def _get_revocations_collection():
+    """Helper to get the token revocations collection."""
+    return db_instance.get_collection(REVOCATIONS_COLLECTION)
+
+def _epoch(moment):
+    """Epoch seconds for a naive UTC datetime as stored by MongoDB."""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+def _get_session_revocations_collection():
+    """Helper to get the revoked sessions collection."""
+    return db_instance.get_collection(SESSION_REVOCATIONS_COLLECTION)
+
+def _sync_if_stale():
+    global _cutoffs, _sessions, _synced_at
+    now = time.monotonic()
+    with _lock:
+        if _synced_at is not None and now - _synced_at < TOKEN_REVOCATION_SYNC_SECONDS:
+            return
+        # Claim the sync so concurrent requests keep using the current map
+        _synced_at = now
+    revocations_collection = _get_revocations_collection()
+    sessions_collection = _get_session_revocations_collection()
+    if revocations_collection is None or sessions_collection is None:
+        return
+    try:
+        loaded = {doc['_id']: _epoch(doc['revoked_before']) for doc in revocations_collection.find()}
+        # Only sessions that may still have a live access token are kept in memory;
+        # refresh tokens are checked against the collection itself
+        sessions = {
+            doc['_id']: _epoch(doc['access_until'])
+            for doc in sessions_collection.find({'access_until': {'$gt': datetime.utcnow()}}, {'access_until': 1})
+        }
+    except Exception as e:
+        print(f"ERROR: Could not load token revocations. Details: {e}")
+        return
+    with _lock:
+        # Keep local revocations the reload might have raced with
+        for user_id, cutoff in _cutoffs.items():
+            if cutoff > loaded.get(user_id, 0):
+                loaded[user_id] = cutoff
+        now = time.time()
+        for session_id, until in _sessions.items():
+            if until > now:
+                sessions.setdefault(session_id, until)
+        _cutoffs = loaded
+        _sessions = sessions
+
+def revoke_user(user_id):
+    """Invalidates every token issued to the user up to now."""
+    user_id = str(user_id)
+    revoked_before = datetime.utcnow()
+    revocations_collection = _get_revocations_collection()
+    if revocations_collection is not None:
+        revocations_collection.update_one(
+            {'_id': user_id}, {'$set': {'revoked_before': revoked_before}}, upsert=True
+        )
+    with _lock:
+        _cutoffs[user_id] = _epoch(revoked_before)
+
+def revoke_session(session_id, user_id, expires_at, access_until):
+    """
+    Invalidates the tokens of one login session.
+
+    Args:
+        session_id (str): The 'sid' claim shared by the session's tokens.
+        user_id (str): The session's user.
+        expires_at (datetime): When its refresh token expires at the latest.
+        access_until (datetime): When its last access token expires at the latest.
+    """
+    sessions_collection = _get_session_revocations_collection()
+    if sessions_collection is not None:
+        sessions_collection.update_one(
+            {'_id': session_id},
+            {'$set': {'user_id': str(user_id), 'expires_at': expires_at, 'access_until': access_until}},
+            upsert=True
+        )
+    with _lock:
+        _sessions[session_id] = _epoch(access_until)
+
+def is_revoked(claims, fresh=False):
+    """
+    True if the token's session was revoked, or it was issued at or before
+    its user's revocation cutoff. With fresh=True both are read from the
+    database instead of the in-memory copy (used when refreshing a token).
+    """
+    user_id = str(claims.get('user_id'))
+    session_id = claims.get('sid')
+    if fresh:
+        revocations_collection = _get_revocations_collection()
+        sessions_collection = _get_session_revocations_collection()
+        if session_id and sessions_collection is not None and sessions_collection.find_one({'_id': session_id}, {'_id': 1}):
+            return True
+        doc = revocations_collection.find_one({'_id': user_id}) if revocations_collection is not None else None
+        cutoff = _epoch(doc['revoked_before']) if doc else None
+    else:
+        _sync_if_stale()
+        with _lock:
+            if session_id and session_id in _sessions:
+                return True
+            cutoff = _cutoffs.get(user_id)
+    # iat has whole-second resolution, so a token from the revocation's own second counts as revoked
+    return cutoff is not None and claims.get('iat', 0) <= int(cutoff)
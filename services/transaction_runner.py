@@ -0,0 +1,88 @@
+import os
+import time
+import random
+from pymongo.errors import PyMongoError
+from database import db_instance
+from services import metrics
+
+# --- Configuration ---
+# Attempts per operation before a write conflict is reported to the caller
+TXN_MAX_ATTEMPTS = int(os.environ.get('TXN_MAX_ATTEMPTS', 8))
+# Backoff before retry n is uniform in [0, min(TXN_MAX_BACKOFF, TXN_BASE_BACKOFF * 2**n)]
+TXN_BASE_BACKOFF = float(os.environ.get('TXN_BASE_BACKOFF', 0.005))
+TXN_MAX_BACKOFF = float(os.environ.get('TXN_MAX_BACKOFF', 0.25))
+# Overall time budget for one operation, including retries
+TXN_TIMEOUT = float(os.environ.get('TXN_TIMEOUT', 10))
+
+# MongoDB error code for a write conflict between concurrent transactions
+WRITE_CONFLICT = 112
+
+def _is_transient(error):
+    """True for aborts that are safe to retry from the start of the transaction."""
+    return isinstance(error, PyMongoError) and (
+        error.has_error_label('TransientTransactionError')
+        or getattr(error, 'code', None) == WRITE_CONFLICT
+    )
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff, so contending writers spread out."""
+    return random.uniform(0, min(TXN_MAX_BACKOFF, TXN_BASE_BACKOFF * (2 ** attempt)))
+
+def run_transaction(operation, callback, max_attempts=None):
+    """
+    Runs callback(session) inside a transaction and commits it, following the
+    ClientSession.with_transaction contract: the whole callback is retried on
+    TransientTransactionError (write conflicts included) and the commit alone
+    is retried on UnknownTransactionCommitResult. Unlike with_transaction,
+    retries back off with jitter and every step is counted in metrics under
+    'transactions.<operation>.*'.
+
+    The callback may run more than once, so it must only do transactional
+    writes through the given session. Any other exception aborts the
+    transaction and propagates unchanged.
+
+    Returns:
+        The callback's return value from the attempt that committed.
+    """
+    max_attempts = max_attempts or TXN_MAX_ATTEMPTS
+    prefix = f"transactions.{operation}"
+    deadline = time.monotonic() + TXN_TIMEOUT
+
+    with db_instance.client.start_session() as session:
+        attempt = 0
+        while True:
+            attempt += 1
+            metrics.increment(f"{prefix}.attempts")
+            session.start_transaction()
+            try:
+                result = callback(session)
+            except Exception as error:
+                if session.in_transaction:
+                    session.abort_transaction()
+                if _is_transient(error):
+                    metrics.increment(f"{prefix}.conflicts")
+                    if attempt < max_attempts and time.monotonic() < deadline:
+                        metrics.increment(f"{prefix}.retries")
+                        time.sleep(_backoff(attempt))
+                        continue
+                metrics.increment(f"{prefix}.failures")
+                raise
+
+            # Commit, retrying only the commit while its outcome is unknown
+            while True:
+                try:
+                    session.commit_transaction()
+                    metrics.increment(f"{prefix}.commits")
+                    return result
+                except PyMongoError as error:
+                    if error.has_error_label('UnknownTransactionCommitResult') and time.monotonic() < deadline:
+                        metrics.increment(f"{prefix}.commit_retries")
+                        continue
+                    if error.has_error_label('TransientTransactionError'):
+                        metrics.increment(f"{prefix}.conflicts")
+                        if attempt < max_attempts and time.monotonic() < deadline:
+                            metrics.increment(f"{prefix}.retries")
+                            time.sleep(_backoff(attempt))
+                            break
+                    metrics.increment(f"{prefix}.failures")
+                    raise
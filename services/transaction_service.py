@@ -1,11 +1,25 @@
 import random
+import base64
+import binascii
+import json
 from datetime import datetime, date, timedelta
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
 from werkzeug.security import generate_password_hash
 from database import db_instance
+from services import insights_service, counter_service, hot_accounts
+from services.transaction_runner import run_transaction
+from services.account_context import account_filter, resolve_account_number
 import csv
 import io
 
+# Page size bounds for keyset-paginated transaction listings
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Most transfers accepted in one POST /api/transactions/batch call
+MAX_BATCH_TRANSFERS = 500
+
 def _get_collections():
     """Helper to get all required collections."""
     transactions = db_instance.get_collection('transactions')
@@ -26,9 +40,139 @@ def _serialize_transaction(tx):
             tx['timestamp'] = tx['timestamp'].isoformat()
     return tx
 
-def create_transfer(from_user_id, to_account_number, amount, description):
+def participants_for(*account_numbers):
+    """
+    Account numbers a transaction touches. Stored on every transaction so a
+    per-account history is a single range scan on the participants index.
+    """
+    return [n for n in dict.fromkeys(account_numbers) if n and n != 'N/A']
+
+def _encode_cursor(tx):
+    """Builds an opaque keyset cursor from the last transaction on a page."""
+    payload = json.dumps({'ts': tx['timestamp'].isoformat(), 'id': str(tx['_id'])})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Decodes a cursor back into its (timestamp, _id) keyset position."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(payload['ts']), ObjectId(payload['id'])
+    except (ValueError, TypeError, KeyError, InvalidId, binascii.Error, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+def _parse_page_size(limit):
+    """Clamps a requested page size to [1, MAX_PAGE_SIZE]."""
+    if limit is None or limit == '':
+        return DEFAULT_PAGE_SIZE
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def _fetch_page(transactions_collection, query, limit, cursor):
+    """
+    Runs one keyset-paginated read ordered by (timestamp, _id) descending.
+    Fetches limit + 1 documents so we know whether another page exists
+    without a separate count.
+    """
+    if cursor:
+        cursor_ts, cursor_id = _decode_cursor(cursor)
+        query = {'$and': [query, {'$or': [
+            {'timestamp': {'$lt': cursor_ts}},
+            {'timestamp': cursor_ts, '_id': {'$lt': cursor_id}}
+        ]}]}
+
+    docs = list(
+        transactions_collection.find(query)
+        .sort([('timestamp', -1), ('_id', -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = _encode_cursor(docs[-1])
+    return [_serialize_transaction(tx) for tx in docs], next_cursor
+
+class TransactionAborted(Exception):
+    """
+    Raised inside a money-movement transaction to roll it back and answer
+    the request with the given response instead of a generic 500.
+    """
+    def __init__(self, response, status_code):
+        super().__init__(response.get('message'))
+        self.response = response
+        self.status_code = status_code
+
+def debit_account(accounts_collection, account_filter, amount, session, not_found_message='User account not found'):
+    """
+    Atomically subtracts amount from the matching account if it holds enough funds.
+    The balance check is part of the update predicate, so there is no window
+    between reading the balance and writing it.
+
+    For a hot account the check is against the aggregate balance: the
+    account's own balance may go negative as long as its credit shards
+    cover the difference.
+
+    Returns:
+        dict: The account's _id and account_number. Raises TransactionAborted
+        if the account is missing or short of funds.
+    """
+    account = accounts_collection.find_one_and_update(
+        dict(account_filter, balance={'$gte': amount}),
+        {'$inc': {'balance': -amount}},
+        projection={'account_number': 1},
+        session=session
+    )
+    if account is None:
+        # Only the failure path pays for the extra read that explains why
+        existing = accounts_collection.find_one(account_filter, {'account_number': 1, 'hot_shards': 1}, session=session)
+        if existing is None:
+            raise TransactionAborted({'message': not_found_message}, 404)
+        if 'hot_shards' in existing:
+            # Shards only grow outside a fold, and a fold writes this account
+            # document too, so a stale shard read ends in a write conflict and a retry.
+            pending = hot_accounts.shard_total(existing['account_number'], session=session)
+            account = accounts_collection.find_one_and_update(
+                dict(account_filter, balance={'$gte': amount - pending}),
+                {'$inc': {'balance': -amount}},
+                projection={'account_number': 1},
+                session=session
+            )
+        if account is None:
+            raise TransactionAborted({'message': 'Insufficient funds'}, 400)
+    return account
+
+def credit_account(accounts_collection, account_filter, amount, session, not_found_message='Recipient account not found'):
+    """
+    Atomically adds amount to the matching account. Credits to a hot account
+    (looked up by account_number) go to one of its balance shards instead,
+    leaving the contended account document untouched.
+
+    Returns:
+        dict: The account's account_number (and _id unless sharded). Raises
+        TransactionAborted if the account does not exist.
+    """
+    account_number = account_filter.get('account_number')
+    shards = hot_accounts.hot_shard_count(account_number)
+    if shards and hot_accounts.credit_shard(account_number, shards, amount, session):
+        return {'account_number': account_number}
+
+    account = accounts_collection.find_one_and_update(
+        account_filter,
+        {'$inc': {'balance': amount}},
+        projection={'account_number': 1},
+        session=session
+    )
+    if account is None:
+        raise TransactionAborted({'message': not_found_message}, 404)
+    return account
+
+def create_transfer(from_user_id, to_account_number, amount, description, account=None):
     """
     Creates a new money transfer transaction between two accounts.
+    The debit (guarded by balance >= amount), the credit and the ledger insert
+    run as single-round-trip writes inside one transaction, retried with
+    backoff on write conflicts.
     NOTE: This function uses a MongoDB session for ACID compliance.
     Ensure your MongoDB instance is a replica set to support transactions.
     """
@@ -39,38 +183,43 @@ def create_transfer(from_user_id, to_account_number, amount, description):
     try: amount = float(amount)
     except (ValueError, TypeError): return {'message': 'Invalid amount'}, 400
     if amount <= 0: return {'message': 'Amount must be positive'}, 400
-    
-    from_account = accounts_collection.find_one({'user_id': ObjectId(from_user_id)})
-    to_account = accounts_collection.find_one({'account_number': to_account_number})
+    if not to_account_number: return {'message': 'Recipient account not found'}, 404
 
-    if not from_account: return {'message': 'Sender account not found'}, 404
-    if not to_account: return {'message': 'Recipient account not found'}, 404
-    if from_account['balance'] < amount: return {'message': 'Insufficient funds'}, 400
-    
-    with db_instance.client.start_session() as session:
-        try:
-            session.start_transaction()
-            accounts_collection.update_one({'_id': from_account['_id']}, {'$inc': {'balance': -amount}}, session=session)
-            accounts_collection.update_one({'_id': to_account['_id']}, {'$inc': {'balance': amount}}, session=session)
-            transactions_collection.insert_one({
-                'from_account': from_account['account_number'], 
-                'to_account': to_account['account_number'], 
-                'amount': amount, 
-                'type': 'Transfer', 
-                'description': description or "Sent Money", 
-                'timestamp': datetime.utcnow()
-            }, session=session)
-            session.commit_transaction()
-        except Exception as e:
-            session.abort_transaction()
-            print(f"ERROR: Transaction failed. Details: {e}")
-            return {'message': 'Transaction failed. Please try again.'}, 500
-            
+    now = datetime.utcnow()
+
+    def apply_transfer(session):
+        from_account = debit_account(
+            accounts_collection, account_filter(from_user_id, account), amount, session,
+            not_found_message='Sender account not found'
+        )
+        to_account = credit_account(accounts_collection, {'account_number': to_account_number}, amount, session)
+        transactions_collection.insert_one({
+            'from_account': from_account['account_number'], 
+            'to_account': to_account['account_number'], 
+            'participants': participants_for(from_account['account_number'], to_account['account_number']),
+            'amount': amount, 
+            'type': 'Transfer', 
+            'description': description or "Sent Money", 
+            'timestamp': now
+        }, session=session)
+        insights_service.record_spend(from_account['account_number'], 'Transfer', amount, now, session=session)
+
+    try:
+        run_transaction('transfer', apply_transfer)
+    except TransactionAborted as e:
+        return e.response, e.status_code
+    except Exception as e:
+        print(f"ERROR: Transaction failed. Details: {e}")
+        return {'message': 'Transaction failed. Please try again.'}, 500
+
+    counter_service.record_transactions(now)
     return {'message': 'Transfer successful'}, 201
 
-def pay_bill(user_id, biller_id, amount):
+def pay_bill(user_id, biller_id, amount, account=None):
     """
     Creates a new bill payment transaction.
+    The guarded debit and the ledger insert run inside one transaction,
+    retried with backoff on write conflicts.
     NOTE: This function uses a MongoDB session for ACID compliance.
     Ensure your MongoDB instance is a replica set to support transactions.
     """
@@ -82,31 +231,186 @@ def pay_bill(user_id, biller_id, amount):
     except (ValueError, TypeError): return {'message': 'Invalid amount'}, 400
     if amount <= 0: return {'message': 'Amount must be positive'}, 400
     
-    from_account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
     biller = billers_collection.find_one({'_id': ObjectId(biller_id)})
-
-    if not from_account: return {'message': 'User account not found'}, 404
     if not biller: return {'message': 'Biller not found'}, 404
-    if from_account['balance'] < amount: return {'message': 'Insufficient funds'}, 400
     
-    with db_instance.client.start_session() as session:
+    now = datetime.utcnow()
+
+    def apply_payment(session):
+        from_account = debit_account(accounts_collection, account_filter(user_id, account), amount, session)
+        transactions_collection.insert_one({
+            'from_account': from_account['account_number'], 
+            'to_account': biller['name'], 
+            'participants': participants_for(from_account['account_number']),
+            'amount': amount, 
+            'type': biller['category'], 
+            'description': f"Payment to {biller['name']}", 
+            'timestamp': now
+        }, session=session)
+        insights_service.record_spend(from_account['account_number'], biller['category'], amount, now, session=session)
+
+    try:
+        run_transaction('bill_payment', apply_payment)
+    except TransactionAborted as e:
+        return e.response, e.status_code
+    except Exception as e:
+        print(f"ERROR: Transaction failed. Details: {e}")
+        return {'message': 'Transaction failed. Please try again.'}, 500
+
+    counter_service.record_transactions(now)
+    return {'message': 'Bill paid successfully'}, 201
+
+def _validate_batch_item(item):
+    """
+    Checks one batch entry's shape.
+
+    Returns:
+        tuple: ((to_account_number, amount, description), None) or (None, (message, status code)).
+    """
+    if not isinstance(item, dict):
+        return None, ('Each transfer must be an object', 400)
+    try:
+        amount = float(item.get('amount'))
+    except (ValueError, TypeError):
+        return None, ('Invalid amount', 400)
+    if amount <= 0:
+        return None, ('Amount must be positive', 400)
+    to_account_number = item.get('to_account_number')
+    if not to_account_number or not isinstance(to_account_number, str):
+        return None, ('Recipient account not found', 404)
+    return (to_account_number, amount, item.get('description')), None
+
+def create_transfer_batch(from_user_id, transfers, account=None):
+    """
+    Applies a list of transfers from one sender in a single transaction.
+
+    Recipients are checked against one prefetch of their accounts. Inside the
+    transaction, transfers are accepted in order while the sender's balance
+    covers them; the sender is debited once for the accepted total, the
+    credits go out as one bulk_write and the ledger entries as one insert_many.
+
+    Args:
+        from_user_id (str): The sender.
+        transfers (list): Up to MAX_BATCH_TRANSFERS dicts with to_account_number,
+            amount and an optional description.
+
+    Returns:
+        tuple: A summary with one {'index', 'status', 'message'} result per
+        transfer, and 201 if any transfer went through (400 otherwise).
+    """
+    transactions_collection, accounts_collection, _ = _get_collections()
+    if transactions_collection is None or accounts_collection is None:
+        return {'message': 'Database connection error'}, 500
+
+    if not isinstance(transfers, list) or not transfers:
+        return {'message': 'transfers must be a non-empty list'}, 400
+    if len(transfers) > MAX_BATCH_TRANSFERS:
+        return {'message': f'A batch holds at most {MAX_BATCH_TRANSFERS} transfers'}, 400
+
+    results = [None] * len(transfers)
+    candidates = []  # (index, to_account_number, amount, description)
+    for index, item in enumerate(transfers):
+        parsed, error = _validate_batch_item(item)
+        if error:
+            results[index] = {'index': index, 'status': error[1], 'message': error[0]}
+        else:
+            candidates.append((index,) + parsed)
+
+    # One round trip for every recipient in the batch
+    recipient_numbers = {to_account_number for _, to_account_number, _, _ in candidates}
+    known_recipients = {
+        account['account_number']
+        for account in accounts_collection.find(
+            {'account_number': {'$in': list(recipient_numbers)}}, {'account_number': 1}
+        )
+    } if recipient_numbers else set()
+    for index, to_account_number, _, _ in candidates:
+        if to_account_number not in known_recipients:
+            results[index] = {'index': index, 'status': 404, 'message': 'Recipient account not found'}
+    candidates = [c for c in candidates if c[1] in known_recipients]
+
+    now = datetime.utcnow()
+
+    def apply_batch(session):
+        sender = accounts_collection.find_one(
+            account_filter(from_user_id, account),
+            {'account_number': 1, 'balance': 1, 'hot_shards': 1},
+            session=session
+        )
+        if sender is None:
+            raise TransactionAborted({'message': 'Sender account not found'}, 404)
+        available = sender.get('balance', 0)
+        if 'hot_shards' in sender:
+            available += hot_accounts.shard_total(sender['account_number'], session=session)
+
+        accepted, rejected, total = [], [], 0.0
+        for candidate in candidates:
+            if total + candidate[2] <= available:
+                accepted.append(candidate)
+                total += candidate[2]
+            else:
+                rejected.append(candidate[0])
+        if not accepted:
+            return accepted, rejected
+
+        # The guarded debit re-checks the total, so a concurrent spend aborts
+        # the attempt instead of overdrawing the sender.
+        debit_account(accounts_collection, {'_id': sender['_id']}, total, session)
+
+        credits = {}
+        for _, to_account_number, amount, _ in accepted:
+            credits[to_account_number] = credits.get(to_account_number, 0) + amount
+        operations = []
+        for to_account_number, amount in credits.items():
+            shards = hot_accounts.hot_shard_count(to_account_number)
+            if not (shards and hot_accounts.credit_shard(to_account_number, shards, amount, session)):
+                operations.append(UpdateOne({'account_number': to_account_number}, {'$inc': {'balance': amount}}))
+        if operations:
+            result = accounts_collection.bulk_write(operations, ordered=False, session=session)
+            if result.matched_count != len(operations):
+                raise TransactionAborted({'message': 'Recipient account not found'}, 404)
+
+        from_number = sender['account_number']
+        transactions_collection.insert_many([
+            {
+                'from_account': from_number,
+                'to_account': to_account_number,
+                'participants': participants_for(from_number, to_account_number),
+                'amount': amount,
+                'type': 'Transfer',
+                'description': description or "Sent Money",
+                'timestamp': now
+            }
+            for _, to_account_number, amount, description in accepted
+        ], session=session)
+        insights_service.record_spend_many(
+            [(from_number, 'Transfer', amount, now) for _, _, amount, _ in accepted],
+            session=session
+        )
+        return accepted, rejected
+
+    if candidates:
         try:
-            session.start_transaction()
-            accounts_collection.update_one({'_id': from_account['_id']}, {'$inc': {'balance': -amount}}, session=session)
-            transactions_collection.insert_one({
-                'from_account': from_account['account_number'], 
-                'to_account': biller['name'], 
-                'amount': amount, 
-                'type': biller['category'], 
-                'description': f"Payment to {biller['name']}", 
-                'timestamp': datetime.utcnow()
-            }, session=session)
-            session.commit_transaction()
+            accepted, rejected = run_transaction('transfer_batch', apply_batch)
+        except TransactionAborted as e:
+            return e.response, e.status_code
         except Exception as e:
-            session.abort_transaction()
-            print(f"ERROR: Transaction failed. Details: {e}")
+            print(f"ERROR: Batch transfer failed. Details: {e}")
             return {'message': 'Transaction failed. Please try again.'}, 500
-    return {'message': 'Bill paid successfully'}, 201
+        for index, _, _, _ in accepted:
+            results[index] = {'index': index, 'status': 201, 'message': 'Transfer successful'}
+        for index in rejected:
+            results[index] = {'index': index, 'status': 400, 'message': 'Insufficient funds'}
+        if accepted:
+            counter_service.record_transactions(now, count=len(accepted))
+
+    succeeded = sum(1 for result in results if result['status'] == 201)
+    return {
+        'message': 'Batch processed',
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }, 201 if succeeded else 400
 
 def record_transaction(account_number, amount, type, description, session=None):
     """Creates a transaction record for a single account within a session."""
@@ -119,6 +423,7 @@ def record_transaction(account_number, amount, type, description, session=None):
     new_tx = {
         'from_account': account_number if type == 'Withdrawal' else 'N/A',
         'to_account': account_number if type == 'Deposit' else 'N/A',
+        'participants': participants_for(account_number),
         'amount': amount,
         'type': type,
         'description': description,
@@ -129,26 +434,100 @@ def record_transaction(account_number, amount, type, description, session=None):
         transactions_collection.insert_one(new_tx, session=session)
     else:
         transactions_collection.insert_one(new_tx)
+
+    # Withdrawals are outgoing spend; keep the insights rollups in step
+    if type == 'Withdrawal':
+        insights_service.record_spend(account_number, type, amount, new_tx['timestamp'], session=session)
+    # Inside a transaction the caller counts the entry once it has committed
+    if not session:
+        counter_service.record_transactions(new_tx['timestamp'])
         
     return {'message': 'Transaction recorded successfully'}, 201
 
-def get_transactions_by_user_id(user_id):
-    """Retrieves all transactions for a specific user."""
+def get_transactions_by_user_id(user_id, limit=None, cursor=None, account=None):
+    """
+    Retrieves one page of a user's transactions, newest first.
+    Pass the returned next_cursor back in to fetch the following page.
+    With the caller's account context the account lookup is skipped.
+    """
     transactions_collection, accounts_collection, _ = _get_collections()
     if transactions_collection is None or accounts_collection is None:
         return {'message': 'Database connection error'}, 500
-        
-    account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
-    if not account: return {'message': 'Account not found'}, 404
-    
-    user_transactions = list(transactions_collection.find({
-        '$or': [{'from_account': account['account_number']}, {'to_account': account['account_number']}]
-    }).sort('timestamp', -1))
-    
-    # FIX: Ensure serialization is applied to the list of transactions
-    serialized_transactions = [_serialize_transaction(tx) for tx in user_transactions]
-    
-    return {'transactions': serialized_transactions}, 200
+
+    try:
+        limit = _parse_page_size(limit)
+    except (ValueError, TypeError):
+        return {'message': 'Invalid limit'}, 400
+
+    account_number = resolve_account_number(accounts_collection, user_id, account)
+    if not account_number: return {'message': 'Account not found'}, 404
+
+    query = {'participants': account_number}
+    try:
+        transactions, next_cursor = _fetch_page(transactions_collection, query, limit, cursor)
+    except ValueError:
+        return {'message': 'Invalid cursor'}, 400
+
+    return {'transactions': transactions, 'next_cursor': next_cursor}, 200
+
+def _build_date_filter(start_date=None, end_date=None):
+    """
+    Converts optional start/end date strings (ISO or YYYY-MM-DD) into a Mongo
+    timestamp range. Raises ValueError on malformed input.
+    """
+    date_filter = {}
+    if start_date:
+        # Convert start_date string (ISO or YYYY-MM-DD) to datetime object (start of the day)
+        if 'T' in start_date: # Handle ISO format
+            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        else: # Handle YYYY-MM-DD format (set to start of the day UTC)
+            start_dt = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=None)
+        date_filter['$gte'] = start_dt
+
+    if end_date:
+        # Convert end_date string (ISO or YYYY-MM-DD) to datetime object (end of the day)
+        if 'T' in end_date: # Handle ISO format
+            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        else: # Handle YYYY-MM-DD format (set to end of the day UTC)
+            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+            # Add one day and set time to 00:00:00 to represent the end of the specified day
+            end_dt = (end_dt + timedelta(days=1)).replace(tzinfo=None)
+        date_filter['$lt'] = end_dt
+    return date_filter
+
+def build_transaction_query(start_date=None, end_date=None, account_number=None, tx_type=None):
+    """
+    Builds the Mongo filter used by the admin listing, streams and reports.
+    Raises ValueError if a date cannot be parsed.
+    """
+    query = {}
+    date_filter = _build_date_filter(start_date, end_date)
+    if date_filter:
+        query['timestamp'] = date_filter
+    if account_number:
+        query['participants'] = account_number
+    if tx_type:
+        query['type'] = tx_type
+    return query
+
+def iter_transactions(query, projection=None, batch_size=500):
+    """
+    Yields serialized transactions matching query, newest first.
+    The cursor is read in batches so memory use does not grow with the result size.
+    """
+    transactions_collection, _, _ = _get_collections()
+    if transactions_collection is None:
+        return
+    cursor = (
+        transactions_collection.find(query, projection)
+        .sort([('timestamp', -1), ('_id', -1)])
+        .batch_size(batch_size)
+    )
+    try:
+        for tx in cursor:
+            yield _serialize_transaction(tx)
+    finally:
+        cursor.close()
 
 def get_all_transactions(start_date=None, end_date=None):
     """
@@ -159,61 +538,130 @@ def get_all_transactions(start_date=None, end_date=None):
     if transactions_collection is None:
         return {'message': 'Database connection error'}, 500
 
-    query = {}
-    date_filter = {}
+    try:
+        query = build_transaction_query(start_date, end_date)
+    except ValueError as e:
+        return {'message': f'Invalid date format provided: {e}'}, 400
+
+    return {'transactions': list(iter_transactions(query))}, 200
+
+def get_transactions_page(limit=None, cursor=None, **filters):
+    """
+    Admin: retrieves one keyset-paginated page of transactions.
+    Accepts the same filters as build_transaction_query.
+    """
+    transactions_collection, _, _ = _get_collections()
+    if transactions_collection is None:
+        return {'message': 'Database connection error'}, 500
 
     try:
-        if start_date:
-            # Convert start_date string (ISO or YYYY-MM-DD) to datetime object (start of the day)
-            if 'T' in start_date: # Handle ISO format
-                start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            else: # Handle YYYY-MM-DD format (set to start of the day UTC)
-                start_dt = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=None)
-            date_filter['$gte'] = start_dt
-
-        if end_date:
-            # Convert end_date string (ISO or YYYY-MM-DD) to datetime object (end of the day)
-            if 'T' in end_date: # Handle ISO format
-                 end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            else: # Handle YYYY-MM-DD format (set to end of the day UTC)
-                end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-                # Add one day and set time to 00:00:00 to represent the end of the specified day
-                end_dt = (end_dt + timedelta(days=1)).replace(tzinfo=None)
-                date_filter['$lt'] = end_dt 
+        limit = _parse_page_size(limit)
+    except (ValueError, TypeError):
+        return {'message': 'Invalid limit'}, 400
+    try:
+        query = build_transaction_query(**filters)
+    except ValueError as e:
+        return {'message': f'Invalid date format provided: {e}'}, 400
+    try:
+        transactions, next_cursor = _fetch_page(transactions_collection, query, limit, cursor)
+    except ValueError:
+        return {'message': 'Invalid cursor'}, 400
+
+    return {'transactions': transactions, 'next_cursor': next_cursor}, 200
+
+def stream_transactions(output_format='json', batch_size=500, **filters):
+    """
+    Admin: prepares a streamed listing of every matching transaction.
 
+    Returns:
+        tuple: (generator of str chunks, 200) on success, or (error dict, status).
+        With output_format='ndjson' each chunk holds newline-delimited documents;
+        otherwise the chunks concatenate to {"transactions": [...]}.
+    """
+    transactions_collection, _, _ = _get_collections()
+    if transactions_collection is None:
+        return {'message': 'Database connection error'}, 500
+    if output_format not in ('json', 'ndjson'):
+        return {'message': 'Invalid format. Use json or ndjson.'}, 400
+    try:
+        query = build_transaction_query(**filters)
     except ValueError as e:
         return {'message': f'Invalid date format provided: {e}'}, 400
-    except Exception as e:
-        print(f"ERROR during date parsing in get_all_transactions: {e}")
-        return {'message': 'An unexpected error occurred during date parsing.'}, 500
 
-    if date_filter:
-        query['timestamp'] = date_filter
-    
-    # Fetch and sort all transactions
-    all_transactions = list(transactions_collection.find(query).sort('timestamp', -1))
+    def generate():
+        buffer = []
+        first = True
+        if output_format == 'json':
+            yield '{"transactions": ['
+        for tx in iter_transactions(query, batch_size=batch_size):
+            if output_format == 'ndjson':
+                buffer.append(json.dumps(tx) + '\n')
+            else:
+                buffer.append(('' if first else ',') + json.dumps(tx))
+                first = False
+            # Flush one chunk per cursor batch
+            if len(buffer) >= batch_size:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+        if output_format == 'json':
+            yield ']}'
+
+    return generate(), 200
 
-    return {'transactions': [_serialize_transaction(tx) for tx in all_transactions]}, 200
+def backfill_participants(batch_size=1000):
+    """
+    Migration: adds the participants field to transactions written before it
+    existed. Works in _id-ordered batches and only touches documents still
+    missing the field, so it can be interrupted and re-run safely.
 
-def get_spending_insights(user_id):
-    """Aggregates spending data by category for a user."""
+    Returns:
+        int: The number of transactions updated.
+    """
     transactions_collection, accounts_collection, _ = _get_collections()
     if transactions_collection is None or accounts_collection is None:
-        return {'message': 'Database connection error'}, 500
+        return 0
 
-    account = accounts_collection.find_one({'user_id': ObjectId(user_id)})
-    if not account: return {'message': 'Account not found'}, 404
+    updated = 0
+    while True:
+        batch = list(
+            transactions_collection.find(
+                {'participants': {'$exists': False}},
+                {'from_account': 1, 'to_account': 1}
+            ).sort('_id', 1).limit(batch_size)
+        )
+        if not batch:
+            break
 
-    # We only aggregate transactions where money left the user's account (from_account)
-    pipeline = [
-        {'$match': {'from_account': account['account_number']}},
-        {'$group': {'_id': '$type', 'totalAmount': {'$sum': '$amount'}}},
-        {'$sort': {'totalAmount': -1}}
-    ]
-    results = list(transactions_collection.aggregate(pipeline))
-    
-    # Format the results for Chart.js
-    labels = [r['_id'] for r in results]
-    data = [r['totalAmount'] for r in results]
+        # Bill payments store the biller name in to_account, and deposits and
+        # withdrawals store 'N/A', so only keep values that are real accounts.
+        candidates = {tx.get(field) for tx in batch for field in ('from_account', 'to_account')}
+        known = set(accounts_collection.distinct(
+            'account_number', {'account_number': {'$in': [c for c in candidates if c]}}
+        ))
+        operations = [
+            UpdateOne({'_id': tx['_id']}, {'$set': {'participants': participants_for(
+                *(n for n in (tx.get('from_account'), tx.get('to_account')) if n in known)
+            )}})
+            for tx in batch
+        ]
+        result = transactions_collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+        print(f"Backfilled participants on {updated} transactions...")
+
+    return updated
+
+def get_spending_insights(user_id, months=None, month=None, account=None):
+    """
+    Returns a user's spending by category from the incrementally maintained
+    rollups, for all time, the last N months, or a single 'YYYY-MM' month.
+    """
+    _, accounts_collection, _ = _get_collections()
+    if accounts_collection is None:
+        return {'message': 'Database connection error'}, 500
+
+    account_number = resolve_account_number(accounts_collection, user_id, account)
+    if not account_number: return {'message': 'Account not found'}, 404
 
-    return {'labels': labels, 'data': data}, 200
+    return insights_service.get_insights(account_number, months=months, month=month)
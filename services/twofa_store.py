@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from database import db_instance
+
+# --- Configuration ---
+# 'mongo' keeps challenges in their own TTL-indexed collection (shared by all
+# app processes); 'memory' keeps them in this process only (single-node setups).
+TWOFA_STORE = os.environ.get('TWOFA_STORE', 'mongo').lower()
+TWOFA_CODE_TTL_SECONDS = int(os.environ.get('TWOFA_CODE_TTL_SECONDS', 600))
+CHALLENGES_COLLECTION = 'twofa_challenges'
+
+class MongoChallengeStore:
+    """
+    One pending challenge per user, keyed by user _id. MongoDB's TTL monitor
+    deletes expired challenges; verification also checks the expiry, since the
+    monitor only runs about once a minute.
+    """
+    def _collection(self):
+        return db_instance.get_collection(CHALLENGES_COLLECTION)
+
+    def save(self, user_id, code, ttl_seconds):
+        collection = self._collection()
+        if collection is None:
+            return False
+        collection.replace_one(
+            {'_id': user_id},
+            {'code': code, 'expires_at': datetime.utcnow() + timedelta(seconds=ttl_seconds)},
+            upsert=True
+        )
+        return True
+
+    def consume(self, user_id, code):
+        collection = self._collection()
+        if collection is None:
+            return False
+        # Match and delete in one atomic step, so a code can be used only once
+        return collection.find_one_and_delete(
+            {'_id': user_id, 'code': code, 'expires_at': {'$gt': datetime.utcnow()}},
+            projection={'_id': 1}
+        ) is not None
+
+class MemoryChallengeStore:
+    """Process-local challenges; expired entries are swept on each save."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._challenges = {}  # user_id -> (code, expires_at monotonic)
+
+    def save(self, user_id, code, ttl_seconds):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (_, expires) in self._challenges.items() if expires <= now]:
+                del self._challenges[key]
+            self._challenges[user_id] = (code, now + ttl_seconds)
+        return True
+
+    def consume(self, user_id, code):
+        with self._lock:
+            challenge = self._challenges.get(user_id)
+            if challenge is None or challenge[0] != code or challenge[1] <= time.monotonic():
+                return False
+            del self._challenges[user_id]
+            return True
+
+_STORES = {
+    'mongo': MongoChallengeStore,
+    'memory': MemoryChallengeStore,
+}
+if TWOFA_STORE not in _STORES:
+    print(f"WARNING: Unknown TWOFA_STORE '{TWOFA_STORE}'. Falling back to 'mongo'.")
+_store = _STORES.get(TWOFA_STORE, MongoChallengeStore)()
+
+def save_code(user_id, code, ttl_seconds=TWOFA_CODE_TTL_SECONDS):
+    """
+    Stores a user's 2FA code, replacing any earlier one.
+
+    Returns:
+        bool: False if the store is unavailable.
+    """
+    return _store.save(user_id, code, ttl_seconds)
+
+def consume_code(user_id, code):
+    """
+    Checks a 2FA code and deletes it in the same step.
+
+    Returns:
+        bool: True if the code matched and had not expired.
+    """
+    return _store.consume(user_id, code)
@@ -1,9 +1,10 @@
 import random
 from datetime import datetime
 from bson import ObjectId
-from werkzeug.security import generate_password_hash
+from pymongo.errors import DuplicateKeyError
 from database import db_instance
-from . import account_service
+from . import account_service, counter_service, password_hasher, token_revocation
+from .password_hasher import HashingUnavailable
 
 def _get_users_collection():
     """Helper to get the users collection."""
@@ -32,7 +33,10 @@ def create_user(data, created_by_admin=False):
     if users_collection.find_one({'email': data['email']}):
         return {'message': 'Email already registered'}, 409
         
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    try:
+        hashed_password = password_hasher.hash_password(data['password'])
+    except HashingUnavailable:
+        return {'message': 'Server is busy. Please try again shortly.'}, 503
     new_user = {
         'username': data['username'],
         'email': data['email'],
@@ -43,7 +47,14 @@ def create_user(data, created_by_admin=False):
         'last_login': None,
         'created_by_admin': created_by_admin
     }
-    result = users_collection.insert_one(new_user)
+    try:
+        result = users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup; the unique indexes decide
+        if users_collection.find_one({'username': data['username']}, {'_id': 1}):
+            return {'message': 'Username already exists'}, 409
+        return {'message': 'Email already registered'}, 409
+    counter_service.increment(totalUsers=1, securityAlerts=1)
     created_user = users_collection.find_one({'_id': result.inserted_id})
     return {'message': 'User registered successfully', 'user': _serialize_user(created_user)}, 201
 
@@ -54,7 +65,7 @@ def create_user_account(user_id):
 def create_admin_user_if_not_exists():
     users_collection = _get_users_collection()
     if users_collection is not None and not users_collection.find_one({'is_admin': True}):
-        hashed_password = generate_password_hash('admin123', method='pbkdf2:sha256')
+        hashed_password = password_hasher.hash_password('admin123')
         users_collection.insert_one({
             'username': 'admin',
             'email': 'admin@bank.com',
@@ -107,10 +118,24 @@ def update_user_status(user_id, status):
         create_user_account(user_id)
 
     result = users_collection.update_one({'_id': ObjectId(user_id)}, {'$set': {'status': status}})
+    if status != 'active':
+        # Cut off sessions already issued; they would otherwise last until they expire
+        token_revocation.revoke_user(user_id)
+    # Pending registrations are what the dashboard reports as security alerts
+    if result.modified_count and user['status'] == 'pending':
+        counter_service.increment(securityAlerts=-1)
     return ({'message': f'User status updated to {status}'}, 200) if result.matched_count else ({'message': 'User not found'}, 404)
 
 def delete_user(user_id):
     users_collection = _get_users_collection()
     if users_collection is None: return {'message': 'Database error'}, 500
-    result = users_collection.delete_one({'_id': ObjectId(user_id)})
-    return ({'message': 'User deleted successfully'}, 200) if result.deleted_count else ({'message': 'User not found'}, 404)
+    deleted = users_collection.find_one_and_delete({'_id': ObjectId(user_id)}, {'is_admin': 1, 'status': 1})
+    if not deleted:
+        return {'message': 'User not found'}, 404
+    token_revocation.revoke_user(user_id)
+    if not deleted.get('is_admin'):
+        counter_service.increment(
+            totalUsers=-1,
+            securityAlerts=-1 if deleted.get('status') == 'pending' else 0
+        )
+    return {'message': 'User deleted successfully'}, 200
@@ -0,0 +1,67 @@
+import os
+import sys
+import functools
+import pytest
+
+# The services import `database`, which connects on import. Point it at an
+# address that fails fast so the unit tests run without a MongoDB server.
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=50')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeSession:
+    """Stands in for a ClientSession; mongomock has no transactions."""
+    in_transaction = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit_transaction(self):
+        self.in_transaction = False
+
+    def abort_transaction(self):
+        self.in_transaction = False
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """
+    Points db_instance at a fresh in-memory mongomock database. Collection
+    methods ignore the session argument, and run_transaction gets a
+    FakeSession, so callbacks run once and commit without rollback.
+    """
+    mongomock = pytest.importorskip('mongomock')
+    from mongomock.collection import BulkOperationBuilder, Collection
+    from database import db_instance
+    from services import hot_accounts
+
+    def drop_session(method):
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            kwargs.pop('session', None)
+            return method(self, *args, **kwargs)
+        return call
+
+    for name in ('find', 'find_one', 'find_one_and_update', 'insert_one', 'insert_many',
+                 'update_one', 'update_many', 'bulk_write', 'delete_one', 'delete_many'):
+        monkeypatch.setattr(Collection, name, drop_session(getattr(Collection, name)))
+    # pymongo's UpdateOne passes options this mongomock version does not accept
+    add_update = BulkOperationBuilder.add_update
+    monkeypatch.setattr(
+        BulkOperationBuilder, 'add_update',
+        lambda self, selector, doc, multi=False, upsert=False, collation=None, array_filters=None, hint=None, **_:
+            add_update(self, selector, doc, multi, upsert, collation=collation, array_filters=array_filters, hint=hint)
+    )
+
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(client, 'start_session', lambda *args, **kwargs: FakeSession(), raising=False)
+    monkeypatch.setattr(db_instance, 'client', client)
+    monkeypatch.setattr(db_instance, 'db', client['smart_ebanking_test'])
+    monkeypatch.setattr(hot_accounts, '_hot_accounts', {})
+    monkeypatch.setattr(hot_accounts, '_hot_loaded_at', None)
+    monkeypatch.setattr(hot_accounts, '_balance_cache', {})
+    return db_instance.db
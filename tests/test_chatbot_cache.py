@@ -0,0 +1,30 @@
+import pytest
+from services.chatbot_service import cache_key
+
+@pytest.mark.parametrize('message', [
+    'What is my balance?',
+    'What is the balance of my account',
+    'How much do I owe?',
+    'What did I buy last week?',
+    'Can I afford a car?',
+    'how do i check my balance',
+    "how do i know if i'm overdrawn",
+    'what is our limit',
+    'Send 500 to ACC123456789',
+    'email me at a@b.com',
+    'what about that one?',
+    'tell me a joke',
+    '',
+    None,
+])
+def test_personal_or_open_questions_are_never_cached(message):
+    assert cache_key(message) is None
+
+@pytest.mark.parametrize('variants, key', [
+    (['How do I pay a bill?', 'how do i pay a bill', '  HOW DO I PAY A BILL!!', 'Hey, how do I pay a bill please?'],
+     'how do i pay a bill'),
+    (['What are the fees for transfers?', 'what are the fees for transfers'], 'what are the fees for transfers'),
+    (['Where can I find the IFSC code?', 'where can i find the ifsc code'], 'where can i find the ifsc code'),
+])
+def test_generic_questions_share_one_normalized_key(variants, key):
+    assert {cache_key(message) for message in variants} == {key}
@@ -0,0 +1,144 @@
+import threading
+import time
+import pytest
+from services import chatbot_service, metrics
+from services.chatbot_service import (
+    ChatbotClient, ChatbotUnavailable, CircuitBreaker, FakeBackend,
+    BUSY_MESSAGE, ERROR_MESSAGE, UNAVAILABLE_MESSAGE,
+)
+
+PROMPT = 'User\'s question: "how do I pay a bill"'
+
+class FailingBackend(FakeBackend):
+    """Fails its first `failures` calls, then answers like FakeBackend."""
+    def __init__(self, failures, latency=0):
+        super().__init__(latency)
+        self.failures = failures
+
+    def generate(self, prompt, timeout):
+        if self.calls < self.failures:
+            self.calls += 1
+            raise RuntimeError('upstream error')
+        return super().generate(prompt, timeout)
+
+class EndlessBackend:
+    """Streams chunks until the reader goes away, counting what it produced."""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.produced = 0
+
+    def stream(self, prompt, timeout):
+        while True:
+            time.sleep(self.interval)
+            self.produced += 1
+            yield 'chunk '
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset('chatbot.')
+    yield
+
+def make_client(backend, max_concurrency=2, timeout=1.0, threshold=2, reset_seconds=0.2):
+    client = ChatbotClient(backend, max_concurrency=max_concurrency, timeout=timeout)
+    client.breaker = CircuitBreaker(threshold, reset_seconds)
+    return client
+
+def test_generate_returns_backend_reply():
+    client = make_client(FakeBackend(latency=0))
+    assert client.generate(PROMPT) == '(fake model) You asked: how do I pay a bill'
+    assert client.breaker.state == 'closed'
+
+def test_busy_when_no_slot_frees_up(monkeypatch):
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_QUEUE_TIMEOUT', 0.05)
+    backend = FakeBackend(latency=0.5)
+    client = make_client(backend, max_concurrency=1)
+    worker = threading.Thread(target=client.generate, args=(PROMPT,))
+    worker.start()
+    time.sleep(0.05)
+
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        client.generate(PROMPT)
+    worker.join()
+
+    assert excinfo.value.reply == BUSY_MESSAGE
+    assert backend.calls == 1
+    # Being busy is not an upstream failure
+    assert client.breaker.state == 'closed'
+    assert metrics.snapshot('chatbot.')['counters']['chatbot.busy'] == 1
+
+def test_slow_call_times_out():
+    client = make_client(FakeBackend(latency=0.5), timeout=0.05)
+    started = time.perf_counter()
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        client.generate(PROMPT)
+    assert excinfo.value.reply == ERROR_MESSAGE
+    assert time.perf_counter() - started < 0.4
+    assert metrics.snapshot('chatbot.')['counters']['chatbot.timeouts'] == 1
+
+def test_circuit_opens_then_recovers_through_half_open_trial():
+    backend = FailingBackend(failures=2)
+    client = make_client(backend, threshold=2, reset_seconds=0.2)
+    for _ in range(2):
+        with pytest.raises(ChatbotUnavailable):
+            client.generate(PROMPT)
+    assert client.breaker.state == 'open'
+
+    # While open, calls fail fast without reaching the backend
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        client.generate(PROMPT)
+    assert excinfo.value.reply == UNAVAILABLE_MESSAGE
+    assert backend.calls == 2
+
+    time.sleep(0.25)
+    assert client.generate(PROMPT).startswith('(fake model)')
+    assert client.breaker.state == 'closed'
+
+def test_failed_half_open_trial_reopens_circuit():
+    backend = FailingBackend(failures=3)
+    client = make_client(backend, threshold=2, reset_seconds=0.2)
+    for _ in range(2):
+        with pytest.raises(ChatbotUnavailable):
+            client.generate(PROMPT)
+    time.sleep(0.25)
+
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        client.generate(PROMPT)
+    assert excinfo.value.reply == ERROR_MESSAGE
+    assert backend.calls == 3
+    assert client.breaker.state == 'open'
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        client.generate(PROMPT)
+    assert excinfo.value.reply == UNAVAILABLE_MESSAGE
+
+def test_stream_yields_the_reply_in_chunks():
+    client = make_client(FakeBackend(latency=0.05))
+    chunks = list(client.stream(PROMPT))
+    assert len(chunks) > 1
+    assert ''.join(chunks) == '(fake model) You asked: how do I pay a bill'
+    assert client.breaker.state == 'closed'
+    assert metrics.snapshot('chatbot.')['timings']['chatbot.first_chunk']['count'] == 1
+
+def test_stream_stalling_past_idle_timeout_fails(monkeypatch):
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_STREAM_IDLE_TIMEOUT', 0.05)
+    client = make_client(FakeBackend(latency=2.0), threshold=1)
+    with pytest.raises(ChatbotUnavailable) as excinfo:
+        list(client.stream(PROMPT))
+    assert excinfo.value.reply == ERROR_MESSAGE
+    assert client.breaker.state == 'open'
+    assert metrics.snapshot('chatbot.')['counters']['chatbot.timeouts'] == 1
+
+def test_closing_stream_stops_upstream_and_frees_the_slot():
+    backend = EndlessBackend()
+    client = make_client(backend, max_concurrency=1)
+    stream = client.stream(PROMPT)
+    assert next(stream) == 'chunk '
+    stream.close()
+
+    time.sleep(0.1)
+    produced = backend.produced
+    time.sleep(0.1)
+    assert backend.produced == produced
+    # The only slot is free again and the disconnect did not count as a failure
+    assert client._slots.acquire(timeout=0.5)
+    client._slots.release()
+    assert client.breaker.state == 'closed'
@@ -0,0 +1,91 @@
+import io
+from datetime import datetime, timedelta
+import pytest
+from services import import_service
+
+CSV = (
+    "account_number,amount,description\n"
+    "ACC100000001,10,first\n"
+    "ACC100000002,20,second\n"
+    "ACC999999999,5,unknown\n"
+    "ACC100000001,abc,bad amount\n"
+    "ACC100000002,30,fifth\n"
+)
+
+@pytest.fixture
+def accounts(mongo_db, monkeypatch):
+    monkeypatch.setattr(import_service, 'IMPORT_CHUNK_SIZE', 2)
+    mongo_db.accounts.insert_many([
+        {'account_number': 'ACC100000001', 'balance': 0.0},
+        {'account_number': 'ACC100000002', 'balance': 0.0},
+    ])
+    return mongo_db.accounts
+
+def upload(import_id=None):
+    return import_service.import_deposits(io.BytesIO(CSV.encode('utf-8')), filename='deposits.csv', import_id=import_id)
+
+def balances(accounts):
+    return {a['account_number']: a['balance'] for a in accounts.find()}
+
+def test_import_applies_valid_rows_and_records_rejects(mongo_db, accounts):
+    response, status = upload()
+    record = response['import']
+    assert status == 200
+    assert record['status'] == 'completed'
+    assert (record['rows_processed'], record['applied'], record['rejected_count']) == (5, 3, 2)
+    assert [r['row'] for r in record['rejected']] == [3, 4]
+    assert balances(accounts) == {'ACC100000001': 10.0, 'ACC100000002': 50.0}
+
+def test_resume_after_failure_does_not_post_rows_twice(mongo_db, accounts, monkeypatch):
+    apply_chunk = import_service._apply_chunk
+    calls = []
+
+    def fail_second_chunk(import_id, chunk, rows_processed):
+        calls.append(rows_processed)
+        if len(calls) == 2:
+            raise RuntimeError('connection lost')
+        return apply_chunk(import_id, chunk, rows_processed)
+    monkeypatch.setattr(import_service, '_apply_chunk', fail_second_chunk)
+
+    response, status = upload()
+    assert status == 500
+    import_id = response['import']['import_id']
+    assert response['import']['status'] == 'failed'
+    assert response['import']['rows_processed'] == 2
+    assert balances(accounts) == {'ACC100000001': 10.0, 'ACC100000002': 20.0}
+
+    monkeypatch.setattr(import_service, '_apply_chunk', apply_chunk)
+    response, status = upload(import_id)
+    assert status == 200
+    assert response['import']['status'] == 'completed'
+    assert response['import']['applied'] == 3
+    assert balances(accounts) == {'ACC100000001': 10.0, 'ACC100000002': 50.0}
+    assert mongo_db.transactions.count_documents({}) == 3
+
+def test_resume_is_refused_while_another_request_holds_the_import(mongo_db, accounts):
+    mongo_db.imports.insert_one({
+        '_id': 'held', 'status': 'running', 'rows_processed': 0, 'started_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+    })
+    response, status = upload('held')
+    assert status == 409
+    assert response['message'] == 'Import is already running'
+    assert balances(accounts) == {'ACC100000001': 0.0, 'ACC100000002': 0.0}
+
+def test_abandoned_running_import_can_be_resumed(mongo_db, accounts):
+    stale = datetime.utcnow() - timedelta(seconds=import_service.IMPORT_STALE_SECONDS + 60)
+    mongo_db.imports.insert_one({
+        '_id': 'abandoned', 'status': 'running', 'rows_processed': 2, 'applied': 2, 'rejected_count': 0,
+        'rejected': [], 'total_amount': 30.0, 'elapsed_seconds': 0.0, 'started_at': stale, 'updated_at': stale,
+    })
+    response, status = upload('abandoned')
+    assert status == 200
+    assert response['import']['applied'] == 3
+    # Rows 1-2 were already committed by the earlier run
+    assert balances(accounts) == {'ACC100000001': 0.0, 'ACC100000002': 30.0}
+
+def test_completed_or_unknown_imports_are_not_resumed(mongo_db, accounts):
+    import_id = upload()[0]['import']['import_id']
+    assert upload(import_id)[1] == 409
+    assert upload('missing')[1] == 404
+    assert balances(accounts) == {'ACC100000001': 10.0, 'ACC100000002': 50.0}
@@ -0,0 +1,89 @@
+import socket
+from email.message import EmailMessage
+import pytest
+from services import mail_dispatcher, metrics
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+class RecordingHandler:
+    """Accepts mail, remembering which connection delivered each message."""
+    def __init__(self):
+        self.received = []  # (peer, subject)
+        self.reject_next = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject_next:
+            self.reject_next -= 1
+            return '451 Try again later'
+        subject = envelope.content.decode('utf-8', 'replace').split('Subject: ', 1)[1].split('\n', 1)[0].strip()
+        self.received.append((session.peer, subject))
+        return '250 OK'
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+@pytest.fixture(scope='module')
+def smtp_server():
+    handler = RecordingHandler()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    patch = pytest.MonkeyPatch()
+    for name, value in {
+        'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': str(controller.port), 'EMAIL_USER': 'bank@example.com',
+        'EMAIL_PASS': '', 'EMAIL_SECURITY': 'none', 'MAIL_WORKERS': '1', 'MAIL_RETRY_DELAY': '0.05',
+    }.items():
+        patch.setenv(name, value)
+    mail_dispatcher.start()
+    yield handler
+    patch.undo()
+    controller.stop()
+
+def _message(subject):
+    message = EmailMessage()
+    message.set_content('code: 123456')
+    message['Subject'] = subject
+    message['From'] = mail_dispatcher.sender()
+    message['To'] = 'user@example.com'
+    return message
+
+def test_dispatcher_uses_settings_from_start(smtp_server):
+    assert mail_dispatcher.is_configured()
+    assert mail_dispatcher.settings().security == 'none'
+
+def test_batch_is_delivered_over_one_reused_connection(smtp_server):
+    metrics.reset('mail.')
+    smtp_server.received.clear()
+    subjects = [f'batch {i}' for i in range(5)]
+    for subject in subjects:
+        assert mail_dispatcher.enqueue(_message(subject))
+
+    assert mail_dispatcher.flush(timeout=5)
+    assert sorted(subject for _, subject in smtp_server.received) == subjects
+    assert len({peer for peer, _ in smtp_server.received}) == 1
+    counters = metrics.snapshot('mail.')['counters']
+    assert counters['mail.sent'] == 5
+    assert counters['mail.connects'] == 1
+
+def test_failed_send_is_retried(smtp_server):
+    metrics.reset('mail.')
+    smtp_server.received.clear()
+    smtp_server.reject_next = 1
+    assert mail_dispatcher.enqueue(_message('retried'))
+
+    assert mail_dispatcher.flush(timeout=5)
+    assert [subject for _, subject in smtp_server.received] == ['retried']
+    counters = metrics.snapshot('mail.')['counters']
+    assert counters['mail.retries'] == 1
+    assert counters['mail.sent'] == 1
+    assert 'mail.failed' not in counters
+
+def test_retry_that_cannot_be_requeued_counts_as_failed(smtp_server, monkeypatch):
+    metrics.reset('mail.')
+    monkeypatch.setattr(mail_dispatcher, '_put', lambda message, attempt: False)
+    mail_dispatcher._schedule_retry(_message('queue full'), 2)
+
+    assert mail_dispatcher.flush(timeout=5)
+    counters = metrics.snapshot('mail.')['counters']
+    assert counters['mail.failed'] == 1
@@ -0,0 +1,29 @@
+from datetime import datetime
+import pytest
+from services import report_service
+
+@pytest.fixture
+def uncompressed_pdf(monkeypatch):
+    # Page streams stay readable so the rendered text can be searched
+    from reportlab import rl_config
+    monkeypatch.setattr(rl_config, 'pageCompression', 0)
+
+def _transactions(count):
+    for i in range(count):
+        yield {
+            '_id': f'tx{i:06d}', 'timestamp': datetime(2026, 1, 1), 'from_account': 'N/A',
+            'to_account': 'ACC100000001', 'amount': 10.0, 'type': 'Deposit', 'description': f'row-{i:05d}',
+        }
+
+def test_pdf_includes_every_row_across_table_chunks(uncompressed_pdf):
+    count = report_service.PDF_ROWS_PER_TABLE * 3 + 5
+    pdf = report_service.generate_transaction_report_pdf(_transactions(count))
+    assert pdf.startswith(b'%PDF')
+    missing = [i for i in range(count) if f'row-{i:05d}'.encode() not in pdf]
+    assert missing == []
+
+def test_pdf_fails_if_reportlab_stops_pulling_the_story(monkeypatch):
+    # Simulates a ReportLab build loop that no longer polls len() on the story
+    monkeypatch.setattr(report_service._FlowableStream, '__len__', lambda self: 0)
+    with pytest.raises(RuntimeError):
+        report_service.generate_transaction_report_pdf(_transactions(5))
@@ -0,0 +1,117 @@
+import pytest
+from pymongo.errors import OperationFailure, PyMongoError
+from database import db_instance
+from services import metrics, transaction_runner
+from services.transaction_runner import run_transaction
+
+class ScriptedSession:
+    """A session whose commits fail with the queued errors, in order."""
+    def __init__(self, commit_errors=()):
+        self.commit_errors = list(commit_errors)
+        self.in_transaction = False
+        self.started = self.commits = self.aborts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def start_transaction(self):
+        self.started += 1
+        self.in_transaction = True
+
+    def commit_transaction(self):
+        if self.commit_errors:
+            raise self.commit_errors.pop(0)
+        self.commits += 1
+        self.in_transaction = False
+
+    def abort_transaction(self):
+        self.aborts += 1
+        self.in_transaction = False
+
+class FakeClient:
+    def __init__(self, session):
+        self.session = session
+
+    def start_session(self):
+        return self.session
+
+def labelled(label):
+    return PyMongoError('simulated', error_labels=[label])
+
+@pytest.fixture
+def session(monkeypatch):
+    session = ScriptedSession()
+    monkeypatch.setattr(db_instance, 'client', FakeClient(session))
+    monkeypatch.setattr(transaction_runner, '_backoff', lambda attempt: 0)
+    metrics.reset('transactions.test')
+    return session
+
+def failing(*errors, result='done'):
+    """A callback that raises the given errors on its first calls, then returns result."""
+    calls = []
+
+    def callback(session):
+        calls.append(session)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return callback, calls
+
+def counters():
+    return metrics.snapshot('transactions.test')['counters']
+
+def test_transient_error_retries_the_whole_callback(session):
+    callback, calls = failing(labelled('TransientTransactionError'))
+    assert run_transaction('test', callback) == 'done'
+    assert len(calls) == 2
+    assert session.aborts == 1 and session.commits == 1
+    assert counters()['transactions.test.retries'] == 1
+
+def test_write_conflict_without_label_is_retried(session):
+    callback, calls = failing(OperationFailure('WriteConflict', code=transaction_runner.WRITE_CONFLICT))
+    assert run_transaction('test', callback) == 'done'
+    assert len(calls) == 2
+    assert counters()['transactions.test.conflicts'] == 1
+
+def test_unknown_commit_result_retries_only_the_commit(session):
+    session.commit_errors = [labelled('UnknownTransactionCommitResult')] * 2
+    callback, calls = failing()
+    assert run_transaction('test', callback) == 'done'
+    assert len(calls) == 1
+    assert session.started == 1 and session.commits == 1
+    assert counters()['transactions.test.commit_retries'] == 2
+
+def test_transient_commit_error_reruns_the_callback(session):
+    session.commit_errors = [labelled('TransientTransactionError')]
+    callback, calls = failing()
+    assert run_transaction('test', callback) == 'done'
+    assert len(calls) == 2
+    assert session.started == 2 and session.commits == 1
+
+def test_other_errors_abort_and_propagate_without_retry(session):
+    callback, calls = failing(ValueError('bad input'))
+    with pytest.raises(ValueError):
+        run_transaction('test', callback)
+    assert len(calls) == 1
+    assert session.aborts == 1 and session.commits == 0
+    assert counters()['transactions.test.failures'] == 1
+    assert 'transactions.test.retries' not in counters()
+
+def test_non_retryable_commit_error_propagates(session):
+    session.commit_errors = [OperationFailure('commit failed', code=8000)]
+    callback, calls = failing()
+    with pytest.raises(OperationFailure):
+        run_transaction('test', callback)
+    assert len(calls) == 1
+    assert counters()['transactions.test.failures'] == 1
+
+def test_gives_up_after_max_attempts(session):
+    callback, calls = failing(*[labelled('TransientTransactionError')] * 5)
+    with pytest.raises(PyMongoError):
+        run_transaction('test', callback, max_attempts=3)
+    assert len(calls) == 3
+    assert session.commits == 0
+    assert counters()['transactions.test.retries'] == 2
@@ -0,0 +1,87 @@
+import pytest
+from services import transaction_service
+from services.transaction_service import TransactionAborted, debit_account
+
+@pytest.fixture
+def accounts(mongo_db):
+    mongo_db.accounts.insert_many([
+        {'account_number': 'ACC100000001', 'balance': 100.0},
+        {'account_number': 'ACC100000002', 'balance': 10.0, 'hot_shards': 2},
+    ])
+    mongo_db.balance_shards.insert_many([
+        {'account_number': 'ACC100000002', 'shard': 0, 'balance': 30.0},
+        {'account_number': 'ACC100000002', 'shard': 1, 'balance': 20.0},
+    ])
+    return mongo_db.accounts
+
+def balance(accounts, account_number):
+    return accounts.find_one({'account_number': account_number})['balance']
+
+def test_debit_subtracts_when_funds_cover_it(accounts):
+    account = debit_account(accounts, {'account_number': 'ACC100000001'}, 60.0, None)
+    assert account['account_number'] == 'ACC100000001'
+    assert balance(accounts, 'ACC100000001') == 40.0
+
+def test_debit_rejects_an_overdraft_and_leaves_the_balance(accounts):
+    with pytest.raises(TransactionAborted) as excinfo:
+        debit_account(accounts, {'account_number': 'ACC100000001'}, 100.01, None)
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.response == {'message': 'Insufficient funds'}
+    assert balance(accounts, 'ACC100000001') == 100.0
+
+def test_debit_of_missing_account_is_not_found(accounts):
+    with pytest.raises(TransactionAborted) as excinfo:
+        debit_account(accounts, {'account_number': 'ACC999999999'}, 1.0, None, not_found_message='Nope')
+    assert excinfo.value.status_code == 404
+    assert excinfo.value.response == {'message': 'Nope'}
+
+def test_hot_account_debit_counts_its_credit_shards(accounts):
+    # 10 on the account plus 50 in shards covers 60, leaving the document negative
+    debit_account(accounts, {'account_number': 'ACC100000002'}, 60.0, None)
+    assert balance(accounts, 'ACC100000002') == -50.0
+    with pytest.raises(TransactionAborted):
+        debit_account(accounts, {'account_number': 'ACC100000002'}, 0.01, None)
+    assert balance(accounts, 'ACC100000002') == -50.0
+
+@pytest.fixture
+def sender(mongo_db, accounts):
+    from bson import ObjectId
+    user_id = ObjectId()
+    mongo_db.accounts.insert_one({'user_id': user_id, 'account_number': 'ACC100000009', 'balance': 50.0})
+    return str(user_id)
+
+def test_batch_reports_each_transfer_and_applies_only_the_accepted(mongo_db, accounts, sender):
+    response, status = transaction_service.create_transfer_batch(sender, [
+        {'to_account_number': 'ACC100000001', 'amount': 20},
+        {'to_account_number': 'ACC999999999', 'amount': 5},
+        {'to_account_number': 'ACC100000001', 'amount': -1},
+        {'to_account_number': 'ACC100000001', 'amount': 40},
+        {'to_account_number': 'ACC100000001', 'amount': 30, 'description': 'Rent'},
+        'not a transfer',
+    ])
+
+    assert status == 201
+    assert [(r['index'], r['status']) for r in response['results']] == [
+        (0, 201), (1, 404), (2, 400), (3, 400), (4, 201), (5, 400),
+    ]
+    assert response['results'][3]['message'] == 'Insufficient funds'
+    assert (response['succeeded'], response['failed']) == (2, 4)
+    assert balance(accounts, 'ACC100000009') == 0.0
+    assert balance(accounts, 'ACC100000001') == 150.0
+    ledger = list(mongo_db.transactions.find({'from_account': 'ACC100000009'}, {'_id': 0, 'amount': 1, 'description': 1}))
+    assert sorted((tx['amount'], tx['description']) for tx in ledger) == [(20.0, 'Sent Money'), (30.0, 'Rent')]
+
+def test_batch_where_nothing_goes_through_is_a_400(mongo_db, accounts, sender):
+    response, status = transaction_service.create_transfer_batch(sender, [
+        {'to_account_number': 'ACC100000001', 'amount': 500},
+        {'to_account_number': 'ACC999999999', 'amount': 5},
+    ])
+    assert status == 400
+    assert (response['succeeded'], response['failed']) == (0, 2)
+    assert balance(accounts, 'ACC100000009') == 50.0
+    assert mongo_db.transactions.count_documents({}) == 0
+
+def test_batch_rejects_bad_envelopes(mongo_db, sender):
+    assert transaction_service.create_transfer_batch(sender, [])[1] == 400
+    too_many = [{'to_account_number': 'ACC100000001', 'amount': 1}] * (transaction_service.MAX_BATCH_TRANSFERS + 1)
+    assert transaction_service.create_transfer_batch(sender, too_many)[1] == 400